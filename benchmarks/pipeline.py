@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the compilation pipeline with synthetic clips, without accessing Reddit.
+
+Clips of assorted aspect ratios and durations are generated with FFmpeg's test sources and
+cached between runs. Rendering with each engine, thumbnail creation, tag extraction and payload
+dumping are timed, and the results are written to JSON so they can be compared across commits.
+"""
+
+import argparse
+from datetime import datetime
+import ffmpeg
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+from sys import stderr
+import tempfile
+from time import perf_counter
+
+from rvidmaker.editor import ENCODER_PRESETS, ENGINES, VideoCompiler
+from rvidmaker.thumbnails import create_split_thumbnail
+from rvidmaker.uploaders import Payload
+from rvidmaker.utils import extract_tags
+from rvidmaker.videos import LocalVideoRef
+
+# Directory synthetic clips are cached in between runs.
+CLIP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".clips")
+# Sizes of synthetic clips, cycled through in order.
+CLIP_SIZES = (
+    (1280, 720),
+    (720, 1280),
+    (960, 720),
+    (720, 720),
+    (1680, 720),
+)
+# Durations of synthetic clips in seconds, cycled through in order.
+CLIP_DURATIONS = (4, 7, 3, 10, 5, 6)
+# Frame rates of synthetic clips, cycled through in order.
+CLIP_FRAME_RATES = (30, 25, 60, 24)
+# Every clip at an index divisible by this has no audio.
+SILENT_EVERY = 4
+# Words synthetic titles are made of.
+TITLE_WORDS = (
+    "driver",
+    "truck",
+    "parking",
+    "highway",
+    "merge",
+    "crash",
+    "close",
+    "call",
+    "lucky",
+    "cyclist",
+    "intersection",
+    "snow",
+    "police",
+    "instant",
+    "karma",
+)
+
+
+def make_clip(i, size, duration, fps, has_audio):
+    """
+    Generates a synthetic clip, unless it is already cached.
+
+    Args:
+        i (int): Index of the clip. Used to vary its test pattern and tone.
+        size (int, int): Width and height of the clip.
+        duration (float): Duration of the clip in seconds.
+        fps (int): Frame rate of the clip.
+        has_audio (bool): Whether the clip has a audio.
+
+    Returns:
+        str: Path to the clip.
+    """
+    w, h = size
+    name = "clip-{}x{}-{}s-{}fps-{}.mp4".format(
+        w, h, duration, fps, "audio" if has_audio else "silent"
+    )
+    path = os.path.join(CLIP_DIR, name)
+    if os.path.exists(path):
+        return path
+
+    source = ("testsrc2", "smptebars", "rgbtestsrc", "mandelbrot")[i % 4]
+    streams = [
+        ffmpeg.input(
+            "{}=size={}x{}:rate={}".format(source, w, h, fps), f="lavfi", t=duration
+        ).video
+    ]
+    if has_audio:
+        tone = 220 * (1 + i % 4)
+        streams.append(
+            ffmpeg.input(
+                "sine=frequency={}:sample_rate=48000".format(tone),
+                f="lavfi",
+                t=duration,
+            ).audio
+        )
+    part_path = path + ".part.mp4"
+    ffmpeg.output(*streams, part_path, vcodec="libx264", pix_fmt="yuv420p").run(
+        quiet=True, overwrite_output=True
+    )
+    os.replace(part_path, path)
+    return path
+
+
+def make_videos(count, seed=0):
+    """
+    Generates synthetic videos with assorted sizes, durations, frame rates and titles.
+
+    Args:
+        count (int): Number of videos.
+        seed (int): Seed for generating titles, so every run uses the same titles.
+
+    Returns:
+        list: The videos as `LocalVideoRef`s.
+    """
+    if not os.path.exists(CLIP_DIR):
+        os.makedirs(CLIP_DIR)
+    rand = random.Random(seed)
+    videos = []
+    for i in range(count):
+        size = CLIP_SIZES[i % len(CLIP_SIZES)]
+        duration = CLIP_DURATIONS[i % len(CLIP_DURATIONS)]
+        fps = CLIP_FRAME_RATES[i % len(CLIP_FRAME_RATES)]
+        has_audio = i % SILENT_EVERY != 0
+        path = make_clip(i, size, duration, fps, has_audio)
+        title = " ".join(rand.sample(TITLE_WORDS, 5)).capitalize()
+        videos.append(LocalVideoRef(path, title, "user{}".format(i), duration))
+    return videos
+
+
+def time_stage(func, repeat):
+    """
+    Times a stage of the pipeline.
+
+    Args:
+        func (callable): Runs the stage once.
+        repeat (int): Number of times to run the stage.
+
+    Returns:
+        dict: Wall times of every run, and their minimum and mean, in seconds. If the stage fails,
+            the error instead.
+    """
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter()
+        try:
+            func()
+        except Exception as e:
+            return {"error": "{}: {}".format(type(e).__name__, e)}
+        runs.append(perf_counter() - start)
+    return {"runs": runs, "min": min(runs), "mean": sum(runs) / len(runs)}
+
+
+def git_commit():
+    """
+    Returns:
+        str/None: Hash of the checked out commit. None if it cannot be found.
+    """
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.decode().strip()
+
+
+def compare(old, new):
+    """
+    Prints how the timings of two benchmark results compare.
+
+    Args:
+        old (dict): Earlier results.
+        new (dict): Later results.
+    """
+    print("{:<24} {:>10} {:>10} {:>8}".format("stage", "old (s)", "new (s)", "speedup"))
+    for stage, result in new["stages"].items():
+        old_result = old["stages"].get(stage, {})
+        if "min" not in result or "min" not in old_result:
+            continue
+        print(
+            "{:<24} {:>10.3f} {:>10.3f} {:>7.2f}x".format(
+                stage,
+                old_result["min"],
+                result["min"],
+                old_result["min"] / result["min"],
+            )
+        )
+
+
+def main(
+    output_path,
+    clip_count,
+    engines,
+    res,
+    encoder,
+    repeat,
+    compare_path=None,
+):
+    videos = make_videos(clip_count)
+    results = {
+        "commit": git_commit(),
+        "date": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "clip_count": clip_count,
+        "resolution": list(res),
+        "encoder": encoder,
+        "stages": {},
+    }
+    stages = results["stages"]
+
+    # Renders download into the working directory.
+    work_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    try:
+        video_path = os.path.join(work_dir, "video.mp4")
+        for engine in engines:
+            print("Rendering with {}...".format(engine))
+
+            def render():
+                compiler = VideoCompiler(None)
+                for v in videos:
+                    compiler.add_video(v)
+                compiler.render_video(
+                    res,
+                    video_path,
+                    engine=engine,
+                    encoder=ENCODER_PRESETS[encoder],
+                )
+
+            stages["render_{}".format(engine)] = time_stage(render, repeat)
+
+        print("Creating thumbnail...")
+        thumb_path = os.path.join(work_dir, "thumbnail.png")
+
+        def thumbnail():
+            clip_path = videos[0].download(os.path.join(work_dir, "thumb-clip"))
+            create_split_thumbnail(clip_path, videos[0].title).save(thumb_path)
+            os.remove(clip_path)
+
+        stages["thumbnail"] = time_stage(thumbnail, repeat)
+
+        print("Extracting tags...")
+        tags = []
+
+        def tag():
+            tags[:] = extract_tags(videos, max_tag_len=30, max_total_chars=500)
+
+        stages["tags"] = time_stage(tag, repeat)
+
+        print("Dumping payload...")
+
+        def payload():
+            p = Payload()
+            p.video = "video.mp4"
+            p.thumb = "thumbnail.png"
+            p.title = videos[0].title
+            p.desc = "\n".join(v.title for v in videos)
+            p.tags = list(tags)
+            p.dump(os.path.join(work_dir, "payload.toml"))
+
+        stages["payload"] = time_stage(payload, repeat)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir)
+
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print('Results written to "{}"'.format(output_path))
+    for stage, result in stages.items():
+        if "error" in result:
+            print("{}: failed ({})".format(stage, result["error"]), file=stderr)
+        else:
+            print("{}: {:.3f}s".format(stage, result["min"]))
+
+    if compare_path is not None:
+        with open(compare_path) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the compilation pipeline with synthetic clips"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        default="benchmark.json",
+        help="JSON file to write results to",
+    )
+    parser.add_argument(
+        "-n",
+        "--clips",
+        type=int,
+        default=10,
+        help="number of synthetic clips to compile",
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        type=str,
+        action="append",
+        choices=ENGINES,
+        help="engine to benchmark, may be given more than once (default: all)",
+    )
+    parser.add_argument(
+        "-r",
+        "--resolution",
+        type=int,
+        nargs=2,
+        default=[1280, 720],
+        metavar=("WIDTH", "HEIGHT"),
+        help="resolution to render at",
+    )
+    parser.add_argument(
+        "--encoder",
+        type=str,
+        default="draft",
+        choices=tuple(ENCODER_PRESETS),
+        help="encoder preset to render with",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="number of times to run each stage",
+    )
+    parser.add_argument(
+        "-c",
+        "--compare",
+        type=str,
+        help="earlier results to compare against",
+    )
+    args = parser.parse_args()
+    if args.clips < 2:
+        print("Need at least 2 clips", file=stderr)
+        sys.exit(1)
+    main(
+        args.output,
+        args.clips,
+        args.engine or list(ENGINES),
+        tuple(args.resolution),
+        args.encoder,
+        max(1, args.repeat),
+        args.compare,
+    )
@@ -15,7 +15,7 @@ import toml
 from toml import TomlDecodeError
 
 
-def main(profile_path, output_dir, censor_path=None, block_path=None):
+def main(profile_path, output_dir, censor_path=None, block_path=None, preview=False):
     if not os.path.isfile(profile_path):
         print('"{}" is not a file'.format(profile_path), file=stderr)
         sys.exit(1)
@@ -46,7 +46,7 @@ def main(profile_path, output_dir, censor_path=None, block_path=None):
     try:
         print("Generating video...")
         start = datetime.now()
-        reddit.generate(output_dir)
+        reddit.generate(output_dir, preview=preview)
         elapsed = datetime.now() - start
         print("Generated in {}".format(elapsed))
     except SuiteGenerateException as e:
@@ -82,5 +82,11 @@ if __name__ == "__main__":
         type=str,
         help="file containing words and phrases to exclude from metadata",
     )
+    parser.add_argument(
+        "-p",
+        "--preview",
+        action="store_true",
+        help="quickly render a low resolution preview with shortened clips",
+    )
     args = parser.parse_args()
-    main(args.profile, args.output, args.censor, args.block)
+    main(args.profile, args.output, args.censor, args.block, args.preview)
@@ -1,3 +1,5 @@
 """Provides classes for rendering full videos"""
 
-from .videocomp import VideoCompiler
+from .encoder import ENCODER_PRESETS, EncoderSettings
+from .filtergraph import RenderException
+from .videocomp import ENGINES, VideoCompiler
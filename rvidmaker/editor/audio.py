@@ -0,0 +1,147 @@
+"""Measures the loudness of audio with FFmpeg"""
+
+from collections import namedtuple
+import ffmpeg
+import json
+import os
+import re
+from rvidmaker.sidecar import load_sidecar, store_sidecar
+
+from .ffrun import RenderException
+
+# Integrated loudness, in LUFS, that `loudnorm` normalizes audio to.
+LOUDNESS_TARGET = -16
+
+AudioStats = namedtuple(
+    "AudioStats",
+    ("peak", "integrated", "true_peak", "lra", "threshold"),
+)
+AudioStats.__doc__ = """
+Loudness of an audio track. `peak` is the linear peak sample amplitude in [0, 1]. `integrated`,
+`true_peak`, `lra` and `threshold` are the input measurements of FFmpeg's `loudnorm` filter, in
+LUFS, dBTP, LU and LUFS respectively.
+"""
+
+_MAX_VOLUME_RE = re.compile(r"max_volume:\s*(-?[0-9.]+|-inf) dB")
+
+
+def _parse_stats(stderr):
+    """
+    Parses the output of the `volumedetect` and `loudnorm` filters.
+
+    Args:
+        stderr (str): Log output of FFmpeg.
+
+    Returns:
+        AudioStats: The measurements.
+
+    Raises:
+        RenderException: If the measurements are not found.
+    """
+    match = _MAX_VOLUME_RE.search(stderr)
+    start = stderr.rfind("{")
+    end = stderr.rfind("}")
+    if match is None or start < 0 or end < start:
+        raise RenderException("FFmpeg did not report loudness measurements")
+    max_volume = match.group(1)
+    peak = 0.0 if max_volume == "-inf" else 10 ** (float(max_volume) / 20)
+    loudnorm = json.loads(stderr[start : end + 1])
+    return AudioStats(
+        peak=min(1.0, peak),
+        integrated=float(loudnorm["input_i"]),
+        true_peak=float(loudnorm["input_tp"]),
+        lra=float(loudnorm["input_lra"]),
+        threshold=float(loudnorm["input_thresh"]),
+    )
+
+
+def _measure(path):
+    """
+    Measures the loudness of a video's audio by decoding it once.
+
+    Args:
+        path (str): Path to the video.
+
+    Returns:
+        AudioStats: The measurements.
+
+    Raises:
+        RenderException: If FFmpeg fails.
+    """
+    out = (
+        ffmpeg.input(path)
+        .audio.filter("volumedetect")
+        .filter("loudnorm", i=LOUDNESS_TARGET, print_format="json")
+        .output("-", f="null")
+    )
+    try:
+        _, stderr = out.run(capture_stdout=True, capture_stderr=True)
+    except ffmpeg.Error as e:
+        stderr = e.stderr.decode(errors="replace") if e.stderr else ""
+        raise RenderException(
+            'Failed to measure loudness of "{}": {}'.format(path, stderr[-1000:])
+        )
+    return _parse_stats(stderr.decode(errors="replace"))
+
+
+def analyze_audio(path, cache_path=None):
+    """
+    Measures the loudness of a video's audio. Measurements are cached in a file, so each video
+    is only analyzed once.
+
+    Args:
+        path (str): Path to the video. Must have an audio stream.
+        cache_path (str): Path to cache the measurements at. None to cache them next to the
+            video.
+
+    Returns:
+        AudioStats: The measurements.
+
+    Raises:
+        RenderException: If FFmpeg fails.
+    """
+    if cache_path is None:
+        cache_path = path + ".loudness.json"
+    size = os.path.getsize(path)
+    stats = load_sidecar(cache_path, size, AudioStats)
+    if stats is None:
+        stats = _measure(path)
+        store_sidecar(cache_path, size, stats)
+    return stats
+
+
+def gain_for_level(stats, audio_level):
+    """
+    Gets the gain that brings audio's peak to a level.
+
+    Args:
+        stats (AudioStats): Loudness of the audio.
+        audio_level (float): Level to bring the peak to, (0, 1].
+
+    Returns:
+        float: Amount to multiply the audio by. 1 for silent audio.
+    """
+    if stats.peak <= 0:
+        return 1.0
+    return audio_level / stats.peak
+
+
+def loudnorm_args(stats):
+    """
+    Gets arguments for a second pass of FFmpeg's `loudnorm` filter. With the measurements from a
+    first pass, `loudnorm` normalizes audio with a single linear gain where possible.
+
+    Args:
+        stats (AudioStats): Loudness of the audio.
+
+    Returns:
+        dict: Keyword arguments for the `loudnorm` filter.
+    """
+    return {
+        "i": LOUDNESS_TARGET,
+        "measured_i": stats.integrated,
+        "measured_tp": stats.true_peak,
+        "measured_lra": stats.lra,
+        "measured_thresh": stats.threshold,
+        "linear": "true",
+    }
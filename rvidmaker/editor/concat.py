@@ -0,0 +1,268 @@
+"""Concatenates videos with FFmpeg"""
+
+from collections import Counter, namedtuple
+import ffmpeg
+import os
+import tempfile
+
+from .ffrun import RenderException, run_ffmpeg
+from .filtergraph import DEFAULT_FPS, encode_args
+
+# Codecs that `encode_args` encodes video and audio with, as reported by ffprobe.
+_ENCODED_CODECS = ("h264", "aac")
+# x264 profiles for H.264 profiles as reported by ffprobe.
+_X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+StreamParams = namedtuple(
+    "StreamParams",
+    (
+        "vcodec",
+        "profile",
+        "level",
+        "width",
+        "height",
+        "pix_fmt",
+        "frame_rate",
+        "time_base",
+        "acodec",
+        "sample_rate",
+        "channel_layout",
+    ),
+)
+StreamParams.__doc__ = """
+Codec parameters that must match for videos to be concatenated without re-encoding. The
+profile and level are compared since players may not decode videos whose profile or level
+changes partway through. Audio parameters are `None` for videos without audio.
+"""
+
+
+def stream_params(path):
+    """
+    Reads the codec parameters of a video with ffprobe.
+
+    Args:
+        path (str): Path to the video.
+
+    Returns:
+        (StreamParams, float): Parameters of the first video and audio streams, and the duration
+            of the video in seconds.
+
+    Raises:
+        RenderException: If the video cannot be probed or has no video stream.
+    """
+    try:
+        info = ffmpeg.probe(path)
+    except ffmpeg.Error as e:
+        raise RenderException('Failed to probe "{}": {}'.format(path, e))
+    video = None
+    audio = None
+    for stream in info["streams"]:
+        if stream["codec_type"] == "video" and video is None:
+            video = stream
+        elif stream["codec_type"] == "audio" and audio is None:
+            audio = stream
+    if video is None:
+        raise RenderException('"{}" has no video stream'.format(path))
+    if audio is None:
+        audio = {}
+    params = StreamParams(
+        vcodec=video["codec_name"],
+        profile=video.get("profile"),
+        level=video.get("level"),
+        width=int(video["width"]),
+        height=int(video["height"]),
+        pix_fmt=video.get("pix_fmt"),
+        frame_rate=video["r_frame_rate"],
+        time_base=video["time_base"],
+        acodec=audio.get("codec_name"),
+        sample_rate=audio.get("sample_rate"),
+        channel_layout=audio.get("channel_layout"),
+    )
+    duration = float(info["format"].get("duration") or video["duration"])
+    return params, duration
+
+
+def _list_file(paths, temp_dir):
+    """
+    Writes a playlist for FFmpeg's concat demuxer.
+
+    Args:
+        paths (list): Paths of the videos to list, in order.
+        temp_dir (str): Directory to write the playlist in.
+
+    Returns:
+        str: Path to the playlist.
+    """
+    fd, list_path = tempfile.mkstemp(suffix=".txt", dir=temp_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for path in paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write("file '{}'\n".format(escaped))
+    return list_path
+
+
+def concat_copy(paths, output_path, temp_dir):
+    """
+    Concatenates videos without re-encoding them. All videos must share the same codecs,
+    resolution, time base and audio layout.
+
+    Args:
+        paths (list): Paths of the videos to concatenate, in order.
+        output_path (str): Path to write the video to.
+        temp_dir (str): Directory to write temporary files to.
+
+    Raises:
+        RenderException: If FFmpeg fails.
+    """
+    list_path = _list_file(paths, temp_dir)
+    out = ffmpeg.input(list_path, f="concat", safe=0).output(
+        output_path, c="copy", movflags="+faststart"
+    )
+    try:
+        run_ffmpeg(out, output_path, "concatenate videos")
+    finally:
+        os.remove(list_path)
+
+
+def _target_params(all_params, fps):
+    """
+    Chooses the parameters to concatenate videos with. This is the most common set of parameters
+    that can be reproduced by re-encoding, so that as few videos as possible are re-encoded.
+
+    Args:
+        all_params (list): `StreamParams` of every video.
+        fps (int): Frame rate to use if no video can be reproduced by re-encoding.
+
+    Returns:
+        StreamParams: Parameters every video must match.
+    """
+    has_audio = any(p.acodec is not None for p in all_params)
+    counts = Counter(
+        p
+        for p in all_params
+        if p.vcodec == _ENCODED_CODECS[0]
+        and p.acodec == (_ENCODED_CODECS[1] if has_audio else None)
+    )
+    if counts:
+        return counts.most_common(1)[0][0]
+
+    # No video can be matched by re-encoding, so all of them are re-encoded.
+    first = all_params[0]
+    return first._replace(
+        vcodec=_ENCODED_CODECS[0],
+        profile=None,
+        level=None,
+        pix_fmt="yuv420p",
+        frame_rate="{}/1".format(fps),
+        time_base=None,
+        acodec=_ENCODED_CODECS[1] if has_audio else None,
+        sample_rate=None,
+        channel_layout=None,
+    )
+
+
+def _conform(path, has_audio, duration, params, output_path, encoder=None):
+    """
+    Re-encodes a video to match a set of parameters.
+
+    Args:
+        path (str): Path of the video to re-encode.
+        has_audio (bool): Whether the video has an audio stream.
+        duration (float): Duration of the video in seconds.
+        params (StreamParams): Parameters to match. `None` parameters are left to FFmpeg.
+        output_path (str): Path to write the video to.
+        encoder (EncoderSettings): How to encode video. None for x264's defaults.
+
+    Raises:
+        RenderException: If FFmpeg fails.
+    """
+    w, h = params.width, params.height
+    clip = ffmpeg.input(path)
+    video = (
+        clip.video.filter("scale", w, h, force_original_aspect_ratio="decrease")
+        .filter("pad", w, h, "(ow-iw)/2", "(oh-ih)/2")
+        .filter("setsar", 1)
+        .filter("fps", fps=params.frame_rate)
+    )
+    if params.pix_fmt is not None:
+        video = video.filter("format", params.pix_fmt)
+    streams = [video]
+
+    args = encode_args(params.frame_rate, encoder)
+    if params.profile in _X264_PROFILES:
+        args["profile:v"] = _X264_PROFILES[params.profile]
+    if params.level is not None and params.level > 0:
+        # ffprobe reports levels multiplied by 10.
+        args["level"] = "{:.1f}".format(params.level / 10)
+    if params.time_base is not None:
+        args["video_track_timescale"] = int(params.time_base.split("/")[1])
+    if params.acodec is not None:
+        if has_audio:
+            audio = clip.audio
+        else:
+            audio = ffmpeg.input("anullsrc", f="lavfi", t=duration).audio
+        if params.sample_rate is not None:
+            audio = audio.filter("aresample", params.sample_rate)
+            args["ar"] = params.sample_rate
+        if params.channel_layout is not None:
+            audio = audio.filter("aformat", channel_layouts=params.channel_layout)
+            args.pop("ac")
+        audio = audio.filter("apad", whole_dur=duration).filter(
+            "atrim", duration=duration
+        )
+        streams.append(audio)
+    else:
+        for key in ("acodec", "ar", "ac"):
+            args.pop(key)
+
+    out = ffmpeg.output(*streams, output_path, **args)
+    run_ffmpeg(out, output_path, "re-encode video")
+
+
+def concat_videos(paths, output_path, temp_dir, fps=DEFAULT_FPS, encoder=None):
+    """
+    Concatenates videos, re-encoding as few of them as possible. Videos that share codecs,
+    resolution, time base and audio layout with most of the other videos are copied as-is, and
+    only the rest are re-encoded to match.
+
+    Args:
+        paths (list): Paths of the videos to concatenate, in order.
+        output_path (str): Path to write the video to.
+        temp_dir (str): Directory to write temporary files to.
+        fps (int): Frame rate to use if every video needs to be re-encoded.
+        encoder (EncoderSettings): How to encode re-encoded videos. None for x264's defaults.
+
+    Returns:
+        int: Number of videos that were re-encoded.
+
+    Raises:
+        RenderException: If a video cannot be probed or FFmpeg fails.
+    """
+    probed = [stream_params(path) for path in paths]
+    target = _target_params([params for params, _ in probed], fps)
+
+    copy_paths = []
+    conformed_paths = []
+    try:
+        for i, (path, (params, duration)) in enumerate(zip(paths, probed)):
+            if params == target:
+                copy_paths.append(path)
+                continue
+            conformed_path = os.path.join(temp_dir, "conformed{:04d}.mp4".format(i))
+            has_audio = params.acodec is not None
+            _conform(path, has_audio, duration, target, conformed_path, encoder)
+            copy_paths.append(conformed_path)
+            conformed_paths.append(conformed_path)
+        concat_copy(copy_paths, output_path, temp_dir)
+    finally:
+        for path in conformed_paths:
+            os.remove(path)
+    return len(conformed_paths)
@@ -0,0 +1,187 @@
+"""Configures how rendered videos are encoded"""
+
+# Presets of the x264 encoder, from fastest to smallest output.
+X264_PRESETS = (
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+)
+# Tunings of the x264 encoder.
+X264_TUNES = (
+    "film",
+    "animation",
+    "grain",
+    "stillimage",
+    "fastdecode",
+    "zerolatency",
+)
+# Largest constant rate factor of the x264 encoder. Larger values give lower quality.
+MAX_CRF = 51
+
+
+class EncoderSettings:
+    """
+    Settings for encoding video with x264. Quality is set with a constant rate factor (CRF),
+    optionally capped to a maximum bitrate so that busy scenes do not blow up the file size.
+
+    Attributes:
+        preset (str): x264 preset. Slower presets produce smaller files at the same quality.
+        crf (float): Constant rate factor, [0, `MAX_CRF`]. Lower values give higher quality.
+        tune (str): x264 tuning. None for no tuning.
+        max_bitrate (int): Maximum video bitrate in kbit/s. None for no cap.
+        buffer_size (int): Size of the buffer the maximum bitrate is enforced over in kbit.
+        gop (int): Maximum number of frames between keyframes. None to let x264 decide.
+    """
+
+    def __init__(
+        self,
+        preset="medium",
+        crf=23,
+        tune=None,
+        max_bitrate=None,
+        buffer_size=None,
+        gop=None,
+    ):
+        """
+        Args:
+            preset (str): x264 preset. One of `X264_PRESETS`.
+            crf (float): Constant rate factor, [0, `MAX_CRF`]. Lower values give higher quality.
+            tune (str): x264 tuning. One of `X264_TUNES`, or None for no tuning.
+            max_bitrate (int): Maximum video bitrate in kbit/s. None for no cap.
+            buffer_size (int): Size of the buffer the maximum bitrate is enforced over in kbit.
+                None to use twice the maximum bitrate. Ignored if there is no maximum bitrate.
+            gop (int): Maximum number of frames between keyframes. None to let x264 decide.
+
+        Raises:
+            ValueError: If a setting is invalid.
+        """
+        if preset not in X264_PRESETS:
+            raise ValueError("preset must be one of {}".format(X264_PRESETS))
+        if not 0 <= crf <= MAX_CRF:
+            raise ValueError("crf must be between 0 and {}".format(MAX_CRF))
+        if tune is not None and tune not in X264_TUNES:
+            raise ValueError("tune must be one of {}".format(X264_TUNES))
+        if max_bitrate is not None and max_bitrate <= 0:
+            raise ValueError("max_bitrate must be positive")
+        if buffer_size is not None and buffer_size <= 0:
+            raise ValueError("buffer_size must be positive")
+        if gop is not None and gop <= 0:
+            raise ValueError("gop must be positive")
+        if max_bitrate is None:
+            buffer_size = None
+        elif buffer_size is None:
+            buffer_size = max_bitrate * 2
+        self._preset = preset
+        self._crf = crf
+        self._tune = tune
+        self._max_bitrate = max_bitrate
+        self._buffer_size = buffer_size
+        self._gop = gop
+
+    @property
+    def preset(self):
+        return self._preset
+
+    @property
+    def crf(self):
+        return self._crf
+
+    @property
+    def tune(self):
+        return self._tune
+
+    @property
+    def max_bitrate(self):
+        return self._max_bitrate
+
+    @property
+    def buffer_size(self):
+        return self._buffer_size
+
+    @property
+    def gop(self):
+        return self._gop
+
+    def _fields(self):
+        return {
+            "preset": self._preset,
+            "crf": self._crf,
+            "tune": self._tune,
+            "max_bitrate": self._max_bitrate,
+            "buffer_size": self._buffer_size,
+            "gop": self._gop,
+        }
+
+    def replace(self, **kwargs):
+        """
+        Copies the settings, changing some of them.
+
+        Args:
+            **kwargs: Settings to change, as accepted by `EncoderSettings`.
+
+        Returns:
+            EncoderSettings: The new settings.
+
+        Raises:
+            ValueError: If a setting is invalid.
+        """
+        settings = self._fields()
+        if "max_bitrate" in kwargs and "buffer_size" not in kwargs:
+            # Derive the buffer from the new bitrate.
+            settings["buffer_size"] = None
+        settings.update(kwargs)
+        return EncoderSettings(**settings)
+
+    def ffmpeg_args(self):
+        """
+        Returns:
+            dict: Output arguments for ffmpeg-python that apply the settings.
+        """
+        args = {"preset": self._preset, "crf": self._crf}
+        if self._tune is not None:
+            args["tune"] = self._tune
+        if self._max_bitrate is not None:
+            args["maxrate"] = "{}k".format(self._max_bitrate)
+            args["bufsize"] = "{}k".format(self._buffer_size)
+        if self._gop is not None:
+            args["g"] = self._gop
+        return args
+
+    def ffmpeg_params(self):
+        """
+        Returns:
+            list: Command line arguments for FFmpeg that apply the settings, except for the
+                preset. Intended for Moviepy, which sets the preset itself.
+        """
+        params = []
+        for key, value in self.ffmpeg_args().items():
+            if key != "preset":
+                params.extend(("-{}".format(key), str(value)))
+        return params
+
+    def __eq__(self, other):
+        return isinstance(other, EncoderSettings) and self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(tuple(self._fields().items()))
+
+    def __repr__(self):
+        return "EncoderSettings({})".format(
+            ", ".join("{}={!r}".format(k, v) for k, v in self._fields().items())
+        )
+
+
+# x264's defaults, balancing encoding speed and quality.
+DEFAULT = EncoderSettings()
+# Fast encode with low quality, for reviewing compilations before the final render.
+DRAFT = EncoderSettings(preset="ultrafast", crf=28)
+# Slow encode with high quality and small files, for uploading.
+FINAL = EncoderSettings(preset="slow", crf=20, max_bitrate=12000)
+# Named encoder settings that can be selected in profiles.
+ENCODER_PRESETS = {"default": DEFAULT, "draft": DRAFT, "final": FINAL}
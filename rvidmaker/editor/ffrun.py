@@ -0,0 +1,31 @@
+"""Runs FFmpeg commands"""
+
+import ffmpeg
+import os
+
+
+class RenderException(Exception):
+    """Raised when rendering a video with FFmpeg fails"""
+
+
+def run_ffmpeg(out, output_path, action):
+    """
+    Runs FFmpeg and removes any partially written output if it fails.
+
+    Args:
+        out (ffmpeg.nodes.OutputStream): Output to run.
+        output_path (str): Path the output is written to.
+        action (str): What FFmpeg is doing, used in error messages (e.g. "render video").
+
+    Raises:
+        RenderException: If FFmpeg fails.
+    """
+    try:
+        out.run(quiet=True, overwrite_output=True)
+    except ffmpeg.Error as e:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        stderr = e.stderr.decode(errors="replace") if e.stderr else ""
+        raise RenderException(
+            "Failed to {} with FFmpeg: {}".format(action, stderr[-1000:])
+        )
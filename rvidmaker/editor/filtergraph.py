@@ -0,0 +1,259 @@
+"""Renders compilations in a single pass with an FFmpeg filtergraph"""
+
+import ffmpeg
+
+from rvidmaker.videos.probe import probe, ProbeException
+from .audio import analyze_audio, loudnorm_args
+from .encoder import EncoderSettings
+from .ffrun import RenderException, run_ffmpeg
+from .overlay import overlay_path
+
+# Frame rate of rendered compilations.
+DEFAULT_FPS = 30
+# Sample rate of the audio in rendered compilations.
+SAMPLE_RATE = 44100
+# Time scale of the video track of rendered files. Intermediate clips must share a time scale to
+# be concatenated without re-encoding.
+VIDEO_TIMESCALE = 90000
+# Clips scaled to within this many pixels of the full resolution are padded instead of being
+# placed on a blurred background.
+FILL_TOLERANCE = 2
+
+
+def encode_args(fps, encoder=None):
+    """
+    Args:
+        fps (int): Frame rate to encode at.
+        encoder (EncoderSettings): How to encode video. None for x264's defaults.
+
+    Returns:
+        dict: Output arguments that encode video and audio the same way for every render.
+    """
+    if encoder is None:
+        encoder = EncoderSettings()
+    args = {
+        "vcodec": "libx264",
+        "pix_fmt": "yuv420p",
+        "r": fps,
+        "video_track_timescale": VIDEO_TIMESCALE,
+        "acodec": "aac",
+        "ar": SAMPLE_RATE,
+        "ac": 2,
+        "movflags": "+faststart",
+    }
+    args.update(encoder.ffmpeg_args())
+    return args
+
+
+def fit_size(size, res):
+    """
+    Scales a size to fit within a resolution while keeping its aspect ratio.
+
+    Args:
+        size (int, int): Width and height to scale.
+        res (int, int): Width and height to fit within.
+
+    Returns:
+        (int, int): Scaled width and height, rounded to even numbers.
+    """
+    cw, ch = size
+    w, h = res
+    size_mult = min(w / cw, h / ch)
+    fw = min(w, int(round(cw * size_mult / 2)) * 2)
+    fh = min(h, int(round(ch * size_mult / 2)) * 2)
+    return fw, fh
+
+
+def clip_streams(
+    path,
+    res,
+    title,
+    author,
+    temp_dir,
+    audio_level=0.7,
+    bg_color=(0, 0, 0),
+    fps=DEFAULT_FPS,
+    audio_cache_path=None,
+    max_duration=None,
+    info=None,
+):
+    """
+    Builds the filters for a single clip of a compilation. The clip is scaled to fit the
+    resolution, placed on a blurred copy of itself if it does not fill the screen, and has its
+    title and author drawn on top. Its audio is normalized with two-pass `loudnorm`, using
+    cached measurements when possible, and converted to stereo.
+
+    Args:
+        path (str): Path to the clip.
+        res (int, int): Width and height of the compilation.
+        title (str): Title to draw on the clip.
+        author (str): Author to draw on the clip.
+        temp_dir (str): Directory for files the filters read from while rendering. Overlays
+            already rendered to it are reused.
+        audio_level (float): Audio level to normalize the clip around, (0, 1].
+        bg_color (int, int, int): Color of padding as RGB, [0, 255].
+        fps (int): Frame rate of the compilation.
+        audio_cache_path (str): Path to cache the clip's loudness measurements at. None to cache
+            them next to the clip.
+        max_duration (float): Maximum duration of the clip in seconds. Longer clips are cut
+            short. None to use the whole clip.
+        info (rvidmaker.videos.ProbeInfo): Stream information of the clip. None to probe it.
+
+    Returns:
+        (ffmpeg.Stream, ffmpeg.Stream, float): Video stream, audio stream and duration of the
+            clip in seconds.
+
+    Raises:
+        RenderException: If the clip cannot be probed or its loudness cannot be measured.
+    """
+    w, h = res
+    if info is None:
+        try:
+            info = probe(path)
+        except ProbeException as e:
+            raise RenderException(str(e))
+    duration = info.duration
+    fw, fh = fit_size(info.size, res)
+    input_args = {}
+    if max_duration is not None and duration > max_duration:
+        duration = max_duration
+        input_args["t"] = duration
+    clip = ffmpeg.input(path, **input_args)
+
+    video = clip.video.filter("fps", fps=fps)
+    if w - fw <= FILL_TOLERANCE and h - fh <= FILL_TOLERANCE:
+        color = "0x{:02x}{:02x}{:02x}".format(*bg_color)
+        video = video.filter("scale", fw, fh).filter(
+            "pad", w, h, (w - fw) // 2, (h - fh) // 2, color=color
+        )
+    else:
+        # If the video does not fill the screen, add a blurred copy of it as the background.
+        # This intends to make the video more visually interesting.
+        split = video.split()
+        radius = min(w, h) // 20
+        bg = (
+            split[1]
+            .filter("scale", w, h, force_original_aspect_ratio="increase")
+            .filter("crop", w, h)
+            .filter(
+                "boxblur",
+                luma_radius=radius,
+                luma_power=1,
+                chroma_radius=radius // 2,
+                chroma_power=1,
+            )
+        )
+        fg = split[0].filter("scale", fw, fh)
+        video = ffmpeg.overlay(bg, fg, x=(w - fw) // 2, y=(h - fh) // 2)
+    video = video.filter("setsar", 1)
+
+    # Add text. The text is rendered to an image once rather than drawn on every frame.
+    text = ffmpeg.input(overlay_path(title, author, temp_dir))
+    video = ffmpeg.overlay(video, text, x=0, y=0).filter("format", "yuv420p")
+
+    if info.has_audio:
+        audio = clip.audio
+        stats = analyze_audio(path, audio_cache_path)
+        if stats.peak > 0:
+            audio = audio.filter("loudnorm", **loudnorm_args(stats))
+        audio = audio.filter("volume", audio_level)
+    else:
+        audio = ffmpeg.input(
+            "anullsrc=r={}:cl=stereo".format(SAMPLE_RATE), f="lavfi", t=duration
+        ).audio
+    audio = audio.filter("aresample", SAMPLE_RATE).filter(
+        "aformat", sample_fmts="fltp", channel_layouts="stereo"
+    )
+
+    return video, audio, duration
+
+
+def render_single_pass(streams, output_path, fps=DEFAULT_FPS, encoder=None):
+    """
+    Concatenates clips and encodes them with a single FFmpeg process.
+
+    Args:
+        streams (list): Video and audio stream pairs as `(ffmpeg.Stream, ffmpeg.Stream)`,
+            in the order they are played.
+        output_path (str): Path to write the video to.
+        fps (int): Frame rate of the compilation.
+        encoder (EncoderSettings): How to encode video. None for x264's defaults.
+
+    Raises:
+        RenderException: If FFmpeg fails.
+    """
+    concat_inputs = []
+    for video, audio in streams:
+        concat_inputs.extend((video, audio))
+    joined = ffmpeg.concat(*concat_inputs, v=1, a=1).node
+    out = ffmpeg.output(joined[0], joined[1], output_path, **encode_args(fps, encoder))
+    run_ffmpeg(out, output_path, "render video")
+
+
+def prerender_clip(
+    path,
+    output_path,
+    res,
+    title,
+    author,
+    temp_dir,
+    audio_level=0.7,
+    bg_color=(0, 0, 0),
+    fps=DEFAULT_FPS,
+    threads=0,
+    audio_cache_path=None,
+    encoder=None,
+    max_duration=None,
+    info=None,
+):
+    """
+    Renders a single clip to an intermediate file. Every intermediate file shares the same
+    resolution, frame rate, pixel format, time scale, and audio codec and sample rate, so they can
+    be concatenated without re-encoding. Intended to be run in a separate process.
+
+    Args:
+        path (str): Path to the clip.
+        output_path (str): Path to write the intermediate file to.
+        res (int, int): Width and height of the compilation.
+        title (str): Title to draw on the clip.
+        author (str): Author to draw on the clip.
+        temp_dir (str): Directory for files the filters read from while rendering.
+        audio_level (float): Audio level to normalize the clip around, (0, 1].
+        bg_color (int, int, int): Color of padding as RGB, [0, 255].
+        fps (int): Frame rate of the compilation.
+        threads (int): Number of threads FFmpeg may use. 0 to let FFmpeg decide.
+        audio_cache_path (str): Path to cache the clip's loudness measurements at. None to cache
+            them next to the clip.
+        encoder (EncoderSettings): How to encode video. Must be the same for every clip of a
+            compilation. None for x264's defaults.
+        max_duration (float): Maximum duration of the clip in seconds. Longer clips are cut
+            short. None to use the whole clip.
+        info (rvidmaker.videos.ProbeInfo): Stream information of the clip. None to probe it.
+
+    Returns:
+        float: Duration of the clip in seconds.
+
+    Raises:
+        RenderException: If FFmpeg fails.
+    """
+    video, audio, duration = clip_streams(
+        path,
+        res,
+        title,
+        author,
+        temp_dir,
+        audio_level=audio_level,
+        bg_color=bg_color,
+        fps=fps,
+        audio_cache_path=audio_cache_path,
+        max_duration=max_duration,
+        info=info,
+    )
+    # Pad or cut the audio to the length of the clip. Otherwise audio and video drift apart once
+    # intermediate files are concatenated.
+    audio = audio.filter("apad", whole_dur=duration).filter("atrim", duration=duration)
+    out = ffmpeg.output(
+        video, audio, output_path, threads=threads, **encode_args(fps, encoder)
+    )
+    run_ffmpeg(out, output_path, "render clip")
+    return duration
@@ -0,0 +1,122 @@
+"""Renders the title and author drawn on top of each clip of a compilation"""
+
+from functools import lru_cache
+import hashlib
+import json
+import os
+from PIL import Image, ImageDraw, ImageFont
+import sys
+import tempfile
+
+# TrueType font the title and author are drawn with.
+FONT = "IBMPlexSans-Regular.ttf"
+# Font size of the title in pixels.
+TITLE_SIZE = 60
+# Font size of the author in pixels.
+AUTHOR_SIZE = 40
+# Maximum number of rendered overlays kept in memory.
+_CACHE_SIZE = 64
+
+
+@lru_cache(maxsize=None)
+def _load_font(font, size):
+    """
+    Returns:
+        PIL.ImageFont: The font at a size. Pillow's default font if the font cannot be found.
+    """
+    try:
+        return ImageFont.truetype(font, size=size)
+    except OSError:
+        print(
+            'WARNING: Font "{}" not found, using default font'.format(font),
+            file=sys.stderr,
+        )
+        return ImageFont.load_default()
+
+
+def _text_size(font, text):
+    """
+    Returns:
+        (int, int): Width and height of the area text covers when drawn at the origin, including
+            the font's offsets.
+    """
+    if hasattr(font, "getbbox"):
+        _, _, right, bottom = font.getbbox(text)
+        return right, bottom
+    # Bitmap fonts, such as Pillow's default font, only have `getbbox` since Pillow 9.2.
+    return font.getsize(text)
+
+
+@lru_cache(maxsize=_CACHE_SIZE)
+def render_overlay(
+    title, author, font=FONT, title_size=TITLE_SIZE, author_size=AUTHOR_SIZE
+):
+    """
+    Renders the title, its shadow and the author of a clip into a single image. Overlays are
+    cached, so rendering the same text again is free.
+
+    Args:
+        title (str): Title to draw.
+        author (str): Author to draw. None to only draw the title.
+        font (str): TrueType font to draw with.
+        title_size (int): Font size of the title in pixels.
+        author_size (int): Font size of the author in pixels.
+
+    Returns:
+        PIL.Image: Transparent RGBA image to place on the top-left corner of the clip. The image
+            is shared between callers and must not be modified.
+    """
+    layers = [
+        # Shadow of the title.
+        (title, title_size, (0, 0, 0), (12, 12)),
+        (title, title_size, (255, 255, 255), (10, 10)),
+    ]
+    if author is not None:
+        layers.append(("u/{}".format(author), author_size, (190, 190, 190), (40, 75)))
+    w, h = 1, 1
+    for text, size, _, (x, y) in layers:
+        tw, th = _text_size(_load_font(font, size), text)
+        w = max(w, x + tw)
+        h = max(h, y + th)
+
+    img = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for text, size, color, pos in layers:
+        draw.text(pos, text, font=_load_font(font, size), fill=color)
+    return img
+
+
+def overlay_path(
+    title,
+    author,
+    cache_dir,
+    font=FONT,
+    title_size=TITLE_SIZE,
+    author_size=AUTHOR_SIZE,
+):
+    """
+    Gets an overlay as a PNG file, rendering it only if the same overlay is not already in the
+    directory. Safe to call from multiple processes at once.
+
+    Args:
+        title (str): Title to draw.
+        author (str): Author to draw. None to only draw the title.
+        cache_dir (str): Directory to store overlays in.
+        font (str): TrueType font to draw with.
+        title_size (int): Font size of the title in pixels.
+        author_size (int): Font size of the author in pixels.
+
+    Returns:
+        str: Path to the overlay. See `render_overlay`.
+    """
+    key = json.dumps([title, author, font, title_size, author_size])
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    path = os.path.join(cache_dir, "overlay-{}.png".format(digest))
+    if not os.path.exists(path):
+        img = render_overlay(title, author, font, title_size, author_size)
+        # Write to a temporary file first so other processes never read a partial image.
+        fd, temp_path = tempfile.mkstemp(suffix=".png", dir=cache_dir)
+        with os.fdopen(fd, "wb") as f:
+            img.save(f, format="PNG")
+        os.replace(temp_path, path)
+    return path
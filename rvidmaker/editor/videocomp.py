@@ -1,18 +1,44 @@
 """Creates a compilation of video clips"""
 
 from bisect import insort
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from glob import glob
+import hashlib
+from itertools import islice
+import json
 from moviepy.editor import (
     afx,
+    AudioClip,
+    CompositeAudioClip,
     CompositeVideoClip,
-    concatenate_videoclips,
-    TextClip,
+    ImageClip,
     VideoFileClip,
 )
 import multiprocessing
+import numpy as np
 import os
-from rvidmaker.videos import DownloadException
+from rvidmaker.instrument import record_file, Recorder, timed_call
+from rvidmaker.videos import DownloadException, ProbeException
+from .audio import analyze_audio, gain_for_level
+from .concat import concat_videos, stream_params
+from .encoder import DRAFT, EncoderSettings
+from .filtergraph import (
+    clip_streams,
+    DEFAULT_FPS,
+    fit_size,
+    prerender_clip,
+    render_single_pass,
+    RenderException,
+    SAMPLE_RATE,
+    VIDEO_TIMESCALE,
+)
+from .overlay import render_overlay
 from shutil import rmtree
 import sys
 import tempfile
@@ -20,12 +46,116 @@ from time import time_ns
 
 # Temporary directory for storing downloaded videos.
 _DOWNLOAD_DIR = ".downloaded"
+# Name of the cached loudness measurements of a video.
+_LOUDNESS_SIDECAR = "loudness.json"
+# Name of the cached stream information of a video.
+_PROBE_SIDECAR = "probe.json"
+# Height of preview renders in pixels.
+PREVIEW_HEIGHT = 480
+# Frame rate of preview renders.
+PREVIEW_FPS = 15
+# Maximum duration of each clip in preview renders in seconds.
+PREVIEW_CLIP_DURATION = 5
+# Engines `VideoCompiler.render_video` can render compilations with.
+ENGINES = ("moviepy", "filtergraph", "prerender")
 
 
 class NotEnoughVideos(Exception):
     """Raised when there are not enough videos for a compilation"""
 
 
+def _fit_audio(audio, duration):
+    """
+    Fits the audio of a clip to the duration of its video, as `filtergraph.prerender_clip` does,
+    so intermediate files stay in sync once they are concatenated.
+
+    Args:
+        audio (AudioClip): Audio of the clip. None if the clip is silent.
+        duration (float): Duration of the clip's video in seconds.
+
+    Returns:
+        AudioClip: The audio, trimmed to `duration` or padded to it with silence. Silence if the
+            clip is silent, so every intermediate file has an audio stream.
+    """
+    if audio is None:
+        return AudioClip(
+            lambda t: np.zeros((len(t), 2) if isinstance(t, np.ndarray) else 2),
+            duration=duration,
+            fps=SAMPLE_RATE,
+        )
+    # Composite clips are silent wherever the clips in them are not playing.
+    return CompositeAudioClip([audio]).set_duration(duration)
+
+
+def _prune_clips(work_dir, keep, max_bytes):
+    """
+    Deletes the least recently used clips in a work directory until it fits within a maximum
+    size.
+
+    Args:
+        work_dir (str): Directory rendered clips are kept in.
+        keep (list): Paths to clips to never delete.
+        max_bytes (int): Maximum total size of the clips in bytes.
+    """
+    keep = set(os.path.abspath(path) for path in keep)
+    entries = []
+    for entry in os.scandir(work_dir):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        if os.path.abspath(path) in keep:
+            continue
+        os.remove(path)
+        total -= size
+
+
+def _process_pool(max_workers):
+    """
+    Creates a pool of processes that can be used while download threads are running. Workers
+    forked from a process with other threads can inherit locks those threads hold and deadlock,
+    so workers are started from a fresh process instead where supported.
+
+    Args:
+        max_workers (int): Maximum number of processes.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    if sys.version_info < (3, 7):
+        # Start methods cannot be chosen per pool, so start every worker before any download
+        # threads exist.
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+        pool.submit(int).result()
+        return pool
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
+
+
+def preview_resolution(res):
+    """
+    Scales a resolution down for preview renders.
+
+    Args:
+        res (int, int): Width and height of the full render.
+
+    Returns:
+        (int, int): Width and height of the preview, at most `PREVIEW_HEIGHT` pixels tall with
+            the same aspect ratio.
+    """
+    w, h = res
+    if h <= PREVIEW_HEIGHT:
+        return res
+    return fit_size(res, (w, PREVIEW_HEIGHT))
+
+
 class ManifestEntry:
     """Store the timestamp where a video is start playing in a compilation"""
 
@@ -96,14 +226,21 @@ class VideoCompiler:
         video_count (int): Number of videos added by `add_video`, ready to be compiled.
     """
 
-    def __init__(self, censor):
+    def __init__(self, censor, cache=None, recorder=None):
         """
         Args:
             censor (better_profanity.Profanity): Used to censor undesirable words in rendered text.
                 None to not censor words.
+            cache (rvidmaker.videos.DownloadCache): Cache to download videos through. None to
+                always download videos.
+            recorder (rvidmaker.instrument.Recorder): Records the time and resources used to
+                download and render each clip. Clips are identified by the order they were
+                added in. None to not record them.
         """
         self._videos = []
         self._censor = censor
+        self._cache = cache
+        self._recorder = Recorder() if recorder is None else recorder
 
     def add_video(self, video):
         """
@@ -119,13 +256,15 @@ class VideoCompiler:
         return len(self._videos)
 
     @staticmethod
-    def _dl_video(video, path):
+    def _dl_video(video, path, cache=None):
         """
         Downloads a single video.
 
         Args:
             video (VideoRef): Video to download.
             path (str): Path to save video to.
+            cache (rvidmaker.videos.DownloadCache): Cache to download the video through. None to
+                download the video directly.
 
         Returns:
             (VideoRef, str)/None: The video and the path the video is downloaded to,
@@ -133,44 +272,148 @@ class VideoCompiler:
         """
         try:
             print('Downloading "{}"...'.format(video.title))
-            actual_path = video.download(path)
+            if cache is None:
+                actual_path = video.download(path)
+            else:
+                actual_path = cache.fetch(video, path)
         except DownloadException as e:
             print('WARNING: Failed to download "{}": {}'.format(video.title, e))
             return None
         print('Finished downloading "{}"'.format(video.title))
         return video, actual_path
 
-    def _batch_dl(self, max_workers=4):
+    def _record_dl(self, i, video, path):
         """
-        Uses multithreading to download all added videos, in order.
+        Downloads and probes a single video and records both as stages of its clip. Engines use
+        the stream information to plan each clip without opening it.
 
         Args:
+            i (int): Index of the video's clip.
+            video (VideoRef): Video to download.
+            path (str): Path to save video to.
+
+        Returns:
+            (int, VideoRef, str)/None: Index of the clip, the video and the path the video is
+                downloaded to, `None` on failure.
+        """
+        self._recorder.describe_clip(i, title=video.title)
+        with self._recorder.stage("download", i):
+            res = VideoCompiler._dl_video(video, path, self._cache)
+            if res is None:
+                return None
+            record_file(res[1])
+        with self._recorder.stage("probe", i):
+            try:
+                video.probe(res[1], self._sidecar_path(video, _PROBE_SIDECAR))
+            except ProbeException as e:
+                # Engines probe the video themselves if they need to.
+                print('WARNING: Failed to probe "{}": {}'.format(video.title, e))
+        return (i,) + res
+
+    def _batch_dl(self, videos, max_workers=4, max_pending=None):
+        """
+        Uses multithreading to download videos, in order. Downloads continue in the background
+        while yielded videos are being processed.
+
+        Args:
+            videos (list): Videos to download as `(int, VideoRef)` pairs of the index of their
+                clip and the video.
             max_workers (int): Maximum number of workers to use for multithreaded downloading.
+            max_pending (int): Maximum number of videos that are downloading or are downloaded
+                but not yet yielded. This caps how much disk space downloads waiting to be
+                processed use. None for no limit.
 
         Yields:
-            (VideoRef, str): The video and the path it was downloaded to. Videos that fail to
-                download are not yielded.
+            (int, VideoRef, str): Index of the video's clip, the video and the path it was
+                downloaded to. Videos that fail to download are not yielded.
         """
-        if not os.path.exists(_DOWNLOAD_DIR):
-            os.mkdir(_DOWNLOAD_DIR)
+        # Left over downloads from an interrupted render could be mistaken for partial
+        # downloads of different videos and resumed.
+        if os.path.exists(_DOWNLOAD_DIR):
+            rmtree(_DOWNLOAD_DIR)
+        os.mkdir(_DOWNLOAD_DIR)
         params = []
-        for i, v in enumerate(self._videos):
+        for i, v in videos:
             dl_path = os.path.join(_DOWNLOAD_DIR, "vid{:04d}".format(i))
-            params.append((v, dl_path))
+            params.append((i, v, dl_path))
+        if max_pending is None:
+            max_pending = len(params)
+        max_pending = max(1, max_pending)
+
         pool = ThreadPoolExecutor(max_workers=max_workers)
+        to_submit = iter(params)
+        pending = deque()
         try:
-            for res in pool.map(lambda ps: VideoCompiler._dl_video(*ps), params):
+            for ps in islice(to_submit, max_pending):
+                pending.append(pool.submit(self._record_dl, *ps))
+            while pending:
+                res = pending.popleft().result()
+                # Start the next download before handing this one off to be processed.
+                ps = next(to_submit, None)
+                if ps is not None:
+                    pending.append(pool.submit(self._record_dl, *ps))
                 if res is not None:
                     yield res
-        except KeyboardInterrupt as e:
-            vinfo = sys.version_info
-            if vinfo.major >= 3 and vinfo.major >= 9:
+        finally:
+            if sys.version_info >= (3, 9):
                 pool.shutdown(cancel_futures=True)
             else:
+                for future in pending:
+                    future.cancel()
                 pool.shutdown()
-            raise e
 
-    def render_video(self, res, output_path, audio_level=0.7, bg_color=(0, 0, 0)):
+    def _overlay_text(self, video):
+        """
+        Gets the text to draw on top of a video.
+
+        Args:
+            video (VideoRef): Video to get the text for.
+
+        Returns:
+            (str, str): The title and author, censored if a censor is set. The author is None
+                if it is not known.
+        """
+        title = video.title
+        author = video.author
+        if self._censor is not None:
+            title = self._censor.censor(title)
+            if author is not None:
+                author = self._censor.censor(author)
+        # Titles longer than 100 characters won't fit on the screen anyway.
+        return title[:100], author
+
+    def _sidecar_path(self, video, name):
+        """
+        Gets where to cache data derived from a video, such as its loudness measurements. Data
+        is kept in the download cache so it outlives the downloaded video.
+
+        Args:
+            video (VideoRef): Video to get the path for.
+            name (str): Name of the data.
+
+        Returns:
+            str/None: Path to cache the data at. None to cache it next to the downloaded video.
+        """
+        if self._cache is None or video.cache_key is None:
+            return None
+        return self._cache.sidecar_path(video, name)
+
+    def render_video(
+        self,
+        res,
+        output_path,
+        audio_level=0.7,
+        bg_color=(0, 0, 0),
+        engine="moviepy",
+        max_workers=None,
+        max_pending=8,
+        encoder=None,
+        fps=DEFAULT_FPS,
+        max_clip_duration=None,
+        preview=False,
+        work_dir=None,
+        max_work_dir_bytes=None,
+    ):
         """
         Renders all added videos into a complete compilation.
 
@@ -179,48 +422,449 @@ class VideoCompiler:
             output_path (str): Path to write video to.
             audio_level (float): Audio level to normalize all videos around, (0, 1].
             bg_color (int, int, int): Color of background as RGB, [0, 255].
+            engine (str): How to render the compilation. One of `ENGINES`.
+                "moviepy" composites clips frame-by-frame with Moviepy.
+                "filtergraph" renders every clip in a single FFmpeg filtergraph and encode.
+                "prerender" renders clips to intermediate files in parallel and concatenates them
+                without re-encoding.
+            max_workers (int): Maximum number of processes to pre-render clips with. Only used by
+                the "prerender" engine. Workers are not forked, so scripts using it must guard
+                their entry point with `if __name__ == "__main__":`. None to use one per CPU.
+            max_pending (int): Maximum number of videos downloaded ahead of rendering. Clips are
+                rendered as soon as they finish downloading while later videos keep downloading.
+                The "prerender" engine deletes each download once its clip is rendered, which
+                caps the disk space downloads use. None to download all videos without limit.
+            encoder (EncoderSettings): How to encode the compilation. See `encoder.DRAFT` and
+                `encoder.FINAL`. None for x264's defaults.
+            fps (int): Frame rate of the compilation.
+            max_clip_duration (float): Maximum duration of each clip in seconds. Longer clips are
+                cut short. None to use whole clips.
+            preview (bool): Whether to render a quick, low quality preview. Previews are at most
+                `PREVIEW_HEIGHT` pixels tall, run at `PREVIEW_FPS`, cut clips to
+                `PREVIEW_CLIP_DURATION` seconds and are encoded with `encoder.DRAFT`, overriding
+                `res`, `fps`, `max_clip_duration` and `encoder`. Clips are in the same order as
+                in a full render.
+            work_dir (str): Directory to keep rendered clips in between renders. Only used by the
+                "prerender" engine. A later render with the same settings only downloads and
+                renders clips that are new, and reuses the rest. None to discard rendered clips.
+            max_work_dir_bytes (int): Maximum total size of the clips kept in `work_dir` in
+                bytes. After each render, the least recently used clips not in it are deleted
+                until the rest fit. None to never delete clips.
+
+        Returns:
+            Manifest: Timestamps of the videos used in the compilation.
 
         Raises:
             NotEnoughVideos: There are fewer than two video provided, or fewer than two videos are
                 successfully downloaded.
+            RenderException: If FFmpeg fails to render the compilation.
+            ValueError: If `engine` is not a valid engine.
         """
+        if engine not in ENGINES:
+            raise ValueError("engine must be one of {}".format(ENGINES))
         if self.video_count < 2:
             raise NotEnoughVideos("Need at least 2 videos for a compilation")
 
-        # Download videos.
-        dl = list(self._batch_dl())
-        if len(dl) < 2:
-            raise NotEnoughVideos(
-                "Only {} videos downloaded successfully, need at least 2".format(
-                    len(dl)
-                )
+        if preview:
+            res = preview_resolution(res)
+            fps = PREVIEW_FPS
+            if max_clip_duration is None or max_clip_duration > PREVIEW_CLIP_DURATION:
+                max_clip_duration = PREVIEW_CLIP_DURATION
+            encoder = DRAFT
+        elif encoder is None:
+            encoder = EncoderSettings()
+
+        if engine == "prerender":
+            manifest = self._render_prerender(
+                res,
+                output_path,
+                audio_level,
+                bg_color,
+                encoder,
+                fps,
+                max_clip_duration,
+                max_workers,
+                max_pending,
+                work_dir,
+                max_work_dir_bytes,
+            )
+            # Delete all downloaded videos.
+            rmtree(_DOWNLOAD_DIR, ignore_errors=True)
+            return manifest
+
+        # Download videos. Each engine renders videos as they finish downloading.
+        dl = self._batch_dl(list(enumerate(self._videos)), max_pending=max_pending)
+
+        if engine == "filtergraph":
+            manifest = self._render_filtergraph(
+                dl,
+                res,
+                output_path,
+                audio_level,
+                bg_color,
+                encoder,
+                fps,
+                max_clip_duration,
+            )
+        else:
+            manifest = self._render_moviepy(
+                dl,
+                res,
+                output_path,
+                audio_level,
+                bg_color,
+                encoder,
+                fps,
+                max_clip_duration,
             )
 
-        # We use this directory when we need to write a video to a file temporarily.
+        # Delete all downloaded videos.
+        rmtree(_DOWNLOAD_DIR)
+
+        return manifest
+
+    def _render_filtergraph(
+        self,
+        dl,
+        res,
+        output_path,
+        audio_level,
+        bg_color,
+        encoder,
+        fps,
+        max_clip_duration,
+    ):
+        """
+        Renders downloaded videos with a single FFmpeg filtergraph. Every clip is decoded once
+        and the compilation is encoded once.
+
+        Args:
+            dl (iterable): Downloaded videos as `(int, VideoRef, str)` tuples of the index of
+                their clip, the video and its path.
+            res (int, int): Width and height of video.
+            output_path (str): Path to write video to.
+            audio_level (float): Audio level to normalize all videos around, (0, 1].
+            bg_color (int, int, int): Color of background as RGB, [0, 255].
+            encoder (EncoderSettings): How to encode the compilation.
+            fps (int): Frame rate of the compilation.
+            max_clip_duration (float): Maximum duration of each clip in seconds. None to use
+                whole clips.
+
+        Returns:
+            Manifest: Timestamps of the videos used in the compilation.
+        """
+        # Text drawn on the clips is read from files in this directory.
         temp_dir = tempfile.TemporaryDirectory()
 
-        # Load all clips.
         timestamp = 0
         manifest = Manifest()
+        streams = []
+        for i, v, path in dl:
+            title, author = self._overlay_text(v)
+            try:
+                # Probing the clip and measuring its loudness is the only work done per clip
+                # before the compilation is encoded.
+                with self._recorder.stage("normalize", i):
+                    video, audio, duration = clip_streams(
+                        path,
+                        res,
+                        title,
+                        author,
+                        temp_dir.name,
+                        audio_level=audio_level,
+                        bg_color=bg_color,
+                        fps=fps,
+                        audio_cache_path=self._sidecar_path(v, _LOUDNESS_SIDECAR),
+                        info=v.info,
+                        max_duration=max_clip_duration,
+                    )
+            except RenderException as e:
+                print("Unexpected error: {}".format(e), file=sys.stderr)
+                continue
+            streams.append((video, audio))
+
+            # Update manifest.
+            manifest.add_entry(v, timestamp)
+            timestamp += duration
+
+        # Videos might have been skipped due to recoverable errors.
+        if len(streams) < 2:
+            raise NotEnoughVideos(
+                "Only {} videos successfully editted, need at least 2".format(
+                    len(streams)
+                )
+            )
+        try:
+            with self._recorder.stage("encode"):
+                render_single_pass(streams, output_path, fps=fps, encoder=encoder)
+                record_file(output_path)
+        finally:
+            temp_dir.cleanup()
+
+        return manifest
+
+    def _clip_key(
+        self, video, res, audio_level, bg_color, encoder, fps, max_clip_duration
+    ):
+        """
+        Gets a key identifying the intermediate file rendered for a video, so the file can be
+        reused by later renders with the same settings.
+
+        Args:
+            video (VideoRef): Video the intermediate file is rendered from.
+            res (int, int): Width and height of video.
+            audio_level (float): Audio level to normalize all videos around, (0, 1].
+            bg_color (int, int, int): Color of background as RGB, [0, 255].
+            encoder (EncoderSettings): How to encode the compilation.
+            fps (int): Frame rate of the compilation.
+            max_clip_duration (float): Maximum duration of each clip in seconds.
+
+        Returns:
+            str/None: The key. None if the video has no cache key, since it cannot be told apart
+                from other videos.
+        """
+        if video.cache_key is None:
+            return None
+        title, author = self._overlay_text(video)
+        settings = json.dumps(
+            [
+                video.cache_key,
+                list(res),
+                title,
+                author,
+                audio_level,
+                list(bg_color),
+                repr(encoder),
+                fps,
+                max_clip_duration,
+            ]
+        )
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()
+
+    def _render_prerender(
+        self,
+        res,
+        output_path,
+        audio_level,
+        bg_color,
+        encoder,
+        fps,
+        max_clip_duration,
+        max_workers=None,
+        max_pending=None,
+        work_dir=None,
+        max_work_dir_bytes=None,
+    ):
+        """
+        Renders each video to an intermediate file in a pool of processes, then concatenates the
+        intermediate files. Intermediate files share codec parameters, so they are copied into
+        the compilation without being re-encoded. Videos are downloaded as they are needed and
+        deleted as soon as their intermediate file is rendered.
+
+        Args:
+            res (int, int): Width and height of video.
+            output_path (str): Path to write video to.
+            audio_level (float): Audio level to normalize all videos around, (0, 1].
+            bg_color (int, int, int): Color of background as RGB, [0, 255].
+            encoder (EncoderSettings): How to encode the compilation.
+            fps (int): Frame rate of the compilation.
+            max_clip_duration (float): Maximum duration of each clip in seconds. None to use
+                whole clips.
+            max_workers (int): Maximum number of processes to use. None to use one per CPU.
+            max_pending (int): Maximum number of downloaded videos waiting to be rendered.
+                No more videos are downloaded until one finishes. None for no limit.
+            work_dir (str): Directory to keep intermediate files in. Intermediate files already
+                in it that were rendered with the same settings are reused without downloading
+                their videos again. None to discard intermediate files.
+            max_work_dir_bytes (int): Maximum total size of the intermediate files kept in
+                `work_dir` in bytes. None for no limit.
+
+        Returns:
+            Manifest: Timestamps of the videos used in the compilation.
+        """
+        # Intermediate files and text drawn on the clips are written to this directory.
+        temp_dir = tempfile.TemporaryDirectory()
+
+        if work_dir is not None and not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+
+        # Find intermediate files that can be reused.
         clips = []
-        w, h = res
-        videos_used = 0
-        for v, path in dl:
-            title = v.title
-            author = v.author
-            if self._censor is not None:
-                title = self._censor.censor(title)
-                author = self._censor.censor(author)
-            clip = VideoFileClip(path)
+        to_render = []
+        for i, v in enumerate(self._videos):
+            key = None
+            if work_dir is not None:
+                key = self._clip_key(
+                    v, res, audio_level, bg_color, encoder, fps, max_clip_duration
+                )
+            if key is None:
+                clip_path = os.path.join(temp_dir.name, "clip{:04d}.mp4".format(i))
+            else:
+                clip_path = os.path.join(work_dir, "{}.mp4".format(key))
+            clips.append([v, clip_path, None])
+            if not os.path.exists(clip_path):
+                to_render.append((i, v))
+        if work_dir is not None:
+            print(
+                "Reusing {} of {} rendered clips".format(
+                    len(clips) - len(to_render), len(clips)
+                )
+            )
+
+        cpu_cnt = multiprocessing.cpu_count()
+        if max_workers is None:
+            max_workers = cpu_cnt
+        max_workers = max(1, min(max_workers, len(to_render)))
+        # Split the CPUs between the workers so FFmpeg processes do not compete for them.
+        threads = max(1, cpu_cnt // max_workers)
+        if max_pending is None:
+            max_pending = len(to_render)
+        # Keep every worker busy, even if fewer videos are allowed to wait.
+        max_pending = max(max_workers, max_pending)
+
+        pool = _process_pool(max_workers)
+        dl = self._batch_dl(to_render, max_pending=max_pending)
+        running = set()
+        try:
+            for i, v, path in dl:
+                title, author = self._overlay_text(v)
+                # Render next to the final path so an interrupted render is never reused.
+                part_path = "{}.part.mp4".format(os.path.splitext(clips[i][1])[0])
+                # Stages cannot be recorded from other processes, so the whole render is
+                # measured in the worker and recorded once it finishes.
+                future = pool.submit(
+                    timed_call,
+                    prerender_clip,
+                    path,
+                    part_path,
+                    res,
+                    title,
+                    author,
+                    temp_dir.name,
+                    audio_level=audio_level,
+                    bg_color=bg_color,
+                    fps=fps,
+                    threads=threads,
+                    audio_cache_path=self._sidecar_path(v, _LOUDNESS_SIDECAR),
+                    info=v.info,
+                    encoder=encoder,
+                    max_duration=max_clip_duration,
+                )
+                future.add_done_callback(lambda _, path=path: os.remove(path))
+                clips[i][2] = (part_path, future)
+                running.add(future)
+                if len(running) >= max_pending:
+                    _, running = wait(running, return_when=FIRST_COMPLETED)
+
+            timestamp = 0
+            manifest = Manifest()
+            clip_paths = []
+            for i, (v, clip_path, rendered) in enumerate(clips):
+                try:
+                    if rendered is not None:
+                        part_path, future = rendered
+                        duration, stage = future.result()
+                        stage.bytes_written = os.path.getsize(part_path)
+                        self._recorder.add(stage, "render", i)
+                        os.replace(part_path, clip_path)
+                    elif os.path.exists(clip_path):
+                        duration = stream_params(clip_path)[1]
+                        # Mark the clip as recently used, so it is the last to be pruned.
+                        os.utime(clip_path)
+                    else:
+                        # The video failed to download.
+                        continue
+                except RenderException as e:
+                    print("Unexpected error: {}".format(e), file=sys.stderr)
+                    continue
+                clip_paths.append(clip_path)
+
+                # Update manifest.
+                manifest.add_entry(v, timestamp)
+                timestamp += duration
+        finally:
+            pool.shutdown()
+            dl.close()
+
+        try:
+            # Videos might have been skipped due to recoverable errors.
+            if len(clip_paths) < 2:
+                raise NotEnoughVideos(
+                    "Only {} videos successfully editted, need at least 2".format(
+                        len(clip_paths)
+                    )
+                )
+            with self._recorder.stage("concat"):
+                concat_videos(
+                    clip_paths, output_path, temp_dir.name, fps=fps, encoder=encoder
+                )
+                record_file(output_path)
+        finally:
+            temp_dir.cleanup()
+
+        if work_dir is not None and max_work_dir_bytes is not None:
+            _prune_clips(work_dir, clip_paths, max_work_dir_bytes)
+
+        return manifest
+
+    def _render_moviepy_clip(
+        self,
+        i,
+        video,
+        path,
+        clip_path,
+        res,
+        audio_level,
+        encoder,
+        fps,
+        max_clip_duration,
+        temp_dir,
+    ):
+        """
+        Renders a single downloaded video to an intermediate file with Moviepy. Every clip is
+        closed before returning, so no readers are left open.
+
+        Args:
+            i (int): Index of the video's clip.
+            video (VideoRef): The video.
+            path (str): Path the video is downloaded to.
+            clip_path (str): Path to write the intermediate file to.
+            res (int, int): Width and height of video.
+            audio_level (float): Audio level to normalize all videos around, (0, 1].
+            encoder (EncoderSettings): How to encode the compilation.
+            fps (int): Frame rate of the compilation.
+            max_clip_duration (float): Maximum duration of each clip in seconds. None to use
+                whole clips.
+            temp_dir (str): Directory to write temporary files to.
 
-            # Adjust audio levels.
+        Returns:
+            float: Duration of the clip in seconds.
+
+        Raises:
+            RenderException: If the loudness of the video cannot be measured or Moviepy fails.
+        """
+        title, author = self._overlay_text(video)
+        w, h = res
+        # Every clip opened, so they can all be closed once the clip is written.
+        opened = []
+        # Video with a blurred background, deleted once the clip is written.
+        temp_vid_path = None
+        try:
+            # Skip opening an audio reader for clips known to be silent.
+            has_audio = video.info is None or video.info.has_audio
+            clip = VideoFileClip(path, audio=has_audio)
+            opened.append(clip)
+            if max_clip_duration is not None and clip.duration > max_clip_duration:
+                clip = clip.subclip(0, max_clip_duration)
+
+            # Adjust audio levels. The peak is measured by FFmpeg, which is far faster than
+            # reading every sample through Moviepy.
             if clip.audio is not None:
-                if clip.audio.max_volume() > 0:
-                    audio = clip.audio.fx(afx.audio_normalize)
-                    max_volume = clip.audio.max_volume()
-                    volume_mult = audio_level / max_volume
-                    clip.set_audio(audio)
-                    clip = clip.fx(afx.volumex, volume_mult)
+                with self._recorder.stage("normalize", i):
+                    stats = analyze_audio(
+                        path, self._sidecar_path(video, _LOUDNESS_SIDECAR)
+                    )
+                clip = clip.fx(afx.volumex, gain_for_level(stats, audio_level))
 
             # Resize video.
             cw, ch = clip.size
@@ -233,70 +877,133 @@ class VideoCompiler:
             if clip.size != res:
                 ext = os.path.splitext(path)[1]
                 # We use time_ns to generate a unique filename.
-                temp_vid_path = os.path.join(temp_dir.name, str(time_ns()) + ext)
-                clip.write_videofile(
-                    temp_vid_path,
-                    ffmpeg_params=[
-                        "-lavfi",
-                        "[0:v]scale=ih*16/9:-1,boxblur=luma_radius=min(h\,w)/20:luma_power=1:chroma_radius=min(cw\,ch)/20:chroma_power=1[bg];[bg][0:v]overlay=(W-w)/2:(H-h)/2,crop=h=iw*9/16",
-                    ],
-                )
+                temp_vid_path = os.path.join(temp_dir, str(time_ns()) + ext)
+                with self._recorder.stage("blur", i):
+                    clip.write_videofile(
+                        temp_vid_path,
+                        ffmpeg_params=[
+                            "-lavfi",
+                            "[0:v]scale=ih*16/9:-1,boxblur=luma_radius=min(h\,w)/20:luma_power=1:chroma_radius=min(cw\,ch)/20:chroma_power=1[bg];[bg][0:v]overlay=(W-w)/2:(H-h)/2,crop=h=iw*9/16",
+                        ],
+                    )
+                    record_file(temp_vid_path)
                 clip = VideoFileClip(temp_vid_path)
-
-            # Add text.
-            try:
-                # A title that is too long can cause ImageMagick to fail.
-                # Titles longer than 100 characters won't fit on the screen anyway.
-                title_slice = title[:100]
-                title_clip = TextClip(
-                    title_slice, font="IBM Plex Sans", fontsize=60, color="white"
-                )
-                title_clip = title_clip.set_position((10, 10)).set_duration(
-                    clip.duration
-                )
-                title_clip_shadow = TextClip(
-                    title_slice, font="IBM Plex Sans", fontsize=60, color="black"
-                )
-                title_clip_shadow = title_clip_shadow.set_position(
-                    (12, 12)
-                ).set_duration(clip.duration)
-                author_text = "u/{}".format(author)
-                author_clip = TextClip(
-                    author_text, font="IBM Plex Sans", fontsize=40, color="grey"
-                )
-                author_clip = author_clip.set_position((40, 75)).set_duration(
-                    clip.duration
+                opened.append(clip)
+
+            # Add text as a single pre-rendered layer.
+            with self._recorder.stage("overlay", i):
+                overlay = render_overlay(title, author)
+                text_clip = ImageClip(np.array(overlay)).set_duration(clip.duration)
+            clip = CompositeVideoClip([clip, text_clip], size=res)
+            clip = clip.set_audio(_fit_audio(clip.audio, clip.duration))
+
+            # Encode every clip the same way so they can be concatenated without re-encoding.
+            # Resizing and compositing happen frame by frame while encoding, so they are
+            # measured as part of it.
+            with self._recorder.stage("encode", i):
+                clip.write_videofile(
+                    clip_path,
+                    fps=fps,
+                    codec="libx264",
+                    audio_codec="aac",
+                    audio_fps=SAMPLE_RATE,
+                    temp_audiofile=os.path.join(temp_dir, "{}.m4a".format(time_ns())),
+                    preset=encoder.preset,
+                    ffmpeg_params=encoder.ffmpeg_params()
+                    + ["-video_track_timescale", str(VIDEO_TIMESCALE)],
+                    threads=multiprocessing.cpu_count(),
                 )
-            except OSError as e:
-                # This is intended to catch ImageMagick related errors.
-                # ImageMagick can fail in unexpected ways, but it happens seldom enough that
-                # we can just ignore it.
-                # Future versions of Moviepy will likely move away from ImageMagick (https://github.com/Zulko/moviepy/issues/1145#issuecomment-623594679)
-                print("Unexpected error: {}".format(e), file=sys.stderr)
-                continue
+                record_file(clip_path)
+            return clip.duration
+        except OSError as e:
+            if os.path.exists(clip_path):
+                os.remove(clip_path)
+            raise RenderException("Failed to render clip with Moviepy: {}".format(e))
+        finally:
+            for c in opened:
+                c.close()
+            if temp_vid_path is not None and os.path.exists(temp_vid_path):
+                os.remove(temp_vid_path)
+
+    def _render_moviepy(
+        self,
+        dl,
+        res,
+        output_path,
+        audio_level,
+        bg_color,
+        encoder,
+        fps,
+        max_clip_duration,
+    ):
+        """
+        Renders downloaded videos by compositing them frame-by-frame with Moviepy. Clips are
+        rendered to intermediate files one at a time, closing each clip and deleting its
+        download before the next is opened, then concatenated. This keeps memory use and open
+        files constant no matter how many videos there are.
 
-            clip = CompositeVideoClip(
-                [clip, title_clip_shadow, title_clip, author_clip], size=res
-            )
-            clips.append(clip)
+        Args:
+            dl (iterable): Downloaded videos as `(int, VideoRef, str)` tuples of the index of
+                their clip, the video and its path.
+            res (int, int): Width and height of video.
+            output_path (str): Path to write video to.
+            audio_level (float): Audio level to normalize all videos around, (0, 1].
+            bg_color (int, int, int): Color of background as RGB, [0, 255]. Unused, since
+                backgrounds are blurred copies of the clips.
+            encoder (EncoderSettings): How to encode the compilation.
+            fps (int): Frame rate of the compilation.
+            max_clip_duration (float): Maximum duration of each clip in seconds. None to use
+                whole clips.
 
-            # Update manifest.
-            manifest.add_entry(v, timestamp)
-            timestamp += clip.duration
-            videos_used += 1
+        Returns:
+            Manifest: Timestamps of the videos used in the compilation.
+        """
+        # We use this directory when we need to write a video to a file temporarily.
+        temp_dir = tempfile.TemporaryDirectory()
 
-        # Videos might have been skipped due to recoverable errors.
-        if videos_used < 2:
-            raise NotEnoughVideos(
-                "Only {} videos successfully editted, need at least 2".format(
-                    videos_used
+        timestamp = 0
+        manifest = Manifest()
+        clip_paths = []
+        try:
+            for i, v, path in dl:
+                clip_path = os.path.join(temp_dir.name, "clip{:04d}.mp4".format(i))
+                try:
+                    duration = self._render_moviepy_clip(
+                        i,
+                        v,
+                        path,
+                        clip_path,
+                        res,
+                        audio_level,
+                        encoder,
+                        fps,
+                        max_clip_duration,
+                        temp_dir.name,
+                    )
+                except RenderException as e:
+                    print("Unexpected error: {}".format(e), file=sys.stderr)
+                    continue
+                finally:
+                    os.remove(path)
+                clip_paths.append(clip_path)
+
+                # Update manifest.
+                manifest.add_entry(v, timestamp)
+                timestamp += duration
+
+            # Videos might have been skipped due to recoverable errors.
+            if len(clip_paths) < 2:
+                raise NotEnoughVideos(
+                    "Only {} videos successfully editted, need at least 2".format(
+                        len(clip_paths)
+                    )
                 )
-            )
-        final = concatenate_videoclips(clips)
-        thread_cnt = multiprocessing.cpu_count()
-        final.write_videofile(output_path, threads=thread_cnt)
-
-        # Delete all downloaded videos.
-        rmtree(_DOWNLOAD_DIR)
+            with self._recorder.stage("concat"):
+                concat_videos(
+                    clip_paths, output_path, temp_dir.name, fps=fps, encoder=encoder
+                )
+                record_file(output_path)
+        finally:
+            temp_dir.cleanup()
 
         return manifest
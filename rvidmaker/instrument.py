@@ -0,0 +1,261 @@
+"""Records the time and resources each stage of generating a video uses"""
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows. Peak memory use is not recorded there.
+    resource = None
+
+_local = threading.local()
+
+
+def _peak_rss():
+    """
+    Returns:
+        int/None: Peak resident set size in bytes of this process or of its largest finished
+            child process so far, whichever is larger. None if it cannot be measured.
+    """
+    if resource is None:
+        return None
+    # Linux reports kilobytes.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * 1024
+
+
+def _cpu_time():
+    """
+    Returns:
+        float: CPU time in seconds used by this process and its finished child processes.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Stage:
+    """
+    Measurements of a single stage of generating a video.
+
+    CPU time covers the whole process, including child processes such as FFmpeg once they exit,
+    so stages that run at the same time share it. Peak memory use is the highest seen by the
+    end of the stage, not just during it.
+
+    Attributes:
+        name (str): Name of the stage.
+        clip (int): Index of the clip the stage is for. None for stages of the whole video.
+        wall_time (float): Elapsed time in seconds.
+        cpu_time (float): CPU time in seconds.
+        peak_rss (int): Peak resident set size in bytes. None if it cannot be measured.
+        bytes_downloaded (int): Number of bytes downloaded.
+        bytes_written (int): Number of bytes written to disk.
+    """
+
+    def __init__(self, name, clip=None):
+        """
+        Args:
+            name (str): Name of the stage.
+            clip (int): Index of the clip the stage is for. None for stages of the whole video.
+        """
+        self.name = name
+        self.clip = clip
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.peak_rss = None
+        self.bytes_downloaded = 0
+        self.bytes_written = 0
+
+    def to_dict(self):
+        """
+        Returns:
+            dict: The measurements, without the name and clip.
+        """
+        return {
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_rss": self.peak_rss,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_written": self.bytes_written,
+        }
+
+
+@contextmanager
+def _measure(stage):
+    """
+    Measures the code run within the context into a stage. Bytes recorded with `record_bytes`
+    on the same thread are added to the stage.
+
+    Args:
+        stage (Stage): Stage to store the measurements in.
+    """
+    parent = getattr(_local, "stage", None)
+    _local.stage = stage
+    wall_start = perf_counter()
+    cpu_start = _cpu_time()
+    try:
+        yield stage
+    finally:
+        stage.wall_time += perf_counter() - wall_start
+        stage.cpu_time += _cpu_time() - cpu_start
+        stage.peak_rss = _peak_rss()
+        _local.stage = parent
+
+
+def record_bytes(downloaded=0, written=0):
+    """
+    Adds to the bytes downloaded and written by the stage running on this thread. Does nothing
+    if no stage is running.
+
+    Args:
+        downloaded (int): Number of bytes downloaded.
+        written (int): Number of bytes written to disk.
+    """
+    stage = getattr(_local, "stage", None)
+    if stage is not None:
+        stage.bytes_downloaded += downloaded
+        stage.bytes_written += written
+
+
+def record_file(path):
+    """
+    Adds the size of a file to the bytes written by the stage running on this thread.
+
+    Args:
+        path (str): Path to the written file. Ignored if it does not exist.
+    """
+    if os.path.exists(path):
+        record_bytes(written=os.path.getsize(path))
+
+
+def timed_call(func, *args, **kwargs):
+    """
+    Calls a function and measures it. Intended for measuring work submitted to another process,
+    where stages cannot be recorded directly.
+
+    Args:
+        func (callable): Function to call.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+
+    Returns:
+        (any, Stage): The function's return value and its measurements. The stage is unnamed.
+    """
+    stage = Stage(None)
+    with _measure(stage):
+        result = func(*args, **kwargs)
+    return result, stage
+
+
+class Recorder:
+    """
+    Records stages of generating a video and summarizes them in a report. Safe to use from
+    multiple threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = []
+        self._clips = {}
+
+    @contextmanager
+    def stage(self, name, clip=None):
+        """
+        Records the code run within the context as a stage.
+
+        Args:
+            name (str): Name of the stage.
+            clip (int): Index of the clip the stage is for. None for stages of the whole video.
+
+        Yields:
+            Stage: The stage being measured.
+        """
+        stage = Stage(name, clip)
+        try:
+            with _measure(stage):
+                yield stage
+        finally:
+            self.add(stage)
+
+    def add(self, stage, name=None, clip=None):
+        """
+        Records a stage that was measured elsewhere, such as with `timed_call`.
+
+        Args:
+            stage (Stage): The stage.
+            name (str): Name to give the stage. None to keep its name.
+            clip (int): Index of the clip to assign the stage to. None to keep its clip.
+        """
+        if name is not None:
+            stage.name = name
+        if clip is not None:
+            stage.clip = clip
+        with self._lock:
+            self._stages.append(stage)
+
+    def describe_clip(self, clip, **info):
+        """
+        Adds information about a clip to the report, such as its title.
+
+        Args:
+            clip (int): Index of the clip.
+            **info: Information to add. Must be serializable to JSON.
+        """
+        with self._lock:
+            self._clips.setdefault(clip, {}).update(info)
+
+    def report(self):
+        """
+        Summarizes the recorded stages. Stages recorded more than once are summed.
+
+        Returns:
+            dict: Measurements of each stage of the whole video under "stages", of each stage
+                of each clip under "clips", and of each stage summed over all clips under
+                "clip_totals".
+        """
+        with self._lock:
+            stages = list(self._stages)
+            clip_info = {clip: dict(info) for clip, info in self._clips.items()}
+
+        def add_to(summary, stage):
+            if stage.name not in summary:
+                summary[stage.name] = Stage(stage.name).to_dict()
+            entry = summary[stage.name]
+            entry["wall_time"] += stage.wall_time
+            entry["cpu_time"] += stage.cpu_time
+            entry["bytes_downloaded"] += stage.bytes_downloaded
+            entry["bytes_written"] += stage.bytes_written
+            if stage.peak_rss is not None:
+                entry["peak_rss"] = max(entry["peak_rss"] or 0, stage.peak_rss)
+
+        video_stages = {}
+        clip_stages = {}
+        clip_totals = {}
+        for stage in stages:
+            if stage.clip is None:
+                add_to(video_stages, stage)
+            else:
+                add_to(clip_stages.setdefault(stage.clip, {}), stage)
+                add_to(clip_totals, stage)
+
+        clips = []
+        for clip in sorted(set(clip_stages) | set(clip_info)):
+            entry = {"index": clip}
+            entry.update(clip_info.get(clip, {}))
+            entry["stages"] = clip_stages.get(clip, {})
+            clips.append(entry)
+        return {"stages": video_stages, "clips": clips, "clip_totals": clip_totals}
+
+    def dump(self, path):
+        """
+        Writes the report to a JSON file.
+
+        Args:
+            path (str): Path to write the report to.
+        """
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2)
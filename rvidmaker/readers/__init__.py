@@ -5,4 +5,20 @@ class reddit:
         RedditConfigNotFound,
         RedditVideoNotFound,
         RedditComment,
+        get_indexed_videos,
+        get_videos,
+        merge_by_score,
+        scan_subreddits,
     )
+
+
+class local:
+    from .local import (
+        LocalManifestException,
+        read_directory,
+        read_manifest,
+    )
+
+
+class index:
+    from .index import IndexedPost, PostIndex
@@ -0,0 +1,243 @@
+"""Provides a local index of scraped Reddit articles that persists across runs"""
+
+from collections import namedtuple
+from datetime import datetime
+import os
+import sqlite3
+
+# Version of the index's schema. Indexes with a different version are rebuilt.
+_SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id TEXT PRIMARY KEY,
+    subreddit TEXT NOT NULL,
+    title TEXT NOT NULL,
+    author TEXT,
+    score INTEGER NOT NULL,
+    created_utc REAL NOT NULL,
+    video_url TEXT NOT NULL,
+    audio_url TEXT,
+    duration REAL NOT NULL,
+    nsfw INTEGER NOT NULL,
+    has_audio INTEGER,
+    last_seen REAL NOT NULL,
+    used_at REAL
+);
+CREATE INDEX IF NOT EXISTS posts_by_score ON posts (subreddit, used_at, score);
+CREATE TABLE IF NOT EXISTS scans (
+    subreddit TEXT NOT NULL,
+    time_filter TEXT NOT NULL,
+    scanned_at REAL NOT NULL,
+    PRIMARY KEY (subreddit, time_filter)
+);
+"""
+
+IndexedPost = namedtuple(
+    "IndexedPost",
+    (
+        "id",
+        "subreddit",
+        "title",
+        "author",
+        "score",
+        "created_utc",
+        "video_url",
+        "audio_url",
+        "duration",
+        "nsfw",
+        "has_audio",
+    ),
+)
+IndexedPost.__doc__ = """
+An article with a video hosted by Reddit, as stored in a `PostIndex`. `audio_url` is where the
+audio would be if the video has audio, and `has_audio` is None until it is checked.
+"""
+
+
+class PostIndex:
+    """
+    Stores articles with videos hosted by Reddit in a SQLite database, so later runs can pick
+    videos without querying Reddit again and remember which videos were already used. Subreddit
+    names are stored in lowercase.
+
+    Attributes:
+        path (str): Path to the database.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path to the database. Created if it does not exist.
+        """
+        self._path = path
+        parent = os.path.dirname(path)
+        if parent and not os.path.exists(parent):
+            os.makedirs(parent)
+        self._conn = sqlite3.connect(path)
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != _SCHEMA_VERSION:
+            with self._conn:
+                self._conn.execute("DROP TABLE IF EXISTS posts")
+                self._conn.execute("DROP TABLE IF EXISTS scans")
+                self._conn.execute("PRAGMA user_version = {}".format(_SCHEMA_VERSION))
+        self._conn.executescript(_SCHEMA)
+
+    @property
+    def path(self):
+        return self._path
+
+    def close(self):
+        """Closes the database."""
+        self._conn.close()
+
+    def upsert(self, posts):
+        """
+        Adds articles to the index, or updates the score of articles already in it. Whether a
+        video has audio and whether it was used are kept.
+
+        Args:
+            posts (list): The articles as `IndexedPost`s.
+        """
+        now = datetime.now().timestamp()
+        with self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO posts (id, subreddit, title, author, score, created_utc, video_url,
+                    audio_url, duration, nsfw, has_audio, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    score = excluded.score,
+                    last_seen = excluded.last_seen,
+                    has_audio = COALESCE(posts.has_audio, excluded.has_audio)
+                """,
+                [
+                    (
+                        p.id,
+                        p.subreddit.lower(),
+                        p.title,
+                        p.author,
+                        p.score,
+                        p.created_utc,
+                        p.video_url,
+                        p.audio_url,
+                        p.duration,
+                        p.nsfw,
+                        p.has_audio,
+                        now,
+                    )
+                    for p in posts
+                ],
+            )
+
+    def set_has_audio(self, post_id, has_audio):
+        """
+        Records whether the video of an article has audio, so it never has to be checked again.
+
+        Args:
+            post_id (str): ID of the article.
+            has_audio (bool): Whether the video has audio.
+        """
+        with self._conn:
+            self._conn.execute(
+                "UPDATE posts SET has_audio = ? WHERE id = ?", (has_audio, post_id)
+            )
+
+    def mark_used(self, post_ids):
+        """
+        Records that the videos of articles were used in a compilation, so they are not picked
+        again by `top_unused`.
+
+        Args:
+            post_ids (list): IDs of the articles.
+        """
+        now = datetime.now().timestamp()
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE posts SET used_at = ? WHERE id = ?",
+                [(now, post_id) for post_id in post_ids],
+            )
+
+    def mark_scanned(self, subreddit, time_filter):
+        """
+        Records that a listing of a subreddit was just scanned into the index.
+
+        Args:
+            subreddit (str): Name of the subreddit.
+            time_filter (str): Time filter of the listing.
+        """
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scans VALUES (?, ?, ?)",
+                (subreddit.lower(), time_filter, datetime.now().timestamp()),
+            )
+
+    def scan_age(self, subreddit, time_filter):
+        """
+        Args:
+            subreddit (str): Name of the subreddit.
+            time_filter (str): Time filter of the listing.
+
+        Returns:
+            float/None: Hours since the listing was last scanned. None if it never was.
+        """
+        row = self._conn.execute(
+            "SELECT scanned_at FROM scans WHERE subreddit = ? AND time_filter = ?",
+            (subreddit.lower(), time_filter),
+        ).fetchone()
+        if row is None:
+            return None
+        return (datetime.now().timestamp() - row[0]) / (60 * 60)
+
+    def top_unused(
+        self,
+        subreddit,
+        limit=None,
+        max_age=None,
+        min_score=None,
+        min_duration=None,
+        max_duration=None,
+        include_nsfw=False,
+    ):
+        """
+        Gets the highest-scored articles whose videos have not been used yet.
+
+        Args:
+            subreddit (str): Name of the subreddit.
+            limit (int): Maximum number of articles to get. None for no maximum.
+            max_age (float): Maximum age in hours of articles to get. None for no maximum.
+            min_score (int): Minimum score of articles to get. None for no minimum.
+            min_duration (int): Minimum duration of videos in seconds. None for no minimum.
+            max_duration (int): Maximum duration of videos in seconds. None for no maximum.
+            include_nsfw (bool): Whether to include articles labeled as not safe for work.
+
+        Returns:
+            list: `IndexedPost`s in descending order by score.
+        """
+        query = "SELECT {} FROM posts WHERE subreddit = ? AND used_at IS NULL".format(
+            ", ".join(IndexedPost._fields)
+        )
+        params = [subreddit.lower()]
+        if max_age is not None:
+            query += " AND created_utc >= ?"
+            params.append(datetime.now().timestamp() - max_age * 60 * 60)
+        if min_score is not None:
+            query += " AND score >= ?"
+            params.append(min_score)
+        if min_duration is not None:
+            query += " AND duration >= ?"
+            params.append(min_duration)
+        if max_duration is not None:
+            query += " AND duration <= ?"
+            params.append(max_duration)
+        if not include_nsfw:
+            query += " AND NOT nsfw"
+        query += " ORDER BY score DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        posts = []
+        for row in self._conn.execute(query, params):
+            post = IndexedPost(*row)
+            has_audio = None if post.has_audio is None else bool(post.has_audio)
+            posts.append(post._replace(nsfw=bool(post.nsfw), has_audio=has_audio))
+        return posts
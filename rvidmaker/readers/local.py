@@ -0,0 +1,83 @@
+"""Provides functions for reading videos staged on the local file system"""
+
+import os
+import toml
+from toml import TomlDecodeError
+
+from rvidmaker.videos import LocalVideoRef
+
+# Extensions of files treated as videos when reading a directory.
+VIDEO_EXTENSIONS = (".mp4", ".mkv", ".mov", ".webm", ".avi")
+
+
+class LocalManifestException(Exception):
+    """Raised when a manifest cannot be read"""
+
+
+def read_directory(directory, recursive=False):
+    """
+    Reads every video in a directory. Each video's title, author and duration are read from its
+    sidecar file, if it has one (see `rvidmaker.videos.LocalVideoRef`).
+
+    Args:
+        directory (str): Directory to read.
+        recursive (bool): Whether to also read videos in subdirectories.
+
+    Returns:
+        list: `LocalVideoRef`s for each video, in order of their paths.
+    """
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        if not recursive:
+            dirs.clear()
+        for name in files:
+            if os.path.splitext(name)[1].lower() in VIDEO_EXTENSIONS:
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return [LocalVideoRef(path) for path in paths]
+
+
+def read_manifest(path):
+    """
+    Reads videos listed in a TOML manifest. Each entry of the manifest's "video" array must
+    have a "path", relative to the manifest, and may have a "title", "author" and "duration".
+    Anything not given is read from the video's sidecar file.
+
+    Args:
+        path (str): Path to the manifest.
+
+    Returns:
+        list: `LocalVideoRef`s for each video, in the order they are listed.
+
+    Raises:
+        LocalManifestException: If the manifest is invalid or lists a missing video.
+    """
+    try:
+        data = toml.load(path)
+    except (OSError, TomlDecodeError) as e:
+        raise LocalManifestException('Failed to read "{}": {}'.format(path, e))
+    entries = data.get("video", [])
+    if type(entries) != list:
+        raise LocalManifestException(
+            'Invalid manifest "{}": "video" must be an array of tables'.format(path)
+        )
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    videos = []
+    for entry in entries:
+        if type(entry) != dict or type(entry.get("path")) != str:
+            raise LocalManifestException(
+                'Invalid manifest "{}": every video needs a "path"'.format(path)
+            )
+        video_path = os.path.join(base_dir, entry["path"])
+        if not os.path.isfile(video_path):
+            raise LocalManifestException('"{}" is not a file'.format(video_path))
+        videos.append(
+            LocalVideoRef(
+                video_path,
+                title=entry.get("title"),
+                author=entry.get("author"),
+                duration=entry.get("duration"),
+            )
+        )
+    return videos
@@ -1,19 +1,27 @@
 """Provides objects for parsing subreddits articles"""
 
-from copy import copy
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import heapq
 import os
 import praw
 import requests
 import toml
 from urllib.parse import urljoin, urlsplit, urlunsplit
 
+from rvidmaker.session import get_session, TIMEOUT
 from rvidmaker.utils import random_string
 from rvidmaker.videos import RedditVideoRef
+from .index import IndexedPost
 
 CONFIG_PATH = "reddit_api_config.toml"
 USER_AGENT = "rvidmaker 0.0.1"
 VALID_TIME_FILTERS = ("all", "day", "hour", "month", "week", "year")
+# Default maximum number of "load more comments" links followed when loading comments.
+MORE_COMMENTS_LIMIT = 8
+# Responses to a request for a video's audio that mean the video has no audio. Other errors,
+# such as rate limiting, say nothing about the audio.
+_NO_AUDIO_STATUS_CODES = (403, 404)
 
 
 class RedditConfigNotFound(Exception):
@@ -33,7 +41,7 @@ class RedditVideoNotFound(Exception):
 
 class RedditComment:
     """
-    Represents a comment to a Reddit article.
+    Represents a comment to a Reddit article. Comments are immutable.
 
     Attributes:
         author (str): Username of the comment's author. None for no author.
@@ -42,28 +50,34 @@ class RedditComment:
         text (int): Body of the comment.
     """
 
-    def __init__(self, author, text, score):
+    __slots__ = ("_author", "_text", "_score", "_child")
+
+    def __init__(self, author, text, score, child=None):
         """
         Args:
             author (str): Username of the comment's author. None for no author.
             text (str): Body of the comment.
             score (int): Score of the comment.
+            child (RedditComment): The child comment. None if no child.
         """
         self._author = author
         self._text = text
         self._score = score
-        self._child = None
+        self._child = child
 
     @staticmethod
-    def from_praw(praw_comment):
+    def from_praw(praw_comment, child=None):
         """
         Args:
             praw_comment (praw.models.reddit.comment.Comment): PRAW generated comment.
+            child (RedditComment): The child comment. None if no child.
         """
         author = praw_comment.author
+        if author is not None:
+            author = author.name
         text = praw_comment.body
         score = praw_comment.score
-        return RedditComment(author, text, score)
+        return RedditComment(author, text, score, child)
 
     @property
     def author(self):
@@ -71,11 +85,7 @@ class RedditComment:
 
     @property
     def child(self):
-        return copy(self._child)
-
-    @child.setter
-    def child(self, child):
-        self._child = child
+        return self._child
 
     @property
     def score(self):
@@ -86,9 +96,41 @@ class RedditComment:
         return self._text
 
 
+def _media_has_video(media, min_duration=None, max_duration=None, include_youtube=True):
+    """
+    Checks if the media of an article has a video that can be scraped. Works on raw PRAW
+    submissions as well as `RedditArticle`s.
+
+    Args:
+        media (dict): Media of the article. None for no media.
+        min_duration (int): Minimum duration of video in seconds. None for no minimum.
+        max_duration (int): Maximum duration of video in seconds. None for no maximum.
+        include_youtube (bool): Whether to recognize YouTube videos.
+
+    Returns:
+        bool: True if the media has a valid video, and false otherwise.
+    """
+    if media is not None:
+        if "reddit_video" in media:
+            reddit_video = media["reddit_video"]
+            if not reddit_video["is_gif"]:
+                dur = reddit_video["duration"]
+                dur_valid = (max_duration is None or dur <= max_duration) and (
+                    min_duration is None or dur >= min_duration
+                )
+                if dur_valid:
+                    return True
+        elif "type" in media:
+            # TODO: Check the duration
+            if media["type"] == "youtube.com" and include_youtube:
+                return True
+    return False
+
+
 class RedditArticle:
     """
-    Represents a Reddit article.
+    Represents a Reddit article. Only the fields used are copied from PRAW, so articles hold on
+    to no PRAW objects until their comments are requested.
 
     Attributes:
         age (float): Hours since the article was posted.
@@ -98,29 +140,49 @@ class RedditArticle:
         nsfw (bool): Whether the articles is labeled as not safe for work.
         score (int): Score of the article.
         text (str): Body of the article.
+        title (str): Title of the article.
         url (str): HTTP/S URL for the article.
+        video_duration (float): Duration in seconds of the article's video, as reported by
+            Reddit. None if the article has no video hosted by Reddit.
     """
 
+    __slots__ = (
+        "_reddit",
+        "_submission",
+        "_title",
+        "_author",
+        "_text",
+        "_category",
+        "_id",
+        "_url",
+        "_score",
+        "_nsfw",
+        "_time_created",
+        "_media",
+    )
+
     def __init__(self, praw_article):
         """
         Args:
             praw_article (praw.models.reddit.submission.Submission): The original PRAW generated
-                article.
+                article. Not kept.
         """
-        self._article = praw_article
-        self.title = self._article.title
-        if self._article.author is not None:
-            self._author = self._article.author.name
+        # Used to fetch the article again if its comments are requested.
+        self._reddit = praw_article._reddit
+        self._submission = None
+        self._title = praw_article.title
+        if praw_article.author is not None:
+            self._author = praw_article.author.name
         else:
             self._author = None
-        self._text = self._article.selftext
-        self._category = self._article.category
-        self._id = self._article.id
-        self._url = self._article.url
-        self._score = self._article.score
-        self._nsfw = self._article.over_18
-        self._time_created = self._article.created_utc
-        self._media = self._article.media
+        self._text = praw_article.selftext
+        self._category = praw_article.category
+        self._id = praw_article.id
+        self._url = praw_article.url
+        self._score = praw_article.score
+        self._nsfw = praw_article.over_18
+        self._time_created = praw_article.created_utc
+        self._media = praw_article.media
 
     @property
     def age(self):
@@ -152,64 +214,107 @@ class RedditArticle:
     def text(self):
         return self._text
 
+    @property
+    def title(self):
+        return self._title
+
     @property
     def url(self):
         return self._url
 
-    def _expand_comment(self, comment, praw_comment, max_depth, percent_thres):
-        if max_depth <= 0:
-            return
+    @property
+    def video_duration(self):
+        if self._media is None or "reddit_video" not in self._media:
+            return None
+        return float(self._media["reddit_video"]["duration"])
 
-        # Get highest-scored reply
+    @staticmethod
+    def _best_reply(praw_comment, percent_thres):
+        """
+        Args:
+            praw_comment (praw.models.reddit.comment.Comment): The comment.
+            percent_thres (float): What proportion of the comment's score the reply must have.
+
+        Returns:
+            praw.models.reddit.comment.Comment/None: The highest-scored reply to the comment.
+                None if it has no replies or the best scores too low.
+        """
         best_reply = None
         for reply in praw_comment.replies:
             if not isinstance(reply, praw.models.reddit.comment.Comment):
                 continue
-            if best_reply is None:
+            if best_reply is None or reply.score > best_reply.score:
                 best_reply = reply
-            elif reply.score > best_reply.score:
-                best_reply = reply
-
-        if not best_reply is None:
-            if best_reply.score > comment.score * percent_thres:
-                child = RedditComment.from_praw(best_reply)
-                comment.child = child
-                self._expand_comment(child, best_reply, max_depth - 1, percent_thres)
-
-    def get_comments(self, max_comments=10, max_depth=2, percent_thres=0.5):
+        if best_reply is None or best_reply.score <= praw_comment.score * percent_thres:
+            return None
+        return best_reply
+
+    def get_comments(
+        self,
+        max_comments=10,
+        max_depth=2,
+        percent_thres=0.5,
+        more_limit=MORE_COMMENTS_LIMIT,
+    ):
         """
-        Gets the best comments.
+        Gets the best comments, each with a chain of its best replies. The comment tree is
+        loaded once, with the article being fetched from Reddit again the first time its
+        comments are requested. Chains are then expanded one level at a time from the already
+        loaded tree, so no more requests are made.
 
         Args:
             max_comments (int): Maximum number of comments to return.
             max_depth (int): Maximum depth of comments to expand to.
             percent_thres (float): What proportion of a parent comment's score a child comment must
                 have to be included.
+            more_limit (int): Maximum number of "load more comments" links to follow while
+                loading the tree, each costing a request. Comments behind links not followed
+                are left out. None to follow every link.
 
         Returns:
-            list: List of `RedditComment`s.
+            list: List of `RedditComment`s in descending order by score.
         """
         max_comments = max(1, max_comments)
         max_depth = max(0, max_depth)
         percent_thres = max(0, percent_thres)
 
-        # Sort comments by score (descending order)
-        praw_comments = []
-        for comment in self._article.comments:
-            if not isinstance(comment, praw.models.reddit.comment.Comment):
-                continue
-            praw_comments.append(comment)
-            praw_comments.sort(key=lambda x: x.score, reverse=True)
+        if self._submission is None:
+            self._submission = self._reddit.submission(id=self._id)
+            self._submission.comments.replace_more(limit=more_limit)
+
+        top = heapq.nlargest(
+            max_comments,
+            (
+                c
+                for c in self._submission.comments
+                if isinstance(c, praw.models.reddit.comment.Comment)
+                and c.author is not None
+                and c.body != "[deleted]"
+            ),
+            key=lambda c: c.score,
+        )
+
+        # Expand every chain one level at a time.
+        chains = [[c] for c in top]
+        growing = chains
+        for _ in range(max_depth):
+            next_growing = []
+            for chain in growing:
+                reply = self._best_reply(chain[-1], percent_thres)
+                if reply is not None:
+                    chain.append(reply)
+                    next_growing.append(chain)
+            growing = next_growing
+            if not growing:
+                break
 
-        cnt = 0
         comments = []
-        for praw_comment in praw_comments[:max_comments]:
-            comment = RedditComment.from_praw(praw_comment)
-            if comment.author is None or comment.text == "[deleted]":
-                continue
-            self._expand_comment(comment, praw_comment, max_depth, percent_thres)
+        for chain in chains:
+            # Comments are immutable, so each chain is built from its deepest reply up.
+            comment = None
+            for praw_comment in reversed(chain):
+                comment = RedditComment.from_praw(praw_comment, comment)
             comments.append(comment)
-
         return comments
 
     def has_video(self, min_duration=None, max_duration=None, include_youtube=True):
@@ -227,21 +332,9 @@ class RedditArticle:
         Returns:
             bool: True if the article has a valid video, and false otherwise.
         """
-        if self._media is not None:
-            if "reddit_video" in self._media:
-                reddit_video = self._media["reddit_video"]
-                if not reddit_video["is_gif"]:
-                    dur = reddit_video["duration"]
-                    dur_valid = (max_duration is None or dur <= max_duration) and (
-                        min_duration is None or dur >= min_duration
-                    )
-                    if dur_valid:
-                        return True
-            elif "type" in self._media:
-                # TODO: Check the duration
-                if self._media["type"] == "youtube.com" and include_youtube:
-                    return True
-        return False
+        return _media_has_video(
+            self._media, min_duration, max_duration, include_youtube
+        )
 
     def _get_random_path(self, root, ext):
         while True:
@@ -250,11 +343,66 @@ class RedditArticle:
             if not os.path.exists(path):
                 return path
 
-    def get_video(self):
+    def _get_media_urls(self):
+        """
+        Gets the URLs of a video hosted by Reddit. Assumes the article has such a video.
+
+        Returns:
+            (str, str, float): The video URL, the URL the audio would be at if the video has
+                audio, and the duration of the video in seconds.
+        """
+        reddit_video = self._media["reddit_video"]
+        duration = float(reddit_video["duration"])
+
+        # Get video and audio URLs
+        video_url = reddit_video["fallback_url"]
+        audio_url = list(urlsplit(video_url))
+        audio_url_path = audio_url[2]
+        audio_ext = os.path.splitext(audio_url_path)[1]
+        if audio_ext == ".mp4":
+            audio_basename = "DASH_audio.mp4"
+        else:
+            audio_basename = "audio"
+        audio_url[2] = urljoin(audio_url_path, audio_basename)
+        audio_url[3] = ""
+        audio_url[4] = ""
+        audio_url = urlunsplit(audio_url)
+        return video_url, audio_url, duration
+
+    def to_indexed(self, subreddit):
+        """
+        Gets a record of the article to store in a `PostIndex`. Assumes the article has a video
+        hosted by Reddit.
+
+        Args:
+            subreddit (str): Name of the subreddit the article was read from.
+
+        Returns:
+            IndexedPost: The record, with whether the video has audio unknown.
+        """
+        video_url, audio_url, duration = self._get_media_urls()
+        return IndexedPost(
+            id=self._id,
+            subreddit=subreddit,
+            title=self.title,
+            author=self._author,
+            score=self._score,
+            created_utc=self._time_created,
+            video_url=video_url,
+            audio_url=audio_url,
+            duration=duration,
+            nsfw=self._nsfw,
+            has_audio=None,
+        )
+
+    def get_video(self, has_audio=None):
         """
         Gets a video reference from an article. Assumes the article has a video.
         Use 'has_video' to check that the articles has a video that can be scraped.
 
+        Args:
+            has_audio (bool): Whether the video has audio. None to check with a request.
+
         Raises:
             RedditVideoNotFound: If no video is found for the article.
 
@@ -266,26 +414,11 @@ class RedditArticle:
 
         if "reddit_video" in self._media:
             # Scrape a video hosted by Reddit
-            reddit_video = self._media["reddit_video"]
-            duration = float(reddit_video["duration"])
-
-            # Get video and audio URLs
-            video_url = reddit_video["fallback_url"]
-            audio_url = list(urlsplit(video_url))
-            audio_url_path = audio_url[2]
-            audio_ext = os.path.splitext(audio_url_path)[1]
-            if audio_ext == ".mp4":
-                audio_basename = "DASH_audio.mp4"
-            else:
-                audio_basename = "audio"
-            audio_url[2] = urljoin(audio_url_path, audio_basename)
-            audio_url[3] = ""
-            audio_url[4] = ""
-            audio_url = urlunsplit(audio_url)
-
-            # Check if audio exists.
-            req = requests.head(audio_url)
-            if req.status_code != 200:
+            video_url, audio_url, duration = self._get_media_urls()
+            if has_audio is None:
+                has_audio = _audio_exists(audio_url)
+            # Audio that could not be checked is left out rather than failing the download.
+            if not has_audio:
                 audio_url = None
 
             return RedditVideoRef(
@@ -296,6 +429,155 @@ class RedditArticle:
             raise NotImplementedError
 
 
+def _audio_exists(audio_url):
+    """
+    Checks if audio exists for a video hosted by Reddit.
+
+    Args:
+        audio_url (str): URL the audio would be at.
+
+    Returns:
+        bool/None: True if the audio exists, and false if it does not. None if the request
+            failed without a definite answer, such as when Reddit is rate limiting requests.
+    """
+    try:
+        req = get_session().head(audio_url, timeout=TIMEOUT)
+    except requests.exceptions.RequestException:
+        return None
+    if req.status_code == 200:
+        return True
+    if req.status_code in _NO_AUDIO_STATUS_CODES:
+        return False
+    return None
+
+
+def get_videos(articles, max_workers=8):
+    """
+    Gets video references from many articles. Unlike calling `RedditArticle.get_video` on each
+    article, the requests checking whether each video has audio are made concurrently.
+
+    Args:
+        articles (list): `RedditArticle`s to get videos from. Each must have a video.
+        max_workers (int): Maximum number of concurrent requests.
+
+    Raises:
+        RedditVideoNotFound: If no video is found for an article.
+
+    Returns:
+        list: `VideoRef`s for each article, in the same order.
+    """
+    audio_urls = []
+    for art in articles:
+        if not art.has_video():
+            raise RedditVideoNotFound
+        if "reddit_video" in art._media:
+            audio_urls.append(art._get_media_urls()[1])
+        else:
+            audio_urls.append(None)
+
+    def check(audio_url):
+        return None if audio_url is None else bool(_audio_exists(audio_url))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        has_audio = list(pool.map(check, audio_urls))
+    return [art.get_video(has_audio=ha) for art, ha in zip(articles, has_audio)]
+
+
+def get_indexed_videos(posts, index, max_workers=8):
+    """
+    Gets video references from articles stored in an index. Only videos not yet known to have
+    audio or not are checked, concurrently, and the results are stored in the index. Videos
+    whose check fails are used without audio, and are checked again next time.
+
+    Args:
+        posts (list): `IndexedPost`s to get videos from.
+        index (PostIndex): Index the articles are stored in.
+        max_workers (int): Maximum number of concurrent requests.
+
+    Returns:
+        list: `VideoRef`s for each article, in the same order.
+    """
+    unknown = [p for p in posts if p.has_audio is None]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        checked = list(pool.map(lambda p: _audio_exists(p.audio_url), unknown))
+    has_audio = {}
+    for post, ha in zip(unknown, checked):
+        if ha is not None:
+            index.set_has_audio(post.id, ha)
+        has_audio[post.id] = ha
+
+    videos = []
+    for post in posts:
+        ha = has_audio.get(post.id, post.has_audio)
+        videos.append(
+            RedditVideoRef(
+                post.title,
+                post.author,
+                post.video_url,
+                post.audio_url if ha else None,
+                post.duration,
+            )
+        )
+    return videos
+
+
+def merge_by_score(ranked, weights=None):
+    """
+    Merges articles from several subreddits into one ranking. Each article's score is divided
+    by the highest score of its subreddit's articles and multiplied by the subreddit's weight,
+    so small subreddits are not drowned out by large ones.
+
+    Args:
+        ranked (dict): Articles from each subreddit, such as `RedditArticle`s or
+            `IndexedPost`s, keyed by subreddit name.
+        weights (dict): Weight of each subreddit, keyed by name. Subreddits not in it have a
+            weight of 1. None to weight every subreddit equally.
+
+    Returns:
+        list: `(float, str, article)` tuples of the normalized score, the subreddit and the
+            article, in descending order by normalized score.
+    """
+    merged = []
+    for subreddit, articles in ranked.items():
+        top = max((art.score for art in articles), default=0)
+        weight = 1 if weights is None else weights.get(subreddit, 1)
+        for art in articles:
+            norm = art.score / top * weight if top > 0 else 0
+            merged.append((norm, subreddit, art))
+    merged.sort(key=lambda m: m[0], reverse=True)
+    return merged
+
+
+def scan_subreddits(subreddits, max_workers=8, **kwargs):
+    """
+    Scans several subreddits for articles with videos concurrently (see
+    `RedditReader.scan_videos`). PRAW is not thread safe, so each subreddit is scanned with its
+    own `RedditReader`.
+
+    Args:
+        subreddits (list): Names of the subreddits.
+        max_workers (int): Maximum number of subreddits to scan at once.
+        **kwargs: Arguments for `RedditReader.scan_videos`. An index cannot be given, since
+            it cannot be shared between threads.
+
+    Raises:
+        RedditConfigNotFound: If no config file is found.
+        RedditApiException: If calls to the Reddit API fail.
+
+    Returns:
+        dict: Lists of `RedditArticle`s in descending order by score, keyed by subreddit name.
+    """
+
+    def scan(subreddit):
+        return list(RedditReader().scan_videos(subreddit, **kwargs))
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(subreddits)))
+    ) as pool:
+        results = list(pool.map(scan, subreddits))
+    return dict(zip(subreddits, results))
+
+
 class RedditReader:
     """Reads popular articles from a subreddit"""
 
@@ -333,6 +615,82 @@ class RedditReader:
             filtered.append(art)
         return filtered
 
+    def scan_videos(
+        self,
+        subreddit,
+        time_filter="all",
+        limit=None,
+        max_videos=None,
+        min_score=None,
+        min_age=None,
+        min_duration=None,
+        max_duration=None,
+        include_nsfw=False,
+        include_youtube=False,
+        index=None,
+    ):
+        """
+        Scans the top articles of a subreddit for articles with videos, in descending order by
+        score. Articles are checked on the raw listing as it is paged through, so only matching
+        articles are read into `RedditArticle`s, and no more pages are requested once enough
+        videos are found.
+
+        Args:
+            subreddit (str): Name of subreddit.
+            time_filter (str): One of "all", "day", "hour", "month", "week", "year".
+            limit (int): Maximum number of articles to scan where `limit` >= 1. If None, then
+                scan as many articles as possible.
+            max_videos (int): Stop once this many articles with videos are found. None to scan
+                every article.
+            min_score (int): Minimum score of articles to include. None for no minimum.
+            min_age (int): Minimum age in hours of articles to include. None for no minimum.
+            min_duration (int): Minimum duration of videos in seconds. None for no minimum.
+            max_duration (int): Maximum duration of videos in seconds. None for no maximum.
+            include_nsfw (bool): Whether to include articles labeled as not safe for work.
+            include_youtube (bool): Whether to include YouTube videos.
+            index (PostIndex): Index to add articles with videos hosted by Reddit to as they
+                are found. None to not index articles.
+
+        Raises:
+            RedditApiException: If calls to the Reddit API fail.
+
+        Yields:
+            RedditArticle: Each article with a matching video.
+        """
+        if time_filter not in VALID_TIME_FILTERS:
+            raise RedditApiException(
+                "time_filter must be one of {}".format(VALID_TIME_FILTERS)
+            )
+        limit = limit and max(1, limit) or None
+        if max_videos is not None and max_videos < 1:
+            return
+        # Articles created after this were posted less than `min_age` hours ago.
+        if min_age is not None:
+            max_created = datetime.now().timestamp() - min_age * 60 * 60
+        found = 0
+        try:
+            sub = self.reddit.subreddit(subreddit)
+            for raw in sub.top(time_filter=time_filter, limit=limit):
+                if min_score is not None and raw.score < min_score:
+                    continue
+                if min_age is not None and raw.created_utc > max_created:
+                    continue
+                if raw.over_18 and not include_nsfw:
+                    continue
+                if not _media_has_video(
+                    raw.media, min_duration, max_duration, include_youtube
+                ):
+                    continue
+                art = RedditArticle(raw)
+                if index is not None and "reddit_video" in raw.media:
+                    index.upsert([art.to_indexed(subreddit)])
+                yield art
+                found += 1
+                if max_videos is not None and found >= max_videos:
+                    return
+        except praw.exceptions.PRAWException as e:
+            raise RedditApiException(str(e))
+
     def get_hot_articles(self, subreddit, limit=10, min_score=None, min_age=None):
         """
         Gets a collection of popular (hot) articles from a subreddit.
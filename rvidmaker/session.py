@@ -0,0 +1,73 @@
+"""Provides a shared HTTP session for downloading media"""
+
+import requests
+from requests.adapters import HTTPAdapter
+import threading
+from urllib3.util.retry import Retry
+
+# Default number of connections kept alive per host. Matches the default number of download
+# workers in `rvidmaker.editor.VideoCompiler`, each of which downloads video and audio at once.
+POOL_SIZE = 8
+# Default maximum number of times to retry a request.
+MAX_RETRIES = 3
+# Default backoff factor between retries. Retries wait `BACKOFF_FACTOR * 2 ** (retry - 1)`
+# seconds, or as long as the server asks to with a Retry-After header.
+BACKOFF_FACTOR = 0.5
+# Responses with these status codes are retried.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Seconds to wait to connect and to wait between bytes received.
+TIMEOUT = (10, 60)
+
+_session = None
+_lock = threading.Lock()
+
+
+def _make_session(pool_size, max_retries, backoff_factor):
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        # Let callers handle the final response themselves.
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def configure_session(
+    pool_size=POOL_SIZE, max_retries=MAX_RETRIES, backoff_factor=BACKOFF_FACTOR
+):
+    """
+    Replaces the shared session with one using new settings. Use this when downloading with more
+    workers than `POOL_SIZE` allows for.
+
+    Args:
+        pool_size (int): Number of connections to keep alive per host.
+        max_retries (int): Maximum number of times to retry a request.
+        backoff_factor (float): Backoff factor between retries.
+    """
+    global _session
+    session = _make_session(pool_size, max_retries, backoff_factor)
+    # The old session is not closed since other threads may still be using it.
+    with _lock:
+        _session = session
+
+
+def get_session():
+    """
+    Gets the session shared by everything downloading media. Connections are kept alive and
+    reused across requests and threads, and failed requests are retried with backoff.
+
+    Returns:
+        requests.Session: The shared session.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _make_session(POOL_SIZE, MAX_RETRIES, BACKOFF_FACTOR)
+        return _session
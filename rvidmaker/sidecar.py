@@ -0,0 +1,44 @@
+"""Caches data derived from files in JSON files next to them"""
+
+import json
+
+
+def load_sidecar(path, size, record_type):
+    """
+    Reads data cached by `store_sidecar`.
+
+    Args:
+        path (str): Path to the sidecar.
+        size (int): Size in bytes of the file the data is derived from.
+        record_type (type): Named tuple type the data was cached as.
+
+    Returns:
+        tuple/None: The data as a `record_type`. None if nothing is cached, the sidecar cannot
+            be read, or the data was derived from a different version of the file.
+    """
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached["size"] == size:
+            return record_type(**cached["data"])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def store_sidecar(path, size, data):
+    """
+    Caches data derived from a file. The file's size is stored with it, so data derived from an
+    older version of the file is never read back. Failures are ignored, since the data can
+    always be derived again.
+
+    Args:
+        path (str): Path to the sidecar.
+        size (int): Size in bytes of the file the data is derived from.
+        data (tuple): The data as a named tuple.
+    """
+    try:
+        with open(path, "w") as f:
+            json.dump({"size": size, "data": data._asdict()}, f)
+    except OSError:
+        pass
@@ -28,10 +28,12 @@ class Suite:
         """
         raise NotImplementedError
 
-    def generate(self, output_dir):
+    def generate(self, output_dir, preview=False):
         """
         Args:
             output_dir: Directory to output generated files to.
+            preview (bool): Whether to quickly render a low quality preview instead of the final
+                video.
 
         Raises:
             SuiteConfigException: If generation fails.
@@ -5,13 +5,27 @@ import os
 import toml
 from toml import TomlDecodeError
 
-from rvidmaker.editor import VideoCompiler
-from rvidmaker.readers.reddit import RedditReader
+from rvidmaker.editor import (
+    ENCODER_PRESETS,
+    ENGINES,
+    RenderException,
+    VideoCompiler,
+)
+from rvidmaker.instrument import record_file, Recorder
+from rvidmaker.readers.index import PostIndex
+from rvidmaker.readers.reddit import (
+    get_indexed_videos,
+    get_videos,
+    merge_by_score,
+    scan_subreddits,
+)
 from rvidmaker.thumbnails import create_split_thumbnail
 from rvidmaker.uploaders import Payload
+from rvidmaker.videos import DownloadCache
 from rvidmaker.utils import (
     extract_tags,
     get_random_path,
+    select_within_budget,
     shorten_title,
     toml_get_and_check,
     TomlGetCheckException,
@@ -31,8 +45,31 @@ MAX_TITLE_LEN = 50
 MAX_THUMB_TITLE_LEN = 20
 # Directory to temporarily download videos from a subreddit to.
 TEMP_DIR = "/tmp/rvidmaker/reddit-video-comp/"
+# Default directory to cache downloaded videos in across runs.
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "rvidmaker", "videos")
+# Default maximum size of the download cache in megabytes.
+CACHE_SIZE_MB = 10000
+# Default encoder preset, from `rvidmaker.editor.ENCODER_PRESETS`. Slower, smaller encodes such
+# as "final" must be chosen in the profile.
+ENCODER_PRESET = "default"
+# Directory within the output directory to keep rendered clips in, so that rendering the
+# compilation again only renders clips that changed. Only used by the "prerender" engine.
+WORK_DIR = ".clips"
+# Default maximum size of the rendered clips kept in `WORK_DIR` in megabytes.
+WORK_DIR_SIZE_MB = 5000
 # Valid time frames in the TOML profile file.
 VALID_TIME_FRAMES = ("all", "day", "hour", "month", "week", "year")
+# Maximum age in hours of articles in each time frame. None for no maximum.
+TIME_FRAME_HOURS = {
+    "all": None,
+    "day": 24,
+    "hour": 1,
+    "month": 24 * 31,
+    "week": 24 * 7,
+    "year": 24 * 366,
+}
+# Default number of hours before the post index is refreshed from the subreddit.
+INDEX_REFRESH_HOURS = 6
 
 if not os.path.exists(TEMP_DIR):
     os.makedirs(TEMP_DIR)
@@ -45,6 +82,105 @@ class RedditVideoCompSuite(Suite):
 
     def __init__(self):
         self.configured = False
+        # IDs of indexed articles, keyed by the videos gathered from them.
+        self._post_ids = {}
+
+    @staticmethod
+    def _config_subreddits(profile):
+        """
+        Reads the subreddits to compile videos from. "subreddit" may be a single name or an
+        array of names, and "subreddit_weights" may weight some subreddits above others when
+        their videos are ranked together.
+
+        Args:
+            profile (dict): The "reddit.compilation" section of a profile.
+
+        Returns:
+            (list, dict): Names of the subreddits, and the weight of each keyed by name.
+
+        Raises:
+            SuiteConfigException: If the subreddits or weights are invalid.
+        """
+        subreddits = profile.get("subreddit")
+        if subreddits is None:
+            raise SuiteConfigException(
+                'Invalid TOML profile: The "subreddit" field is required'
+            )
+        if type(subreddits) == str:
+            subreddits = [subreddits]
+        if (
+            type(subreddits) != list
+            or len(subreddits) == 0
+            or any(type(sub) != str for sub in subreddits)
+        ):
+            raise SuiteConfigException(
+                'Invalid TOML profile: "subreddit" must be a string or an array of strings'
+            )
+
+        weights = profile.get("subreddit_weights", {})
+        if type(weights) != dict:
+            raise SuiteConfigException(
+                'Invalid TOML profile: "subreddit_weights" must be a table'
+            )
+        for sub, weight in weights.items():
+            if sub not in subreddits:
+                raise SuiteConfigException(
+                    'Invalid TOML profile: "{}" is weighted but not a subreddit'.format(
+                        sub
+                    )
+                )
+            if type(weight) not in (int, float) or weight <= 0:
+                raise SuiteConfigException(
+                    'Invalid TOML profile: weight of "{}" must be a positive number'.format(
+                        sub
+                    )
+                )
+        weights = {sub: weights.get(sub, 1) for sub in subreddits}
+        return subreddits, weights
+
+    @staticmethod
+    def _config_encoder(profile):
+        """
+        Reads encoder settings from the "encoder" section of a profile. The section picks one of
+        `rvidmaker.editor.ENCODER_PRESETS` with "preset", and may override any of its settings.
+
+        Args:
+            profile (dict): The "reddit.compilation" section of a profile.
+
+        Returns:
+            rvidmaker.editor.EncoderSettings: The encoder settings.
+
+        Raises:
+            SuiteConfigException: If the settings are invalid.
+        """
+        section = profile.get("encoder", {})
+        if type(section) != dict:
+            raise SuiteConfigException(
+                'Invalid TOML profile: "encoder" must be a table'
+            )
+        try:
+            preset = toml_get_and_check(section, "preset", str, default=ENCODER_PRESET)
+            overrides = {
+                "preset": toml_get_and_check(section, "x264_preset", str),
+                "crf": toml_get_and_check(section, "crf", int),
+                "tune": toml_get_and_check(section, "tune", str),
+                "max_bitrate": toml_get_and_check(section, "max_bitrate", int),
+                "buffer_size": toml_get_and_check(section, "buffer_size", int),
+                "gop": toml_get_and_check(section, "gop", int),
+            }
+        except TomlGetCheckException as e:
+            raise SuiteConfigException("Invalid TOML profile: {}".format(str(e)))
+        if preset not in ENCODER_PRESETS:
+            raise SuiteConfigException(
+                "Invalid TOML profile: encoder preset must be one of {}".format(
+                    tuple(ENCODER_PRESETS)
+                )
+            )
+        overrides = {k: v for k, v in overrides.items() if v is not None}
+        try:
+            return ENCODER_PRESETS[preset].replace(**overrides)
+        except ValueError as e:
+            raise SuiteConfigException("Invalid TOML profile: {}".format(str(e)))
 
     def config(self, profile_path, censor=None, blocker=None):
         if not os.path.isfile(profile_path):
@@ -61,10 +197,8 @@ class RedditVideoCompSuite(Suite):
                 '"{}" has no "reddit.compilation" section'.format(profile_path)
             )
         profile = data["reddit"]["compilation"]
+        self._subreddits, self._subreddit_weights = self._config_subreddits(profile)
         try:
-            self._subreddit = toml_get_and_check(
-                profile, "subreddit", str, required=True
-            )
             self._default_title = toml_get_and_check(
                 profile, "default_title", str, required=True
             )
@@ -77,6 +211,7 @@ class RedditVideoCompSuite(Suite):
             self._clip_limit = toml_get_and_check(
                 profile, "clip_limit", int, default=50
             )
+            self._target_dur = toml_get_and_check(profile, "target_duration", int)
             self._res = toml_get_and_check(
                 profile, "resolution", list, int, default=[1920, 1080]
             )
@@ -89,6 +224,20 @@ class RedditVideoCompSuite(Suite):
             self._default_tags = toml_get_and_check(
                 profile, "default_tags", list, str, default=list()
             )
+            self._engine = toml_get_and_check(
+                profile, "render_engine", str, default="moviepy"
+            )
+            cache_dir = toml_get_and_check(profile, "cache_dir", str, default=CACHE_DIR)
+            cache_size = toml_get_and_check(
+                profile, "cache_size", int, default=CACHE_SIZE_MB
+            )
+            self._clip_cache_size = toml_get_and_check(
+                profile, "clip_cache_size", int, default=WORK_DIR_SIZE_MB
+            )
+            index_path = toml_get_and_check(profile, "index_path", str)
+            self._index_refresh = toml_get_and_check(
+                profile, "index_refresh", int, default=INDEX_REFRESH_HOURS
+            )
         except TomlGetCheckException as e:
             raise SuiteConfigException("Invalid TOML profile: {}".format(str(e)))
 
@@ -98,6 +247,28 @@ class RedditVideoCompSuite(Suite):
                     VALID_TIME_FRAMES
                 )
             )
+        if self._target_dur is not None and self._target_dur <= 0:
+            raise SuiteConfigException(
+                "Invalid TOML profile: target_duration must be positive"
+            )
+        if self._engine not in ENGINES:
+            raise SuiteConfigException(
+                "Invalid TOML profile: render_engine must be one of {}".format(ENGINES)
+            )
+
+        self._encoder = self._config_encoder(profile)
+
+        # Without an index, the subreddit is scanned on every run.
+        if index_path is not None:
+            self._index = PostIndex(os.path.expanduser(index_path))
+        else:
+            self._index = None
+
+        # A cache size of 0 disables the cache.
+        if cache_size > 0:
+            self._cache = DownloadCache(cache_dir, cache_size * 1000000)
+        else:
+            self._cache = None
 
         if self._censor_video and censor is None:
             raise SuiteConfigException("Profile requires a censor for the video")
@@ -113,31 +284,139 @@ class RedditVideoCompSuite(Suite):
 
     def _get_videos_from_reddit(self):
         """
-        Gets videos from a subreddit.
+        Gets videos from the subreddits. Videos from different subreddits are ranked together by
+        normalized score (see `rvidmaker.readers.reddit.merge_by_score`).
 
         Returns:
-            list: List of `rvidmaker.videos.VideoRef` in ascending order of score.
+            list: List of `rvidmaker.videos.VideoRef` in descending order of normalized score.
         """
-        reader = RedditReader()
-        articles = reader.get_top_articles(
-            self._subreddit,
+        if self._index is not None:
+            return self._get_videos_from_index()
+        # A target duration is filled from every candidate, not just the first few.
+        max_videos = self._clip_limit if self._target_dur is None else None
+        ranked = scan_subreddits(
+            self._subreddits,
             time_filter=self._time_frame,
             limit=ARTICLE_LIMIT,
+            max_videos=max_videos,
             min_score=self._min_score,
+            min_duration=self._min_clip_dur,
+            max_duration=self._max_clip_dur,
         )
-        videos = []
-        for art in articles:
-            if not art.nsfw and art.has_video(
+        candidates = self._rank(ranked, lambda art: art.video_duration)
+        # Check which videos have audio all at once.
+        return get_videos(candidates)
+
+    def _get_videos_from_index(self):
+        """
+        Gets unused videos from the post index. Subreddits whose index was last refreshed more
+        than `index_refresh` hours ago are refreshed first.
+
+        Returns:
+            list: List of `rvidmaker.videos.VideoRef` in descending order of normalized score.
+        """
+        stale = []
+        for sub in self._subreddits:
+            age = self._index.scan_age(sub, self._time_frame)
+            if age is None or age >= self._index_refresh:
+                stale.append(sub)
+        if len(stale) > 0:
+            print(
+                "Refreshing index of {}...".format(
+                    ", ".join("r/{}".format(sub) for sub in stale)
+                )
+            )
+            # Index every article with a video. Filters are applied when querying the index.
+            scanned = scan_subreddits(
+                stale,
+                time_filter=self._time_frame,
+                limit=ARTICLE_LIMIT,
+                include_nsfw=True,
+            )
+            # The index is only used from this thread.
+            for sub, articles in scanned.items():
+                self._index.upsert([art.to_indexed(sub) for art in articles])
+                self._index.mark_scanned(sub, self._time_frame)
+
+        ranked = {}
+        for sub in self._subreddits:
+            ranked[sub] = self._index.top_unused(
+                sub,
+                limit=self._clip_limit if self._target_dur is None else None,
+                max_age=TIME_FRAME_HOURS[self._time_frame],
+                min_score=self._min_score,
                 min_duration=self._min_clip_dur,
                 max_duration=self._max_clip_dur,
-                include_youtube=False,
-            ):
-                videos.append(art.get_video())
-                if self._clip_limit is not None:
-                    if len(videos) >= self._clip_limit:
-                        break
+            )
+        posts = self._rank(ranked, lambda post: post.duration)
+        # Only videos not checked by an earlier run are checked for audio.
+        videos = get_indexed_videos(posts, self._index)
+        self._post_ids = {v: p.id for v, p in zip(videos, posts)}
         return videos
 
+    def _rank(self, ranked, duration):
+        """
+        Merges candidates from every subreddit and picks the ones to compile: the best
+        `clip_limit` candidates, or those that best fill the target duration if one is set.
+
+        Args:
+            ranked (dict): Articles with videos hosted by Reddit from each subreddit, as
+                `RedditArticle`s or `IndexedPost`s, keyed by subreddit name.
+            duration (callable): Gets the duration in seconds of a candidate's video.
+
+        Returns:
+            list: The picked candidates, in descending order of normalized score.
+        """
+        merged = merge_by_score(ranked, self._subreddit_weights)
+        if self._target_dur is not None:
+            return self._select_within_target(
+                [c for _, _, c in merged],
+                [duration(c) for _, _, c in merged],
+                [norm for norm, _, _ in merged],
+            )
+        if self._clip_limit is not None:
+            merged = merged[: self._clip_limit]
+        return [c for _, _, c in merged]
+
+    def _select_within_target(self, candidates, durations, scores):
+        """
+        Picks the candidates with the greatest total score whose videos fit within the target
+        duration, using the durations Reddit reports so no video is downloaded. Candidates
+        whose duration is unknown are skipped. If more than `clip_limit` candidates fit, the
+        highest-scored are kept.
+
+        Args:
+            candidates (list): Articles with videos hosted by Reddit, as `RedditArticle`s or
+                `IndexedPost`s.
+            durations (list): Duration in seconds of each candidate's video, None if unknown.
+            scores (list): Score of each candidate.
+
+        Returns:
+            list: The picked candidates, in the same order.
+        """
+        known = [i for i, dur in enumerate(durations) if dur is not None]
+        picked = select_within_budget(
+            [durations[i] for i in known], [scores[i] for i in known], self._target_dur
+        )
+        picked = [known[i] for i in picked]
+        if self._clip_limit is not None and len(picked) > self._clip_limit:
+            by_score = sorted(picked, key=lambda i: scores[i], reverse=True)
+            picked = sorted(by_score[: self._clip_limit])
+        total = sum(durations[i] for i in picked)
+        print(
+            "Picked {} of {} videos totaling {:.0f}s of {}s".format(
+                len(picked), len(candidates), total, self._target_dur
+            )
+        )
+        return [candidates[i] for i in picked]
+
+    def _subreddit_names(self):
+        """
+        Returns:
+            str: The subreddits, such as "r/videos, r/funny".
+        """
+        return ", ".join("r/{}".format(sub) for sub in self._subreddits)
+
     def _make_thumbnail(self, vid, title, output_path):
         """
         Creates a thumbnail from a single video.
@@ -148,7 +427,11 @@ class RedditVideoCompSuite(Suite):
             output_path (str): Path to write the thumbnail to.
         """
         short_title = shorten_title(title, MAX_THUMB_TITLE_LEN)
-        temp_vid_dl = vid.download(get_random_path(TEMP_DIR))
+        # The video was likely cached when the compilation was rendered.
+        if self._cache is None:
+            temp_vid_dl = vid.download(get_random_path(TEMP_DIR))
+        else:
+            temp_vid_dl = self._cache.fetch(vid, get_random_path(TEMP_DIR))
         thumb = create_split_thumbnail(temp_vid_dl, short_title)
         thumb.save(output_path)
         os.remove(temp_vid_dl)
@@ -198,7 +481,7 @@ class RedditVideoCompSuite(Suite):
         tags.extend(extra_tags)
         return tags
 
-    def generate(self, output_dir):
+    def generate(self, output_dir, preview=False):
         if not self.configured:
             raise SuiteGenerateException("Suite not configured yet")
         if not os.path.exists(output_dir):
@@ -211,12 +494,18 @@ class RedditVideoCompSuite(Suite):
         elif not os.path.isdir(output_dir):
             raise SuiteGenerateException('"{}" is not a directory'.format(output_dir))
 
+        # Previews are named differently so they are not uploaded by mistake.
+        name = "preview" if preview else "payload"
         payload = Payload()
-        payload.video = "video.mp4"
-        payload.thumb = "thumbnail.png"
+        payload.video = "preview.mp4" if preview else "video.mp4"
+        payload.thumb = "preview-thumbnail.png" if preview else "thumbnail.png"
 
-        print("Scaping subreddit r/{} for videos...".format(self._subreddit))
-        videos = self._get_videos_from_reddit()
+        # Records the time and resources each stage uses.
+        recorder = Recorder()
+
+        print("Scaping {} for videos...".format(self._subreddit_names()))
+        with recorder.stage("scrape"):
+            videos = self._get_videos_from_reddit()
         if len(videos) < 2:
             print("Not enough videos gathered for a compilation")
             return
@@ -224,48 +513,83 @@ class RedditVideoCompSuite(Suite):
         print("Rendering compilation of {} videos...".format(len(videos)))
         video_path = os.path.join(output_dir, payload.video)
         censor = self._censor_video and self._censor or None
-        compiler = VideoCompiler(censor=censor)
+        compiler = VideoCompiler(censor=censor, cache=self._cache, recorder=recorder)
         for v in videos:
             compiler.add_video(v)
-        manifest = compiler.render_video(self._res, video_path)
+        render_args = {}
+        if self._engine == "prerender":
+            render_args["work_dir"] = os.path.join(output_dir, WORK_DIR)
+            render_args["max_work_dir_bytes"] = self._clip_cache_size * 1000000
+        try:
+            with recorder.stage("render"):
+                manifest = compiler.render_video(
+                    self._res,
+                    video_path,
+                    engine=self._engine,
+                    encoder=self._encoder,
+                    preview=preview,
+                    **render_args
+                )
+        except RenderException as e:
+            raise SuiteGenerateException("Failed to render video: {}".format(e))
         used_videos = [entry.video for entry in manifest]
 
         print("Creating title...")
-        # Find a video to use for out title and thumbnail.
-        title_video = None
-        for v in used_videos:
-            if self._censor_metadata:
-                if self._blocker.contains_profanity(v.title):
-                    continue
-            title_video = v
-            break
-        if title_video is None:
-            primary_title = self._default_title
-            print("No appropriate video found. Using default title")
-        else:
-            primary_title = shorten_title(v.title, MAX_TITLE_LEN).title()
-            print('Using video "{}" for title'.format(primary_title))
-        payload.title = "{} | r/{}".format(primary_title, self._subreddit)
+        with recorder.stage("title"):
+            # Find a video to use for out title and thumbnail.
+            title_video = None
+            for v in used_videos:
+                if self._censor_metadata:
+                    if self._blocker.contains_profanity(v.title):
+                        continue
+                title_video = v
+                break
+            if title_video is None:
+                primary_title = self._default_title
+                print("No appropriate video found. Using default title")
+            else:
+                primary_title = shorten_title(v.title, MAX_TITLE_LEN).title()
+                print('Using video "{}" for title'.format(primary_title))
+            payload.title = "{} | {}".format(primary_title, self._subreddit_names())
 
         print("Creating description...")
-        desc = self._make_description(
-            "Subscribe for more video compilations!",
-            manifest,
-        )
-        payload.desc = desc
+        with recorder.stage("description"):
+            desc = self._make_description(
+                "Subscribe for more video compilations!",
+                manifest,
+            )
+            payload.desc = desc
 
         print("Creating tags...")
-        payload.tags = self._make_tags(used_videos)
+        with recorder.stage("tags"):
+            payload.tags = self._make_tags(used_videos)
 
         # Create our thumbnail using the top-scored video with no words or phrases in the blocklist.
         print("Creating thumbnail...")
         thumb_path = os.path.join(output_dir, payload.thumb)
-        # No video had a safe title. Use a default title on top of a thumbnail of the first video.
-        if title_video is None:
-            # Use the first video with the subreddit overlayed.
-            self._make_thumbnail(used_videos[0], self._subreddit, thumb_path)
-        else:
-            self._make_thumbnail(title_video, title_video.title, thumb_path)
+        with recorder.stage("thumbnail"):
+            # No video had a safe title. Use a default title on top of a thumbnail of the first
+            # video.
+            if title_video is None:
+                # Use the first video with the subreddit overlayed.
+                self._make_thumbnail(used_videos[0], self._subreddits[0], thumb_path)
+            else:
+                self._make_thumbnail(title_video, title_video.title, thumb_path)
+            record_file(thumb_path)
+
+        payload_path = os.path.join(output_dir, "{}.toml".format(name))
+        with recorder.stage("payload"):
+            payload.dump(payload_path)
+            record_file(payload_path)
+
+        # Previews do not use up videos, since the compilation is not final.
+        if self._index is not None and not preview:
+            self._index.mark_used(
+                [self._post_ids[v] for v in used_videos if v in self._post_ids]
+            )
 
-        payload_path = os.path.join(output_dir, "payload.toml")
-        payload.dump(payload_path)
+        # Report the time and resources each stage used.
+        report_name = "preview-report.json" if preview else "report.json"
+        report_path = os.path.join(output_dir, report_name)
+        recorder.dump(report_path)
+        print('Wrote timings to "{}"'.format(report_path))
@@ -1,4 +1,5 @@
 from bisect import insort
+import math
 import os
 from rake_nltk import Rake
 import random
@@ -178,6 +179,45 @@ def extract_tags(
     return tags
 
 
+def select_within_budget(weights, values, budget):
+    """
+    Picks the items with the greatest total value whose total weight fits within a budget
+    (the 0/1 knapsack problem). Weights are rounded up to whole numbers, so the budget is never
+    exceeded. Items without a positive value are never picked.
+
+    Args:
+        weights (list): Weight of each item, such as its duration. Must not be negative.
+        values (list): Value of each item, such as its score.
+        budget (float): Maximum total weight.
+
+    Returns:
+        list: Indices of the picked items, in ascending order.
+    """
+    capacity = int(budget)
+    int_weights = [math.ceil(w) for w in weights]
+    # best[c] is the greatest value of the items considered so far with a total weight of at
+    # most c. Rows of `taken` record whether each item is in the best set for each weight.
+    best = [0] * (capacity + 1)
+    taken = []
+    for w, v in zip(int_weights, values):
+        row = [False] * (capacity + 1)
+        if v > 0:
+            for c in range(capacity, w - 1, -1):
+                if best[c - w] + v > best[c]:
+                    best[c] = best[c - w] + v
+                    row[c] = True
+        taken.append(row)
+
+    picked = []
+    c = capacity
+    for i in reversed(range(len(taken))):
+        if taken[i][c]:
+            picked.append(i)
+            c -= int_weights[i]
+    picked.reverse()
+    return picked
+
+
 class TomlGetCheckException(Exception):
     """Raised when TOML value type checks fail"""
 
@@ -1,2 +1,5 @@
 from .interface import DownloadException, VideoRef
+from .cache import DownloadCache
+from .local import LocalVideoRef
+from .probe import ProbeException, ProbeInfo
 from .reddit import RedditVideoRef
@@ -0,0 +1,257 @@
+"""Implements a persistent on-disk cache of downloaded videos"""
+
+from glob import glob
+import hashlib
+import os
+import shutil
+import threading
+
+# Directory within the cache for data derived from cached videos.
+_SIDECAR_DIR = "sidecars"
+# Suffix of directories that videos are downloaded into before being added to the cache.
+_PART_SUFFIX = ".part"
+# Name of the sidecar whose modification time records when a cached video was last used.
+_USED_SIDECAR = "used"
+
+
+class DownloadCache:
+    """
+    Caches downloaded videos on disk, keyed by the content they reference (see
+    `VideoRef.cache_key`). When the cache grows past its maximum size, the least recently used
+    videos are evicted. Safe to use from multiple threads.
+
+    Attributes:
+        root (str): Directory cached videos are stored in.
+        max_bytes (int): Maximum total size of cached videos in bytes.
+    """
+
+    def __init__(self, root, max_bytes):
+        """
+        Args:
+            root (str): Directory to store cached videos in. Created if it does not exist.
+            max_bytes (int): Maximum total size of cached videos in bytes. The most recently
+                used video is always kept, even if it alone is larger than this.
+        """
+        self._root = root
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def _key_lock(self, digest):
+        """
+        Returns:
+            threading.Lock: Lock held while a video is looked up or downloaded, so the same video
+                is never downloaded by two threads at once.
+        """
+        with self._lock:
+            if digest not in self._key_locks:
+                self._key_locks[digest] = threading.Lock()
+            return self._key_locks[digest]
+
+    @staticmethod
+    def _digest(video):
+        """
+        Returns:
+            str: Name cached files for a video are stored under.
+
+        Raises:
+            ValueError: If the video has no cache key.
+        """
+        key = video.cache_key
+        if key is None:
+            raise ValueError("Video has no cache key")
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _find(self, digest):
+        """
+        Returns:
+            str/None: Path to the cached video, `None` if it is not cached.
+        """
+        for path in glob(os.path.join(self._root, digest + ".*")):
+            if not path.endswith(_PART_SUFFIX):
+                return path
+        return None
+
+    def _used_path(self, digest):
+        """
+        Returns:
+            str: Path to the sidecar recording when a cached video was last used.
+        """
+        return os.path.join(
+            self._root, _SIDECAR_DIR, "{}.{}".format(digest, _USED_SIDECAR)
+        )
+
+    def _mark_used(self, digest):
+        """
+        Records that a cached video was just used. The time is kept in a sidecar rather than on
+        the video itself, since a cached video may be a hard link to a file outside the cache
+        whose times must not change.
+        """
+        used_path = self._used_path(digest)
+        os.makedirs(os.path.dirname(used_path), exist_ok=True)
+        with open(used_path, "a"):
+            pass
+        os.utime(used_path)
+
+    def _entries(self):
+        """
+        Returns:
+            list: Cached videos as `(float, int, str)` tuples of their last use time, size and
+                path, with the least recently used first.
+        """
+        entries = []
+        for entry in os.scandir(self._root):
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+            digest = os.path.splitext(entry.name)[0]
+            try:
+                used = os.path.getmtime(self._used_path(digest))
+            except OSError:
+                used = stat.st_mtime
+            entries.append((used, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def _evict(self, keep):
+        """
+        Deletes the least recently used videos until the cache fits within its maximum size.
+        Videos whose key lock is held are never deleted, since they are being placed elsewhere.
+
+        Args:
+            keep (str): Path to a cached video to never delete.
+        """
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self._max_bytes:
+                    break
+                if path == keep:
+                    continue
+                digest = os.path.splitext(os.path.basename(path))[0]
+                key_lock = self._key_locks.get(digest)
+                if key_lock is not None and key_lock.locked():
+                    continue
+                sidecars = glob(os.path.join(self._root, _SIDECAR_DIR, digest + ".*"))
+                for remove_path in [path] + sidecars:
+                    try:
+                        os.remove(remove_path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+    def _get_locked(self, video, digest):
+        """
+        Gets a video from the cache, downloading it into the cache if it is not there yet. The
+        video's key lock must be held.
+
+        Returns:
+            str: Path to the cached video.
+
+        Raises:
+            DownloadException: If downloading the video fails.
+        """
+        path = self._find(digest)
+        if path is not None:
+            self._mark_used(digest)
+            return path
+
+        # Download into a separate directory so an unfinished download is never mistaken
+        # for a cached video.
+        part_dir = os.path.join(self._root, digest + _PART_SUFFIX)
+        if not os.path.exists(part_dir):
+            os.mkdir(part_dir)
+        # The directory is kept if the download fails so that videos which support resuming
+        # can pick up where they left off.
+        part_path = video.download(os.path.join(part_dir, "video"))
+        ext = os.path.splitext(part_path)[1]
+        path = os.path.join(self._root, digest + ext)
+        os.replace(part_path, path)
+        shutil.rmtree(part_dir, ignore_errors=True)
+        self._mark_used(digest)
+        return path
+
+    def get(self, video):
+        """
+        Gets a video from the cache, downloading it into the cache if it is not there yet.
+
+        Args:
+            video (VideoRef): Video to get. Must have a cache key.
+
+        Returns:
+            str: Path to the cached video. It may be evicted by later calls, so use `fetch` to
+                place it elsewhere if it is needed for long.
+
+        Raises:
+            DownloadException: If downloading the video fails.
+            ValueError: If the video has no cache key.
+        """
+        digest = self._digest(video)
+        with self._key_lock(digest):
+            path = self._get_locked(video, digest)
+        self._evict(path)
+        return path
+
+    def fetch(self, video, output_path):
+        """
+        Places a video at a path, from the cache if possible. The video is hard linked from the
+        cache when possible to avoid copying it. Videos without a cache key are downloaded
+        directly.
+
+        Args:
+            video (VideoRef): Video to fetch.
+            output_path (str): Path to place the video at. The extension may be changed.
+
+        Returns:
+            str: Path the video is placed at. Extension may differ from `output_path`.
+
+        Raises:
+            DownloadException: If downloading the video fails.
+        """
+        if video.cache_key is None:
+            return video.download(output_path)
+        digest = self._digest(video)
+        # The video is placed while its key lock is held so that it cannot be evicted first.
+        with self._key_lock(digest):
+            path = self._get_locked(video, digest)
+            base = os.path.splitext(output_path)[0]
+            output_path = base + os.path.splitext(path)[1]
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            try:
+                os.link(path, output_path)
+            except OSError:
+                shutil.copyfile(path, output_path)
+        self._evict(path)
+        return output_path
+
+    def sidecar_path(self, video, name):
+        """
+        Gets a path to store data derived from a cached video at, such as analysis results.
+        The data is deleted when the video is evicted.
+
+        Args:
+            video (VideoRef): Video the data is derived from. Must have a cache key.
+            name (str): Name of the data, unique for each kind of data.
+
+        Returns:
+            str: Path to store the data at.
+
+        Raises:
+            ValueError: If the video has no cache key.
+        """
+        sidecar_dir = os.path.join(self._root, _SIDECAR_DIR)
+        if not os.path.exists(sidecar_dir):
+            os.makedirs(sidecar_dir, exist_ok=True)
+        return os.path.join(sidecar_dir, "{}.{}".format(self._digest(video), name))
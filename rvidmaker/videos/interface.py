@@ -1,5 +1,7 @@
 """Provides an interface for references to remote videos"""
 
+from .probe import probe_cached
+
 
 class DownloadException(Exception):
     """Raised when downloading a video fails"""
@@ -13,8 +15,15 @@ class VideoRef:
         title (str): Title of the video.
         author (str): Author of the video.
         duration (float): Duration of a video in seconds. None if the duration is not known.
+        info (ProbeInfo): Stream information of the video, such as its size and whether it has
+            audio. None until the video is probed (see `probe`).
+        cache_key (str): Identifies the content of the video, such that videos with the same key
+            download identical files. None if the video cannot be cached.
     """
 
+    # Set by `probe`.
+    _info = None
+
     def download(self, output_path):
         """
         Downloads the referenced video.
@@ -32,6 +41,26 @@ class VideoRef:
         """
         raise NotImplementedError
 
+    def probe(self, path, cache_path=None):
+        """
+        Reads the stream information of a downloaded copy of the video with ffprobe, unless it
+        is already known. The information is kept as `info`.
+
+        Args:
+            path (str): Path the video is downloaded to.
+            cache_path (str): Path to cache the information at, so later copies of the video are
+                not probed again. None to cache it next to the downloaded video.
+
+        Returns:
+            ProbeInfo: The stream information.
+
+        Raises:
+            ProbeException: If the video cannot be probed.
+        """
+        if self._info is None:
+            self._info = probe_cached(path, cache_path)
+        return self._info
+
     @property
     def title(self):
         raise NotImplementedError
@@ -42,4 +71,14 @@ class VideoRef:
 
     @property
     def duration(self):
+        if self._info is None:
+            return None
+        return self._info.duration
+
+    @property
+    def info(self):
+        return self._info
+
+    @property
+    def cache_key(self):
         return None
@@ -0,0 +1,272 @@
+"""Implements a reference for videos stored on the local file system"""
+
+import os
+import shutil
+import threading
+import toml
+from toml import TomlDecodeError
+
+from .interface import DownloadException, VideoRef
+from .probe import probe as probe_video, ProbeException, ProbeInfo
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows. Videos are copied there instead of reflinked.
+    fcntl = None
+
+# Extension of the sidecar file holding a video's title, author, duration and stream information.
+SIDECAR_EXT = ".toml"
+# ioctl request that clones a file's extents into another file on Linux (FICLONE).
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """
+    Clones a file so both copies share storage until one is modified. Only supported on some
+    file systems, such as Btrfs and XFS.
+
+    Args:
+        src (str): Path to the file to clone.
+        dst (str): Path to write the clone to. Must not exist.
+
+    Raises:
+        OSError: If the file system cannot clone the file.
+    """
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform")
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def place_file(src, dst):
+    """
+    Places a file at a path without copying its data if possible. The file is hard linked, then
+    reflinked, and only copied if neither is supported.
+
+    Args:
+        src (str): Path to the file.
+        dst (str): Path to place the file at. Replaced if it exists.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return
+    except OSError:
+        pass
+    shutil.copyfile(src, dst)
+
+
+def sidecar_path(path):
+    """
+    Args:
+        path (str): Path to a video.
+
+    Returns:
+        str: Path to the sidecar file of the video.
+    """
+    return os.path.splitext(path)[0] + SIDECAR_EXT
+
+
+class LocalVideoRef(VideoRef):
+    """
+    References a video on the local file system. Downloading hard links or reflinks the video
+    instead of copying it when the file system allows it, so the original is never modified or
+    deleted.
+
+    Title, author and duration not given are read from a sidecar TOML file next to the video
+    (see `sidecar_path`) with "title", "author" and "duration" keys. The video is probed with
+    ffprobe the first time its stream information or a duration missing from both is needed,
+    and the results are saved to the sidecar under "probe" so it is only ever probed once.
+
+    Attributes:
+        path (str): Path to the video.
+        title (str): Title of the video. Defaults to the video's file name.
+        author (str): Author of the video. None if not known.
+        duration (float): Duration of the video in seconds. None if it cannot be read.
+        info (ProbeInfo): Stream information of the video. None if it cannot be read.
+        cache_key (str): The device, inode and size of the video. Its modification time is left
+            out, since linking the video into a cache shares it with the cached copy.
+    """
+
+    def __init__(self, path, title=None, author=None, duration=None):
+        """
+        Args:
+            path (str): Path to the video.
+            title (str): Title of the video. None to read it from the sidecar.
+            author (str): Author of the video. None to read it from the sidecar.
+            duration (float): Duration of the video in seconds. None to read it from the
+                sidecar, or probe it.
+
+        Raises:
+            DownloadException: If the video does not exist or its sidecar cannot be decoded.
+        """
+        if not os.path.isfile(path):
+            raise DownloadException('"{}" is not a file'.format(path))
+        self._path = os.path.abspath(path)
+        self._lock = threading.Lock()
+
+        sidecar = self._read_sidecar()
+        if title is None:
+            title = sidecar.get("title")
+        if author is None:
+            author = sidecar.get("author")
+        if duration is None:
+            duration = sidecar.get("duration")
+        if title is None:
+            title = os.path.splitext(os.path.basename(path))[0]
+        self._title = title
+        self._author = author
+        self._duration = None if duration is None else float(duration)
+        self._info = self._cached_info(sidecar.get("probe"))
+        self._probe_failed = False
+
+    def _read_sidecar(self):
+        """
+        Returns:
+            dict: Contents of the sidecar. Empty if there is no sidecar.
+
+        Raises:
+            DownloadException: If the sidecar cannot be decoded.
+        """
+        path = sidecar_path(self._path)
+        if not os.path.isfile(path):
+            return {}
+        try:
+            return toml.load(path)
+        except TomlDecodeError as e:
+            raise DownloadException('Failed to decode "{}": {}'.format(path, e))
+
+    def _cached_info(self, cached):
+        """
+        Args:
+            cached (dict): The "probe" table of the sidecar. None if there is none.
+
+        Returns:
+            ProbeInfo/None: Stream information saved in the sidecar. None if there is none, or
+                it was saved for a different version of the video.
+        """
+        try:
+            if cached["size"] == os.path.getsize(self._path):
+                # Unknown values are not saved.
+                fields = dict.fromkeys(ProbeInfo._fields)
+                fields.update(cached["info"])
+                return ProbeInfo(**fields)
+        except (OSError, KeyError, TypeError):
+            pass
+        return None
+
+    def _save_info(self):
+        """
+        Adds the stream information to the sidecar, creating it if needed. Read-only
+        directories are ignored, since the video can always be probed again.
+        """
+        path = sidecar_path(self._path)
+        try:
+            data = self._read_sidecar()
+        except DownloadException:
+            # Never overwrite a sidecar we cannot read.
+            return
+        data["probe"] = {
+            "size": os.path.getsize(self._path),
+            # TOML has no null, so unknown values are left out.
+            "info": {k: v for k, v in self._info._asdict().items() if v is not None},
+        }
+        part_path = path + ".part"
+        try:
+            with open(part_path, "w") as f:
+                toml.dump(data, f)
+            os.replace(part_path, path)
+        except OSError:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def probe(self, path=None, cache_path=None):
+        """
+        Reads the stream information of the video with ffprobe, unless it is already known.
+
+        Args:
+            path (str): Unused, since the original video is probed.
+            cache_path (str): Unused, since the information is saved to the sidecar.
+
+        Returns:
+            ProbeInfo: The stream information.
+
+        Raises:
+            ProbeException: If the video cannot be probed.
+        """
+        with self._lock:
+            if self._info is None:
+                self._info = probe_video(self._path)
+                self._save_info()
+            return self._info
+
+    def download(self, output_path):
+        """
+        Places the video at a path.
+
+        Args:
+            output_path (str): Path to place the video at. The extension may be changed.
+
+        Returns:
+            str: Path the video is placed at. Extension may differ from `output_path`.
+
+        Raises:
+            DownloadException: If the video cannot be placed.
+        """
+        output_path = os.path.splitext(output_path)[0] + os.path.splitext(self._path)[1]
+        try:
+            place_file(self._path, output_path)
+        except OSError as e:
+            raise DownloadException(
+                'Failed to place "{}" at "{}": {}'.format(self._path, output_path, e)
+            )
+        return output_path
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def title(self):
+        return self._title
+
+    @property
+    def author(self):
+        return self._author
+
+    @property
+    def duration(self):
+        if self._duration is None:
+            info = self.info
+            return None if info is None else info.duration
+        return self._duration
+
+    @property
+    def info(self):
+        if self._info is None and not self._probe_failed:
+            try:
+                self.probe()
+            except ProbeException:
+                # Do not probe a broken video again every time it is asked for.
+                self._probe_failed = True
+        return self._info
+
+    @property
+    def cache_key(self):
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return "{} {} {}".format(stat.st_dev, stat.st_ino, stat.st_size)
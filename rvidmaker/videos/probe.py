@@ -0,0 +1,131 @@
+"""Reads the stream information of videos with ffprobe"""
+
+from collections import namedtuple
+import ffmpeg
+from fractions import Fraction
+import os
+from rvidmaker.sidecar import load_sidecar, store_sidecar
+
+
+class ProbeException(Exception):
+    """Raised when a video cannot be probed"""
+
+
+class ProbeInfo(
+    namedtuple("ProbeInfo", ("width", "height", "fps", "duration", "vcodec", "acodec"))
+):
+    """
+    Stream information of a video.
+
+    Attributes:
+        width (int): Width of the video in pixels, accounting for rotation metadata.
+        height (int): Height of the video in pixels, accounting for rotation metadata.
+        fps (float): Frame rate of the video. None if not known.
+        duration (float): Duration of the video in seconds.
+        vcodec (str): Codec of the first video stream.
+        acodec (str): Codec of the first audio stream. None if the video has no audio.
+        size (int, int): Width and height of the video.
+        has_audio (bool): Whether the video has an audio stream.
+    """
+
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def has_audio(self):
+        return self.acodec is not None
+
+
+def _frame_rate(stream):
+    """
+    Returns:
+        float/None: Frame rate of a video stream. None if not known.
+    """
+    for key in ("avg_frame_rate", "r_frame_rate"):
+        try:
+            rate = Fraction(stream.get(key, ""))
+        except (ValueError, ZeroDivisionError):
+            continue
+        if rate > 0:
+            return float(rate)
+    return None
+
+
+def probe(path):
+    """
+    Reads the stream information of a video with ffprobe.
+
+    Args:
+        path (str): Path to the video.
+
+    Returns:
+        ProbeInfo: The stream information.
+
+    Raises:
+        ProbeException: If the video cannot be probed or has no video stream.
+    """
+    try:
+        info = ffmpeg.probe(path)
+    except (ffmpeg.Error, OSError) as e:
+        raise ProbeException('Failed to probe "{}": {}'.format(path, e))
+    # Some videos, such as streamed ones, are missing information.
+    try:
+        video = None
+        audio = None
+        for stream in info["streams"]:
+            if stream["codec_type"] == "video" and video is None:
+                video = stream
+            elif stream["codec_type"] == "audio" and audio is None:
+                audio = stream
+        if video is None:
+            raise ProbeException('"{}" has no video stream'.format(path))
+
+        w, h = int(video["width"]), int(video["height"])
+        rotate = int(video.get("tags", {}).get("rotate", 0))
+        for side_data in video.get("side_data_list", []):
+            rotate = int(side_data.get("rotation", rotate))
+        if rotate % 180 != 0:
+            w, h = h, w
+        return ProbeInfo(
+            width=w,
+            height=h,
+            fps=_frame_rate(video),
+            duration=float(info["format"].get("duration") or video["duration"]),
+            vcodec=video["codec_name"],
+            acodec=None if audio is None else audio["codec_name"],
+        )
+    except (KeyError, ValueError, TypeError) as e:
+        raise ProbeException(
+            'Failed to read stream information of "{}": {!r}'.format(path, e)
+        )
+
+
+def probe_cached(path, cache_path=None):
+    """
+    Reads the stream information of a video, caching it in a file so each video is only probed
+    once.
+
+    Args:
+        path (str): Path to the video.
+        cache_path (str): Path to cache the information at. None to cache it next to the video.
+
+    Returns:
+        ProbeInfo: The stream information.
+
+    Raises:
+        ProbeException: If the video cannot be probed or has no video stream.
+    """
+    if cache_path is None:
+        cache_path = path + ".probe.json"
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        raise ProbeException('Failed to probe "{}": {}'.format(path, e))
+    info = load_sidecar(cache_path, size, ProbeInfo)
+    if info is None:
+        info = probe(path)
+        store_sidecar(cache_path, size, info)
+    return info
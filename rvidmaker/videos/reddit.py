@@ -1,14 +1,19 @@
 """Implements a reference for videos hosted on Reddit"""
 
+from concurrent.futures import ThreadPoolExecutor
 import ffmpeg
 import os
 import requests
-import shutil
-import tempfile
 
-from rvidmaker.utils import get_random_path
+from rvidmaker.instrument import record_bytes
+from rvidmaker.session import get_session, TIMEOUT
 from .interface import DownloadException, VideoRef
 
+# Default number of bytes to hold in memory at a time while downloading.
+CHUNK_SIZE = 1024 * 1024
+# Suffix of partially downloaded files.
+_PART_SUFFIX = ".part"
+
 
 class RedditVideoRef(VideoRef):
     """
@@ -17,10 +22,20 @@ class RedditVideoRef(VideoRef):
     Attributes:
         title (str): Title of the video.
         author (str): Author of the video.
-        duration (float): Duration of the video. None if not known.
+        duration (float): Duration of the video. None if not known and the video is not probed.
+        cache_key (str): The video and audio URLs of the video.
     """
 
-    def __init__(self, title, author, video_url, audio_url=None, duration=None):
+    def __init__(
+        self,
+        title,
+        author,
+        video_url,
+        audio_url=None,
+        duration=None,
+        chunk_size=CHUNK_SIZE,
+        resume=True,
+    ):
         """
         Args:
             title (str): Title of the video.
@@ -28,37 +43,98 @@ class RedditVideoRef(VideoRef):
             video_url (str): Remote URL for video.
             audio_url (str): Remote URL for audio. None if there is no audio.
             duration (float): Duration of the video if known, and None otherwise.
+            chunk_size (int): Number of bytes to hold in memory at a time while downloading.
+            resume (bool): Whether to keep partially downloaded files when a download fails and
+                resume from them when downloading to the same path again.
         """
         self._title = title
         self._author = author
         self._video_url = video_url
         self._audio_url = audio_url
         self._duration = duration
+        self._chunk_size = chunk_size
+        self._resume = resume
 
-    def _download_to_file(self, f, url):
+    def _download_to_path(self, path, url):
         """
-        Downloads a web resource.
+        Downloads a web resource, streaming it to a file in chunks. If resuming is enabled and the
+        file already exists, only the remainder of the resource is requested.
 
         Args:
-            f: File-like object to write binary data to.
+            path (str): Path to write binary data to.
             url (str): HTTP/S URL to download from.
 
+        Returns:
+            int: Number of bytes downloaded.
+
         Raises:
             DownloadException: If the download fails.
         """
+        start = 0
+        headers = {}
+        if self._resume and os.path.exists(path):
+            start = os.path.getsize(path)
+            if start > 0:
+                headers["Range"] = "bytes={}-".format(start)
         try:
-            req = requests.get(url)
+            session = get_session()
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as req:
+                if req.status_code == 416 and start > 0:
+                    # The file is already complete.
+                    return 0
+                if req.status_code == 206 and start > 0:
+                    mode = "ab"
+                elif req.status_code == 200:
+                    # The server ignored the range, so start over.
+                    mode = "wb"
+                else:
+                    raise DownloadException(
+                        "Failed to download video from {}: {} response".format(
+                            url, req.status_code
+                        )
+                    )
+                downloaded = 0
+                with open(path, mode) as f:
+                    for chunk in req.iter_content(chunk_size=self._chunk_size):
+                        f.write(chunk)
+                        downloaded += len(chunk)
+                return downloaded
         except requests.exceptions.RequestException as e:
             raise DownloadException(
                 "Failed to download video from {}: {}".format(url, e)
             )
-        if req.status_code != 200:
-            raise DownloadException(
-                "Failed to download video from {}: {} response".format(
-                    url, req.status_code
-                )
+
+    @staticmethod
+    def _mux(video_path, audio_path, output_path):
+        """
+        Combines separate video and audio files into one. The streams are copied as-is, and only
+        re-encoded if the container cannot hold them.
+
+        Args:
+            video_path (str): Path to the video.
+            audio_path (str): Path to the audio.
+            output_path (str): Path to write the combined video to.
+
+        Raises:
+            DownloadException: If FFmpeg fails to combine the video and audio.
+        """
+        video = ffmpeg.input(video_path).video
+        audio = ffmpeg.input(audio_path).audio
+        try:
+            ffmpeg.output(video, audio, output_path, c="copy").run(
+                quiet=True, overwrite_output=True
             )
-        f.write(req.content)
+            return
+        except ffmpeg.Error:
+            pass
+        try:
+            ffmpeg.output(video, audio, output_path).run(
+                quiet=True, overwrite_output=True
+            )
+        except ffmpeg.Error:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            raise DownloadException("Failed to combine video and audio with FFmpeg")
 
     def download(self, output_path):
         """
@@ -75,29 +151,38 @@ class RedditVideoRef(VideoRef):
         if ext != "mp4":
             output_path = "{}.mp4".format(base)
 
-        # Download video and audio to temporary files.
-        # TODO: Download video and audio asynchronously
-        temp_video_file = tempfile.NamedTemporaryFile(suffix=".mp4")
-        self._download_to_file(temp_video_file, self._video_url)
-        if self._audio_url is not None:
-            temp_audio_file = tempfile.NamedTemporaryFile(suffix=".mp4")
-            self._download_to_file(temp_audio_file, self._audio_url)
-
-            # Combine video and audio
-            video = ffmpeg.input(temp_video_file.name)
-            audio = ffmpeg.input(temp_audio_file.name)
-            try:
-                ffmpeg.concat(video, audio, v=1, a=1).output(output_path).run(
-                    quiet=True, overwrite_output=True
+        # Download video and audio next to the output so they can be resumed.
+        video_part = "{}.video{}".format(base, _PART_SUFFIX)
+        audio_part = "{}.audio{}".format(base, _PART_SUFFIX)
+        parts = [video_part]
+        try:
+            if self._audio_url is not None:
+                parts.append(audio_part)
+                # Download video and audio concurrently.
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    video_dl = pool.submit(
+                        self._download_to_path, video_part, self._video_url
+                    )
+                    audio_dl = pool.submit(
+                        self._download_to_path, audio_part, self._audio_url
+                    )
+                    # Raises any exception from either download.
+                    record_bytes(downloaded=video_dl.result() + audio_dl.result())
+
+                self._mux(video_part, audio_part, output_path)
+                for part in parts:
+                    os.remove(part)
+            else:
+                record_bytes(
+                    downloaded=self._download_to_path(video_part, self._video_url)
                 )
-            except ffmpeg.Error:
-                if os.path.exists(output_path):
-                    os.remove(output_path)
-                raise DownloadException("Failed to combine video and audio with FFmpeg")
-        else:
-            # Copy instead of move since `temp_video_file` should be automatically removed,
-            # and moving it will cause an error when it attempts to remove itself.
-            shutil.copyfile(temp_video_file.name, output_path)
+                os.replace(video_part, output_path)
+        except DownloadException:
+            if not self._resume:
+                for part in parts:
+                    if os.path.exists(part):
+                        os.remove(part)
+            raise
 
         return output_path
 
@@ -111,4 +196,10 @@ class RedditVideoRef(VideoRef):
 
     @property
     def duration(self):
+        if self._duration is None:
+            return super().duration
         return self._duration
+
+    @property
+    def cache_key(self):
+        return "{} {}".format(self._video_url, self._audio_url)
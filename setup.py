@@ -24,7 +24,7 @@ setup(
         "moviepy>=1.0.3",
         "nltk>=3.5",
         "oauth2client==4.1.3",
-        "Pillow>=7.2.0",
+        "Pillow>=8.0.0",
         "praw>=7.1.4",
         "rake-nltk>=1.0.4",
         "textblob>=0.15.3",
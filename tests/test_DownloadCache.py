@@ -0,0 +1,83 @@
+import os
+import pytest
+
+from rvidmaker.videos import DownloadCache, VideoRef
+
+
+class FakeVideoRef(VideoRef):
+    def __init__(self, key, size=10):
+        self.key = key
+        self.size = size
+        self.downloads = 0
+
+    def download(self, output_path):
+        self.downloads += 1
+        path = output_path + ".mp4"
+        with open(path, "wb") as f:
+            f.write(b"0" * self.size)
+        return path
+
+    @property
+    def cache_key(self):
+        return self.key
+
+
+def test_fetch_cached(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), 100)
+    video = FakeVideoRef("a")
+    first = cache.fetch(video, str(tmp_path / "first"))
+    second = cache.fetch(video, str(tmp_path / "second"))
+    assert video.downloads == 1
+    assert os.path.getsize(first) == os.path.getsize(second) == video.size
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), 25)
+    a, b, c = FakeVideoRef("a"), FakeVideoRef("b"), FakeVideoRef("c")
+    cache.get(a)
+    os.utime(cache.get(b), (0, 0))
+    cache.get(a)
+    cache.get(c)
+    cache.get(a)
+    cache.get(b)
+    assert a.downloads == 1
+    assert b.downloads == 2
+
+
+def test_uncacheable(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), 100)
+    video = FakeVideoRef(None)
+    cache.fetch(video, str(tmp_path / "out"))
+    assert os.listdir(cache.root) == []
+
+
+def test_evict_sidecars(tmp_path):
+    cache = DownloadCache(str(tmp_path / "cache"), 15)
+    a, b = FakeVideoRef("a"), FakeVideoRef("b")
+    os.utime(cache.get(a), (0, 0))
+    sidecar = cache.sidecar_path(a, "loudness.json")
+    with open(sidecar, "w") as f:
+        f.write("{}")
+    cache.get(b)
+    assert not os.path.exists(sidecar)
+
+
+def test_fetch_while_evicting(tmp_path, monkeypatch):
+    cache = DownloadCache(str(tmp_path / "cache"), 15)
+    a, b = FakeVideoRef("a"), FakeVideoRef("b")
+    os.utime(cache.get(a), (0, 0))
+    link = os.link
+
+    def evict_then_link(src, dst):
+        # Another thread caches a video just before this one is linked.
+        cache.get(b)
+        link(src, dst)
+
+    monkeypatch.setattr(os, "link", evict_then_link)
+    path = cache.fetch(a, str(tmp_path / "out"))
+    assert os.path.getsize(path) == a.size
+    assert a.downloads == 1
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,37 @@
+import pytest
+
+from rvidmaker.editor import ENCODER_PRESETS, EncoderSettings
+
+
+def test_ffmpeg_args():
+    encoder = EncoderSettings(preset="slow", crf=20, max_bitrate=8000, gop=60)
+    assert encoder.ffmpeg_args() == {
+        "preset": "slow",
+        "crf": 20,
+        "maxrate": "8000k",
+        "bufsize": "16000k",
+        "g": 60,
+    }
+
+
+def test_ffmpeg_params():
+    encoder = EncoderSettings(preset="ultrafast", crf=28, tune="film")
+    assert encoder.ffmpeg_params() == ["-crf", "28", "-tune", "film"]
+
+
+def test_replace():
+    encoder = ENCODER_PRESETS["final"].replace(crf=18, max_bitrate=5000)
+    assert encoder.preset == ENCODER_PRESETS["final"].preset
+    assert encoder.crf == 18
+    assert encoder.buffer_size == 10000
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        EncoderSettings(preset="fastest")
+    with pytest.raises(ValueError):
+        EncoderSettings(crf=60)
+
+
+if __name__ == "__main__":
+    pytest.main()
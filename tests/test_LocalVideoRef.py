@@ -0,0 +1,125 @@
+import os
+import pytest
+
+from rvidmaker.editor.overlay import render_overlay
+from rvidmaker.editor.videocomp import VideoCompiler
+from rvidmaker.readers.local import read_directory, read_manifest
+from rvidmaker.videos import DownloadCache, DownloadException, LocalVideoRef
+
+
+def make_video(path, sidecar=None):
+    with open(path, "wb") as f:
+        f.write(b"video")
+    if sidecar is not None:
+        with open(os.path.splitext(path)[0] + ".toml", "w") as f:
+            f.write(sidecar)
+    return path
+
+
+def test_sidecar(tmp_path):
+    path = make_video(
+        str(tmp_path / "clip.mp4"),
+        'title = "A title"\nauthor = "someone"\nduration = 4.5\n',
+    )
+    video = LocalVideoRef(path)
+    assert video.title == "A title"
+    assert video.author == "someone"
+    assert video.duration == 4.5
+
+
+def test_no_sidecar(tmp_path):
+    video = LocalVideoRef(make_video(str(tmp_path / "clip.mp4")), duration=2)
+    assert video.title == "clip"
+    assert video.author is None
+    assert video.duration == 2
+
+
+def test_sidecar_probe(tmp_path):
+    path = make_video(
+        str(tmp_path / "clip.mp4"),
+        "[probe]\nsize = 5\n\n[probe.info]\nwidth = 720\nheight = 1280\n"
+        'duration = 3.0\nvcodec = "h264"\nacodec = "aac"\n',
+    )
+    video = LocalVideoRef(path)
+    assert video.info.size == (720, 1280)
+    assert video.info.fps is None
+    assert video.info.has_audio
+    assert video.duration == 3
+
+
+def test_missing_file(tmp_path):
+    with pytest.raises(DownloadException):
+        LocalVideoRef(str(tmp_path / "missing.mp4"))
+
+
+def test_download_leaves_original(tmp_path):
+    video = LocalVideoRef(make_video(str(tmp_path / "clip.mp4")))
+    path = video.download(str(tmp_path / "video"))
+    assert path == str(tmp_path / "video.mp4")
+    with open(path, "rb") as f:
+        assert f.read() == b"video"
+    os.remove(path)
+    assert os.path.exists(video.path)
+
+
+def test_cache_key_changes_with_file(tmp_path):
+    video = LocalVideoRef(make_video(str(tmp_path / "clip.mp4")))
+    key = video.cache_key
+    with open(video.path, "ab") as f:
+        f.write(b"more")
+    assert video.cache_key != key
+
+
+def test_cache_key_ignores_times(tmp_path):
+    video = LocalVideoRef(make_video(str(tmp_path / "clip.mp4")))
+    key = video.cache_key
+    os.utime(video.path, (0, 0))
+    assert video.cache_key == key
+
+
+def test_cache_hit_keeps_original_times(tmp_path):
+    video = LocalVideoRef(make_video(str(tmp_path / "clip.mp4")))
+    os.utime(video.path, (0, 0))
+    cache = DownloadCache(str(tmp_path / "cache"), 1000)
+    cache.fetch(video, str(tmp_path / "first"))
+    cache.fetch(video, str(tmp_path / "second"))
+    assert os.path.getmtime(video.path) == 0
+
+
+class UpperCensor:
+    def censor(self, text):
+        return text.upper()
+
+
+def test_overlay_without_author(tmp_path):
+    video = LocalVideoRef(make_video(str(tmp_path / "clip.mp4")))
+    assert video.author is None
+    title, author = VideoCompiler(UpperCensor())._overlay_text(video)
+    assert (title, author) == ("CLIP", None)
+    # Only the title is drawn.
+    img = render_overlay(title, author)
+    assert img.height < render_overlay(title, "someone").height
+
+
+def test_read_directory(tmp_path):
+    make_video(str(tmp_path / "b.mp4"))
+    make_video(str(tmp_path / "a.mkv"), 'title = "First"\n')
+    make_video(str(tmp_path / "notes.txt"))
+    os.mkdir(str(tmp_path / "sub"))
+    make_video(str(tmp_path / "sub" / "c.mp4"))
+    assert [v.title for v in read_directory(str(tmp_path))] == ["First", "b"]
+    assert len(read_directory(str(tmp_path), recursive=True)) == 3
+
+
+def test_read_manifest(tmp_path):
+    make_video(str(tmp_path / "a.mp4"), 'title = "From sidecar"\n')
+    make_video(str(tmp_path / "b.mp4"))
+    manifest = tmp_path / "manifest.toml"
+    manifest.write_text(
+        '[[video]]\npath = "b.mp4"\ntitle = "Second"\n\n[[video]]\npath = "a.mp4"\n'
+    )
+    assert [v.title for v in read_manifest(str(manifest))] == ["Second", "From sidecar"]
+
+
+if __name__ == "__main__":
+    pytest.main()
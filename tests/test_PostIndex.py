@@ -0,0 +1,67 @@
+from datetime import datetime
+import pytest
+
+from rvidmaker.readers.index import IndexedPost, PostIndex
+
+
+def make_post(i, score=100, duration=10, age=1, nsfw=False, has_audio=None):
+    return IndexedPost(
+        id=str(i),
+        subreddit="Videos",
+        title="Video {}".format(i),
+        author="user{}".format(i),
+        score=score,
+        created_utc=datetime.now().timestamp() - age * 60 * 60,
+        video_url="https://v.redd.it/{}/DASH_720.mp4".format(i),
+        audio_url="https://v.redd.it/{}/DASH_audio.mp4".format(i),
+        duration=duration,
+        nsfw=nsfw,
+        has_audio=has_audio,
+    )
+
+
+def test_top_unused(tmp_path):
+    index = PostIndex(str(tmp_path / "posts.sqlite"))
+    index.upsert(
+        [
+            make_post(0, score=50),
+            make_post(1, score=300),
+            make_post(2, score=200, nsfw=True),
+            make_post(3, score=400, duration=90),
+            make_post(4, score=500, age=48),
+            make_post(5, score=100),
+        ]
+    )
+    posts = index.top_unused("videos", max_age=24, max_duration=60)
+    assert [p.id for p in posts] == ["1", "5", "0"]
+    assert [p.id for p in index.top_unused("videos", limit=2)] == ["4", "3"]
+
+    index.mark_used(["4", "1"])
+    assert [p.id for p in index.top_unused("videos", limit=2)] == ["3", "5"]
+
+
+def test_upsert_keeps_audio(tmp_path):
+    index = PostIndex(str(tmp_path / "posts.sqlite"))
+    index.upsert([make_post(0)])
+    index.set_has_audio("0", False)
+    index.upsert([make_post(0, score=900)])
+    post = index.top_unused("videos")[0]
+    assert post.score == 900
+    assert post.has_audio is False
+
+
+def test_persists(tmp_path):
+    path = str(tmp_path / "posts.sqlite")
+    index = PostIndex(path)
+    assert index.scan_age("videos", "week") is None
+    index.upsert([make_post(0)])
+    index.mark_scanned("Videos", "week")
+    index.close()
+
+    index = PostIndex(path)
+    assert index.scan_age("videos", "week") < 1
+    assert len(index.top_unused("videos")) == 1
+
+
+if __name__ == "__main__":
+    pytest.main()
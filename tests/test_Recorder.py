@@ -0,0 +1,39 @@
+import pytest
+
+from rvidmaker.instrument import record_bytes, Recorder, timed_call
+
+
+def test_stages():
+    recorder = Recorder()
+    with recorder.stage("scrape"):
+        record_bytes(downloaded=10)
+    with recorder.stage("download", 0):
+        record_bytes(downloaded=5, written=7)
+    with recorder.stage("download", 0):
+        record_bytes(downloaded=5)
+    recorder.describe_clip(0, title="A title")
+    report = recorder.report()
+    assert report["stages"]["scrape"]["bytes_downloaded"] == 10
+    clip = report["clips"][0]
+    assert clip["title"] == "A title"
+    assert clip["stages"]["download"]["bytes_downloaded"] == 10
+    assert clip["stages"]["download"]["bytes_written"] == 7
+    assert report["clip_totals"]["download"]["bytes_downloaded"] == 10
+
+
+def test_record_bytes_outside_stage():
+    # Does nothing rather than failing.
+    record_bytes(downloaded=10)
+
+
+def test_timed_call():
+    recorder = Recorder()
+    result, stage = timed_call(sum, [1, 2])
+    recorder.add(stage, "render", 3)
+    assert result == 3
+    assert recorder.report()["clips"][0]["index"] == 3
+    assert stage.wall_time >= 0
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,254 @@
+from datetime import datetime
+import praw
+import pytest
+import sys
+from types import SimpleNamespace
+
+from rvidmaker.readers.index import PostIndex
+from rvidmaker.readers.reddit import (
+    get_indexed_videos,
+    get_videos,
+    merge_by_score,
+    MORE_COMMENTS_LIMIT,
+    RedditArticle,
+    RedditComment,
+    RedditReader,
+    scan_subreddits,
+)
+
+# `rvidmaker.readers.reddit` is shadowed by a namespace class of the same name.
+reddit = sys.modules[RedditReader.__module__]
+
+
+def make_submission(i, score=100, duration=10, nsfw=False, age=48):
+    return SimpleNamespace(
+        _reddit=None,
+        title="Video {}".format(i),
+        author=None,
+        selftext="",
+        category=None,
+        id=str(i),
+        url="https://v.redd.it/{}".format(i),
+        score=score,
+        over_18=nsfw,
+        created_utc=datetime.now().timestamp() - age * 60 * 60,
+        media={
+            "reddit_video": {
+                "is_gif": False,
+                "duration": duration,
+                "fallback_url": "https://v.redd.it/{}/DASH_720.mp4".format(i),
+            }
+        },
+    )
+
+
+class FakeSubreddit:
+    def __init__(self, submissions):
+        self.submissions = submissions
+        self.read = 0
+
+    def top(self, time_filter, limit):
+        for submission in self.submissions[:limit]:
+            self.read += 1
+            yield submission
+
+
+def make_reader(submissions):
+    sub = FakeSubreddit(submissions)
+    reader = RedditReader.__new__(RedditReader)
+    reader.reddit = SimpleNamespace(subreddit=lambda name: sub)
+    return reader, sub
+
+
+def test_scan_videos_filters():
+    reader, _ = make_reader(
+        [
+            make_submission(0),
+            make_submission(1, score=5),
+            make_submission(2, nsfw=True),
+            make_submission(3, duration=120),
+            make_submission(4, age=1),
+            make_submission(5),
+        ]
+    )
+    videos = reader.scan_videos("videos", min_score=10, min_age=24, max_duration=60)
+    assert [art.id for art in videos] == ["0", "5"]
+
+
+def test_scan_videos_stops_early():
+    reader, sub = make_reader([make_submission(i) for i in range(100)])
+    videos = list(reader.scan_videos("videos", limit=100, max_videos=20))
+    assert len(videos) == 20
+    assert sub.read == 20
+
+
+def test_scan_videos_index(tmp_path):
+    index = PostIndex(str(tmp_path / "posts.sqlite"))
+    reader, _ = make_reader([make_submission(i, score=100 - i) for i in range(3)])
+    list(reader.scan_videos("Videos", index=index))
+    posts = index.top_unused("videos")
+    assert [p.id for p in posts] == ["0", "1", "2"]
+    assert posts[0].audio_url == "https://v.redd.it/0/DASH_audio.mp4"
+
+    # Videos already checked for audio are not checked again.
+    index.set_has_audio("0", False)
+    videos = get_indexed_videos(index.top_unused("videos", limit=1), index)
+    assert videos[0].cache_key == "https://v.redd.it/0/DASH_720.mp4 None"
+
+
+class FakeSession:
+    """Answers requests for audio with a status code for each video ID"""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.requested = []
+
+    def head(self, url, **kwargs):
+        video_id = url.split("/")[3]
+        self.requested.append(video_id)
+        return SimpleNamespace(status_code=self.statuses[video_id])
+
+
+def test_indexed_videos_keep_unknown_audio(tmp_path, monkeypatch):
+    index = PostIndex(str(tmp_path / "posts.sqlite"))
+    reader, _ = make_reader([make_submission(i, score=100 - i) for i in range(4)])
+    list(reader.scan_videos("videos", index=index))
+    session = FakeSession({"0": 200, "1": 404, "2": 429, "3": 500})
+    monkeypatch.setattr(reddit, "get_session", lambda: session)
+    videos = get_indexed_videos(index.top_unused("videos"), index)
+    assert [v.cache_key.endswith("None") for v in videos] == [False, True, True, True]
+    # Only definite answers are stored.
+    posts = index.top_unused("videos")
+    assert [p.has_audio for p in posts] == [True, False, None, None]
+
+    # Videos whose check failed are checked again.
+    session.statuses.update({"2": 200, "3": 403})
+    session.requested.clear()
+    get_indexed_videos(posts, index)
+    assert sorted(session.requested) == ["2", "3"]
+    posts = index.top_unused("videos")
+    assert [p.has_audio for p in posts] == [True, False, True, False]
+
+
+def test_get_videos_mixed_audio(monkeypatch):
+    reader, _ = make_reader([make_submission(i, score=100 - i) for i in range(5)])
+    articles = list(reader.scan_videos("videos"))
+    session = FakeSession({"0": 200, "1": 404, "2": 200, "3": 403, "4": 429})
+    monkeypatch.setattr(reddit, "get_session", lambda: session)
+    videos = get_videos(articles, max_workers=2)
+    assert sorted(session.requested) == ["0", "1", "2", "3", "4"]
+    assert [v.cache_key.endswith("None") for v in videos] == [
+        False,
+        True,
+        False,
+        True,
+        True,
+    ]
+    assert videos[0].cache_key == (
+        "https://v.redd.it/0/DASH_720.mp4 https://v.redd.it/0/DASH_audio.mp4"
+    )
+
+
+def test_indexed_videos_skip_known(tmp_path, monkeypatch):
+    index = PostIndex(str(tmp_path / "posts.sqlite"))
+    reader, _ = make_reader([make_submission(i, score=100 - i) for i in range(4)])
+    list(reader.scan_videos("videos", index=index))
+    index.set_has_audio("0", True)
+    index.set_has_audio("1", False)
+    session = FakeSession({"2": 200, "3": 404})
+    monkeypatch.setattr(reddit, "get_session", lambda: session)
+    videos = get_indexed_videos(index.top_unused("videos"), index)
+    # Only posts not yet checked are requested.
+    assert sorted(session.requested) == ["2", "3"]
+    assert [v.cache_key.endswith("None") for v in videos] == [False, True, False, True]
+    assert [p.has_audio for p in index.top_unused("videos")] == [
+        True,
+        False,
+        True,
+        False,
+    ]
+
+
+def test_scan_subreddits(monkeypatch):
+    listings = {
+        "big": [make_submission(i, score=1000 - i) for i in range(3)],
+        "small": [make_submission(i, score=10 - i) for i in range(3, 5)],
+    }
+
+    def init(self):
+        self.reddit = SimpleNamespace(
+            subreddit=lambda name: FakeSubreddit(listings[name])
+        )
+
+    monkeypatch.setattr(RedditReader, "__init__", init)
+    ranked = scan_subreddits(["big", "small"], max_videos=2)
+    assert [art.id for art in ranked["big"]] == ["0", "1"]
+    assert [art.id for art in ranked["small"]] == ["3", "4"]
+
+
+def test_merge_by_score():
+    ranked = {
+        "big": [
+            SimpleNamespace(id="a", score=1000),
+            SimpleNamespace(id="b", score=500),
+        ],
+        "small": [SimpleNamespace(id="c", score=10), SimpleNamespace(id="d", score=8)],
+    }
+    merged = merge_by_score(ranked)
+    assert [art.id for _, _, art in merged] == ["a", "c", "d", "b"]
+    assert merged[2][:2] == (0.8, "small")
+
+    merged = merge_by_score(ranked, {"big": 2})
+    assert [art.id for _, _, art in merged] == ["a", "b", "c", "d"]
+
+
+def test_comment_is_immutable():
+    comment = RedditComment("user", "text", 10, RedditComment("other", "reply", 5))
+    assert comment.child.author == "other"
+    with pytest.raises(AttributeError):
+        comment.child = None
+
+
+def test_article_fetches_comments_lazily():
+    class Comment(praw.models.reddit.comment.Comment):
+        replies = property(lambda self: self._replies)
+
+        def __init__(self, name, score, replies=()):
+            self.__dict__.update(
+                _fetched=True,
+                author=SimpleNamespace(name=name),
+                body=name,
+                score=score,
+                _replies=list(replies),
+            )
+
+    comments = [
+        Comment("low", 1),
+        Comment("top", 100, [Comment("reply", 80, [Comment("deep", 10)])]),
+    ]
+    fetched = []
+
+    class Forest(list):
+        def replace_more(self, limit):
+            fetched.append(limit)
+
+    def submission(id):
+        fetched.append(id)
+        return SimpleNamespace(comments=Forest(comments))
+
+    raw = make_submission(0)
+    raw._reddit = SimpleNamespace(submission=submission)
+    art = RedditArticle(raw)
+    assert fetched == []
+
+    best = art.get_comments(max_comments=1)
+    assert fetched == ["0", MORE_COMMENTS_LIMIT]
+    assert [best[0].author, best[0].child.author] == ["top", "reply"]
+    # The reply's reply scores too low relative to its parent.
+    assert best[0].child.child is None
+    assert [c.author for c in art.get_comments()] == ["top", "low"]
+    assert fetched == ["0", MORE_COMMENTS_LIMIT]
+
+
+if __name__ == "__main__":
+    pytest.main()
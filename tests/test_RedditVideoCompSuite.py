@@ -0,0 +1,140 @@
+import os
+import pytest
+from types import SimpleNamespace
+
+from rvidmaker.editor import EncoderSettings
+from rvidmaker.editor.videocomp import Manifest
+from rvidmaker.suites import reddit_video_comp, SuiteConfigException
+from rvidmaker.suites.reddit_video_comp import RedditVideoCompSuite
+from rvidmaker.videos import VideoRef
+
+
+def test_config_one_subreddit():
+    subreddits, weights = RedditVideoCompSuite._config_subreddits(
+        {"subreddit": "videos"}
+    )
+    assert subreddits == ["videos"]
+    assert weights == {"videos": 1}
+
+
+def test_config_many_subreddits():
+    subreddits, weights = RedditVideoCompSuite._config_subreddits(
+        {"subreddit": ["videos", "funny"], "subreddit_weights": {"funny": 0.5}}
+    )
+    assert subreddits == ["videos", "funny"]
+    assert weights == {"videos": 1, "funny": 0.5}
+
+
+@pytest.mark.parametrize(
+    "profile",
+    [
+        {},
+        {"subreddit": []},
+        {"subreddit": ["videos", 1]},
+        {"subreddit": "videos", "subreddit_weights": {"funny": 2}},
+        {"subreddit": "videos", "subreddit_weights": {"videos": 0}},
+    ],
+)
+def test_config_invalid_subreddits(profile):
+    with pytest.raises(SuiteConfigException):
+        RedditVideoCompSuite._config_subreddits(profile)
+
+
+def test_config_encoder_default():
+    assert RedditVideoCompSuite._config_encoder({}) == EncoderSettings()
+
+
+def test_config_encoder_preset():
+    encoder = RedditVideoCompSuite._config_encoder(
+        {"encoder": {"preset": "final", "crf": 18}}
+    )
+    assert encoder.preset == "slow"
+    assert encoder.crf == 18
+
+
+class FakeVideoRef(VideoRef):
+    title = "Title"
+    author = "author"
+
+
+class FakeCompiler:
+    def __init__(self, censor=None, cache=None, recorder=None):
+        self.videos = []
+
+    def add_video(self, video):
+        self.videos.append(video)
+
+    def render_video(self, res, output_path, **kwargs):
+        open(output_path, "wb").close()
+        manifest = Manifest()
+        for i, v in enumerate(self.videos):
+            manifest.add_entry(v, i)
+        return manifest
+
+
+def make_suite(monkeypatch):
+    """Creates a configured suite that renders and scrapes nothing."""
+    suite = RedditVideoCompSuite()
+    suite.configured = True
+    suite._subreddits = ["videos"]
+    suite._res = (1920, 1080)
+    suite._engine = "moviepy"
+    suite._encoder = None
+    suite._cache = None
+    suite._index = None
+    suite._censor = None
+    suite._censor_video = False
+    suite._censor_metadata = False
+    suite._default_title = "Compilation"
+    videos = [FakeVideoRef(), FakeVideoRef()]
+    monkeypatch.setattr(suite, "_get_videos_from_reddit", lambda: videos)
+    monkeypatch.setattr(suite, "_make_description", lambda message, manifest: "")
+    monkeypatch.setattr(suite, "_make_tags", lambda videos: [])
+
+    def make_thumbnail(vid, title, output_path):
+        with open(output_path, "w") as f:
+            f.write("thumbnail")
+
+    monkeypatch.setattr(suite, "_make_thumbnail", make_thumbnail)
+    monkeypatch.setattr(reddit_video_comp, "VideoCompiler", FakeCompiler)
+    return suite
+
+
+def test_preview_keeps_thumbnail(tmp_path, monkeypatch):
+    thumb_path = tmp_path / "thumbnail.png"
+    thumb_path.write_text("final")
+    make_suite(monkeypatch).generate(str(tmp_path), preview=True)
+    assert thumb_path.read_text() == "final"
+    assert (tmp_path / "preview-thumbnail.png").read_text() == "thumbnail"
+
+
+def make_ranking_suite(target_dur, clip_limit=None):
+    suite = RedditVideoCompSuite()
+    suite._target_dur = target_dur
+    suite._clip_limit = clip_limit
+    suite._subreddit_weights = None
+    return suite
+
+
+def test_rank_within_target():
+    ranked = {
+        "videos": [
+            SimpleNamespace(id="a", score=100, duration=50),
+            SimpleNamespace(id="b", score=90, duration=30),
+            SimpleNamespace(id="c", score=80, duration=None),
+            SimpleNamespace(id="d", score=60, duration=20),
+        ]
+    }
+    suite = make_ranking_suite(60)
+    picked = suite._rank(ranked, lambda post: post.duration)
+    # "c" would fit but its duration is unknown.
+    assert [p.id for p in picked] == ["b", "d"]
+    assert sum(p.duration for p in picked) <= 60
+
+    suite = make_ranking_suite(100, clip_limit=1)
+    picked = suite._rank(ranked, lambda post: post.duration)
+    assert [p.id for p in picked] == ["a"]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,139 @@
+import ffmpeg
+import os
+import pytest
+import requests
+
+from rvidmaker.videos import DownloadException, RedditVideoRef
+from rvidmaker.videos import reddit
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=b""):
+        self.status_code = status_code
+        self.data = data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i : i + chunk_size]
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.headers = None
+
+    def get(self, url, headers=None, **kwargs):
+        self.headers = headers
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+def download(tmp_path, monkeypatch, response, existing=None):
+    """Downloads to a file through a fake session, returning the bytes, file and session."""
+    session = FakeSession(response)
+    monkeypatch.setattr(reddit, "get_session", lambda: session)
+    path = str(tmp_path / "video.mp4")
+    if existing is not None:
+        with open(path, "wb") as f:
+            f.write(existing)
+    video = RedditVideoRef("Title", "author", "https://v.redd.it/a", chunk_size=2)
+    downloaded = video._download_to_path(path, "https://v.redd.it/a")
+    with open(path, "rb") as f:
+        return downloaded, f.read(), session
+
+
+def test_download(tmp_path, monkeypatch):
+    downloaded, data, session = download(
+        tmp_path, monkeypatch, FakeResponse(200, b"abcde")
+    )
+    assert downloaded == 5
+    assert data == b"abcde"
+    assert "Range" not in session.headers
+
+
+def test_download_resume(tmp_path, monkeypatch):
+    downloaded, data, session = download(
+        tmp_path, monkeypatch, FakeResponse(206, b"def"), existing=b"abc"
+    )
+    assert downloaded == 3
+    assert data == b"abcdef"
+    assert session.headers["Range"] == "bytes=3-"
+
+
+def test_download_resume_ignored(tmp_path, monkeypatch):
+    downloaded, data, _ = download(
+        tmp_path, monkeypatch, FakeResponse(200, b"abcdef"), existing=b"abc"
+    )
+    assert downloaded == 6
+    assert data == b"abcdef"
+
+
+def test_download_complete(tmp_path, monkeypatch):
+    downloaded, data, _ = download(
+        tmp_path, monkeypatch, FakeResponse(416), existing=b"abc"
+    )
+    assert downloaded == 0
+    assert data == b"abc"
+
+
+def test_download_error_status(tmp_path, monkeypatch):
+    with pytest.raises(DownloadException):
+        download(tmp_path, monkeypatch, FakeResponse(404))
+
+
+def test_download_request_error(tmp_path, monkeypatch):
+    with pytest.raises(DownloadException):
+        download(tmp_path, monkeypatch, requests.exceptions.ConnectionError())
+
+
+class FakeOutput:
+    def __init__(self, calls, fail, output_path, kwargs):
+        self.calls = calls
+        self.fail = fail
+        self.output_path = output_path
+        self.kwargs = kwargs
+
+    def run(self, **kwargs):
+        self.calls.append(self.kwargs)
+        open(self.output_path, "wb").close()
+        if len(self.calls) <= self.fail:
+            raise ffmpeg.Error("ffmpeg", b"", b"")
+
+
+def mux(tmp_path, monkeypatch, fail):
+    """Muxes through a fake FFmpeg whose first `fail` runs fail, returning its arguments."""
+    calls = []
+    monkeypatch.setattr(
+        ffmpeg,
+        "output",
+        lambda *streams, **kwargs: FakeOutput(calls, fail, streams[-1], kwargs),
+    )
+    RedditVideoRef._mux("video.mp4", "audio.mp4", str(tmp_path / "out.mp4"))
+    return calls
+
+
+def test_mux_copy(tmp_path, monkeypatch):
+    assert mux(tmp_path, monkeypatch, 0) == [{"c": "copy"}]
+    assert os.path.exists(str(tmp_path / "out.mp4"))
+
+
+def test_mux_reencode(tmp_path, monkeypatch):
+    assert mux(tmp_path, monkeypatch, 1) == [{"c": "copy"}, {}]
+    assert os.path.exists(str(tmp_path / "out.mp4"))
+
+
+def test_mux_error(tmp_path, monkeypatch):
+    with pytest.raises(DownloadException):
+        mux(tmp_path, monkeypatch, 2)
+    assert not os.path.exists(str(tmp_path / "out.mp4"))
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,202 @@
+import ffmpeg
+from moviepy.editor import AudioClip
+import numpy as np
+import os
+import pytest
+import shutil
+import threading
+import time
+
+from rvidmaker.editor import EncoderSettings
+from rvidmaker.editor.videocomp import (
+    _fit_audio,
+    _prune_clips,
+    preview_resolution,
+    PREVIEW_HEIGHT,
+    VideoCompiler,
+)
+from rvidmaker.videos import DownloadException, VideoRef
+
+
+class FakeVideoRef(VideoRef):
+    def __init__(self, key, title="Title"):
+        self.key = key
+        self._title = title
+
+    @property
+    def title(self):
+        return self._title
+
+    @property
+    def author(self):
+        return "author"
+
+    @property
+    def cache_key(self):
+        return self.key
+
+
+def test_preview_resolution():
+    assert preview_resolution((1920, 1080)) == (854, PREVIEW_HEIGHT)
+
+
+def test_preview_resolution_portrait():
+    assert preview_resolution((1080, 1920)) == (270, PREVIEW_HEIGHT)
+
+
+def test_preview_resolution_small():
+    assert preview_resolution((640, 360)) == (640, 360)
+
+
+def clip_key(video, res=(1920, 1080)):
+    compiler = VideoCompiler(None)
+    return compiler._clip_key(video, res, 0.7, (0, 0, 0), EncoderSettings(), 30, None)
+
+
+def test_clip_key():
+    assert clip_key(FakeVideoRef("a")) == clip_key(FakeVideoRef("a"))
+    assert clip_key(FakeVideoRef("a")) != clip_key(FakeVideoRef("b"))
+    assert clip_key(FakeVideoRef("a")) != clip_key(FakeVideoRef("a", "Other"))
+    assert clip_key(FakeVideoRef("a")) != clip_key(FakeVideoRef("a"), (1280, 720))
+
+
+def test_clip_key_uncacheable():
+    assert clip_key(FakeVideoRef(None)) is None
+
+
+class PendingTracker:
+    """Counts videos that started downloading but were not yet yielded"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.max_pending = 0
+
+    def start(self):
+        with self.lock:
+            self.pending += 1
+            self.max_pending = max(self.max_pending, self.pending)
+
+    def finish(self):
+        with self.lock:
+            self.pending -= 1
+
+
+class DownloadingVideoRef(FakeVideoRef):
+    def __init__(self, key, tracker, fail=False):
+        super().__init__(key)
+        self.tracker = tracker
+        self.fail = fail
+
+    def download(self, output_path):
+        self.tracker.start()
+        time.sleep(0.01)
+        if self.fail:
+            self.tracker.finish()
+            raise DownloadException("Failed")
+        path = output_path + ".mp4"
+        open(path, "wb").close()
+        return path
+
+    def probe(self, path, cache_path=None):
+        return None
+
+
+def test_batch_dl(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tracker = PendingTracker()
+    videos = [DownloadingVideoRef(str(i), tracker, fail=i == 2) for i in range(6)]
+    compiler = VideoCompiler(None)
+    done = []
+    for i, video, path in compiler._batch_dl(
+        list(enumerate(videos)), max_workers=4, max_pending=2
+    ):
+        tracker.finish()
+        assert video is videos[i]
+        assert path.endswith("vid{:04d}.mp4".format(i))
+        done.append(i)
+        # Give downloads time to pile up while this one is processed.
+        time.sleep(0.02)
+    assert done == [0, 1, 3, 4, 5]
+    assert tracker.max_pending <= 2
+
+
+def test_prune_clips(tmp_path):
+    paths = []
+    for i in range(4):
+        path = str(tmp_path / "{}.mp4".format(i))
+        with open(path, "wb") as f:
+            f.write(b"0" * 10)
+        os.utime(path, (i, i))
+        paths.append(path)
+    # The oldest clip is kept since it is in use, so the next oldest are deleted instead.
+    _prune_clips(str(tmp_path), [paths[0]], 25)
+    assert sorted(os.listdir(str(tmp_path))) == ["0.mp4", "3.mp4"]
+
+
+def test_render_unknown_engine():
+    compiler = VideoCompiler(None)
+    compiler.add_video(FakeVideoRef("a"))
+    compiler.add_video(FakeVideoRef("b"))
+    with pytest.raises(ValueError):
+        compiler.render_video((1920, 1080), "out.mp4", engine="unknown")
+
+
+def tone(duration):
+    return AudioClip(
+        lambda t: np.full((len(t), 2) if isinstance(t, np.ndarray) else 2, 0.5),
+        duration=duration,
+        fps=1000,
+    )
+
+
+def test_fit_audio_pads():
+    audio = _fit_audio(tone(1), 2).to_soundarray(fps=1000)
+    assert len(audio) == 2000
+    assert audio[:1000].all()
+    assert not audio[1001:].any()
+
+
+def test_fit_audio_trims():
+    audio = _fit_audio(tone(3), 2)
+    assert audio.duration == 2
+    assert len(audio.to_soundarray(fps=1000)) == 2000
+
+
+def test_fit_audio_silent():
+    audio = _fit_audio(None, 2)
+    assert audio.duration == 2
+    assert not audio.to_soundarray(fps=1000).any()
+
+
+@pytest.mark.skipif(
+    shutil.which("ffmpeg") is None or shutil.which("ffprobe") is None,
+    reason="Needs FFmpeg",
+)
+def test_render_moviepy_clip_streams_match(tmp_path):
+    # The audio ends a second before the video.
+    src = str(tmp_path / "src.mp4")
+    video = ffmpeg.input("testsrc=size=320x180:rate=30:duration=3", f="lavfi")
+    audio = ffmpeg.input("sine=duration=2", f="lavfi")
+    ffmpeg.output(video, audio, src).run(quiet=True)
+    clip_path = str(tmp_path / "clip.mp4")
+    compiler = VideoCompiler(None)
+    compiler._render_moviepy_clip(
+        0,
+        FakeVideoRef(None),
+        src,
+        clip_path,
+        (320, 180),
+        0.7,
+        EncoderSettings(),
+        30,
+        None,
+        str(tmp_path),
+    )
+    durations = [float(s["duration"]) for s in ffmpeg.probe(clip_path)["streams"]]
+    assert len(durations) == 2
+    assert durations[0] == pytest.approx(durations[1], abs=0.05)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,44 @@
+import pytest
+
+from rvidmaker.editor.audio import _parse_stats, AudioStats, gain_for_level
+from rvidmaker.editor.ffrun import RenderException
+
+STDERR = """
+[Parsed_volumedetect_0 @ 0x0] mean_volume: -20.5 dB
+[Parsed_volumedetect_0 @ 0x0] max_volume: -6.0 dB
+[Parsed_loudnorm_1 @ 0x0]
+{
+	"input_i" : "-23.10",
+	"input_tp" : "-5.90",
+	"input_lra" : "7.20",
+	"input_thresh" : "-33.50",
+	"output_i" : "-16.00"
+}
+"""
+
+
+def test_parse_stats():
+    stats = _parse_stats(STDERR)
+    assert stats.peak == pytest.approx(0.501, abs=0.001)
+    assert stats.integrated == -23.1
+    assert stats.threshold == -33.5
+
+
+def test_parse_stats_silent():
+    stats = _parse_stats(STDERR.replace("-6.0 dB", "-inf dB"))
+    assert stats.peak == 0
+    assert gain_for_level(stats, 0.7) == 1
+
+
+def test_parse_stats_missing():
+    with pytest.raises(RenderException):
+        _parse_stats("no measurements")
+
+
+def test_gain_for_level():
+    stats = AudioStats(peak=0.5, integrated=0, true_peak=0, lra=0, threshold=0)
+    assert gain_for_level(stats, 0.7) == pytest.approx(1.4)
+
+
+if __name__ == "__main__":
+    pytest.main()
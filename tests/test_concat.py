@@ -0,0 +1,83 @@
+import ffmpeg
+import pytest
+
+from rvidmaker.editor import concat
+from rvidmaker.editor.concat import (
+    _conform,
+    _target_params,
+    stream_params,
+    StreamParams,
+)
+
+
+def _params(vcodec="h264", width=1920, acodec="aac", level=40):
+    return StreamParams(
+        vcodec,
+        "High",
+        level,
+        width,
+        1080,
+        "yuv420p",
+        "30/1",
+        "1/90000",
+        acodec,
+        "44100",
+        "stereo",
+    )
+
+
+def test_target_most_common():
+    all_params = [_params(width=1280), _params(), _params()]
+    assert _target_params(all_params, 30) == _params()
+
+
+def test_target_skips_other_codecs():
+    all_params = [_params(vcodec="hevc"), _params(vcodec="hevc"), _params(width=1280)]
+    assert _target_params(all_params, 30) == _params(width=1280)
+
+
+def test_target_reencode_all():
+    target = _target_params([_params(vcodec="vp9")], 24)
+    assert target.vcodec == "h264"
+    assert target.frame_rate == "24/1"
+
+
+def test_target_level():
+    all_params = [_params(level=31), _params(), _params()]
+    assert _target_params(all_params, 30).level == 40
+
+
+def test_stream_params(monkeypatch):
+    video = {
+        "codec_type": "video",
+        "codec_name": "h264",
+        "profile": "High",
+        "level": 40,
+        "width": 1920,
+        "height": 1080,
+        "pix_fmt": "yuv420p",
+        "r_frame_rate": "30/1",
+        "time_base": "1/90000",
+    }
+    audio = {
+        "codec_type": "audio",
+        "codec_name": "aac",
+        "sample_rate": "44100",
+        "channel_layout": "stereo",
+    }
+    output = {"streams": [video, audio], "format": {"duration": "2.5"}}
+    monkeypatch.setattr(ffmpeg, "probe", lambda path: output)
+    assert stream_params("clip.mp4") == (_params(), 2.5)
+
+
+def test_conform_profile_level(monkeypatch):
+    ran = []
+    monkeypatch.setattr(concat, "run_ffmpeg", lambda out, path, what: ran.append(out))
+    _conform("clip.mp4", True, 2.5, _params(level=31), "out.mp4")
+    args = ffmpeg.compile(ran[0])
+    assert args[args.index("-profile:v") + 1] == "high"
+    assert args[args.index("-level") + 1] == "3.1"
+
+
+if __name__ == "__main__":
+    pytest.main()
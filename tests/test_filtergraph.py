@@ -0,0 +1,137 @@
+import ffmpeg
+import pytest
+
+from rvidmaker.editor import filtergraph
+from rvidmaker.editor.audio import AudioStats
+from rvidmaker.editor.encoder import EncoderSettings
+from rvidmaker.editor.filtergraph import (
+    clip_streams,
+    fit_size,
+    prerender_clip,
+    render_single_pass,
+)
+from rvidmaker.videos import ProbeInfo
+
+STATS = AudioStats(peak=0.5, integrated=-20, true_peak=-3, lra=5, threshold=-30)
+
+
+def test_fit_size_same_aspect():
+    assert fit_size((1280, 720), (1920, 1080)) == (1920, 1080)
+
+
+def test_fit_size_portrait():
+    assert fit_size((720, 1280), (1920, 1080)) == (608, 1080)
+
+
+def test_fit_size_even():
+    w, h = fit_size((333, 333), (1920, 1080))
+    assert w % 2 == 0 and h % 2 == 0
+
+
+def make_info(size=(1280, 720), duration=10.0, acodec="aac"):
+    return ProbeInfo(size[0], size[1], 30.0, duration, "h264", acodec)
+
+
+def streams_args(tmp_path, monkeypatch, info, stats=STATS, **kwargs):
+    """Builds a clip's streams and returns the FFmpeg command that would render them."""
+    monkeypatch.setattr(filtergraph, "analyze_audio", lambda path, cache_path: stats)
+    video, audio, duration = clip_streams(
+        "clip.mp4", (1920, 1080), "Title", "author", str(tmp_path), info=info, **kwargs
+    )
+    out = ffmpeg.output(video, audio, "out.mp4")
+    return " ".join(ffmpeg.compile(out)), duration
+
+
+def test_clip_streams_pad(tmp_path, monkeypatch):
+    args, duration = streams_args(tmp_path, monkeypatch, make_info(), fps=24)
+    assert "fps=fps=24" in args
+    assert "scale=1920:1080" in args
+    assert "pad=1920:1080:0:0" in args
+    assert "boxblur" not in args
+    assert duration == 10.0
+
+
+def test_clip_streams_blur(tmp_path, monkeypatch):
+    args, _ = streams_args(tmp_path, monkeypatch, make_info((720, 1280)))
+    assert "boxblur" in args
+    assert "scale=608:1080" in args
+    assert "pad=" not in args
+
+
+def test_clip_streams_audio(tmp_path, monkeypatch):
+    args, _ = streams_args(tmp_path, monkeypatch, make_info(), audio_level=0.5)
+    assert "loudnorm" in args
+    assert "volume=0.5" in args
+    assert "anullsrc" not in args
+
+
+def test_clip_streams_quiet(tmp_path, monkeypatch):
+    args, _ = streams_args(
+        tmp_path, monkeypatch, make_info(), stats=STATS._replace(peak=0)
+    )
+    assert "loudnorm" not in args
+    assert "volume=" in args
+
+
+def test_clip_streams_silent(tmp_path, monkeypatch):
+    args, _ = streams_args(tmp_path, monkeypatch, make_info(acodec=None))
+    assert "anullsrc" in args
+    assert "-t 10.0" in args
+    assert "loudnorm" not in args
+
+
+def test_clip_streams_max_duration(tmp_path, monkeypatch):
+    args, duration = streams_args(tmp_path, monkeypatch, make_info(), max_duration=4)
+    assert "-t 4 -i clip.mp4" in args
+    assert duration == 4
+
+
+def test_render_single_pass(tmp_path, monkeypatch):
+    monkeypatch.setattr(filtergraph, "analyze_audio", lambda path, cache_path: STATS)
+    streams = []
+    for path in ("a.mp4", "b.mp4"):
+        video, audio, _ = clip_streams(
+            path, (1920, 1080), "Title", "author", str(tmp_path), info=make_info()
+        )
+        streams.append((video, audio))
+    ran = []
+    monkeypatch.setattr(
+        filtergraph, "run_ffmpeg", lambda out, path, what: ran.append(out)
+    )
+    render_single_pass(streams, "out.mp4", fps=24)
+    args = " ".join(ffmpeg.compile(ran[0]))
+    assert "concat=a=1:n=2:v=1" in args
+    assert "-vcodec libx264" in args
+    assert "-r 24" in args
+    assert "-video_track_timescale 90000" in args
+
+
+def test_prerender_clip(tmp_path, monkeypatch):
+    monkeypatch.setattr(filtergraph, "analyze_audio", lambda path, cache_path: STATS)
+    ran = []
+    monkeypatch.setattr(
+        filtergraph, "run_ffmpeg", lambda out, path, what: ran.append(out)
+    )
+    duration = prerender_clip(
+        "clip.mp4",
+        "out.mp4",
+        (1920, 1080),
+        "Title",
+        "author",
+        str(tmp_path),
+        threads=2,
+        encoder=EncoderSettings(crf=20),
+        max_duration=4,
+        info=make_info(),
+    )
+    assert duration == 4
+    args = " ".join(ffmpeg.compile(ran[0]))
+    assert "apad=whole_dur=4" in args
+    assert "atrim=duration=4" in args
+    assert "-threads 2" in args
+    assert "-crf 20" in args
+    assert "-video_track_timescale 90000" in args
+
+
+if __name__ == "__main__":
+    pytest.main()
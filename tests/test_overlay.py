@@ -0,0 +1,41 @@
+import os
+import pytest
+
+from rvidmaker.editor.overlay import _text_size, overlay_path, render_overlay
+
+
+def test_render_overlay():
+    img = render_overlay("A title", "someone")
+    assert img.mode == "RGBA"
+    # The corner is transparent and the text is not.
+    assert img.getpixel((0, 0))[3] == 0
+    assert img.getextrema()[3][1] > 0
+
+
+def test_render_overlay_cached():
+    assert render_overlay("Cached", "someone") is render_overlay("Cached", "someone")
+
+
+def test_render_overlay_missing_font():
+    img = render_overlay("A title", "someone", font="missing-font.ttf")
+    assert img.getextrema()[3][1] > 0
+
+
+def test_text_size_without_bbox():
+    class BitmapFont:
+        def getsize(self, text):
+            return 6 * len(text), 11
+
+    assert _text_size(BitmapFont(), "abc") == (18, 11)
+
+
+def test_overlay_path_reused(tmp_path):
+    first = overlay_path("A title", "someone", str(tmp_path))
+    second = overlay_path("A title", "someone", str(tmp_path))
+    other = overlay_path("Another title", "someone", str(tmp_path))
+    assert first == second != other
+    assert len(os.listdir(str(tmp_path))) == 2
+
+
+if __name__ == "__main__":
+    pytest.main()
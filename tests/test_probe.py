@@ -0,0 +1,88 @@
+import ffmpeg
+import pytest
+
+from rvidmaker.videos import ProbeException, ProbeInfo, VideoRef
+from rvidmaker.sidecar import store_sidecar
+from rvidmaker.videos.probe import _frame_rate, probe, probe_cached
+
+INFO = ProbeInfo(
+    width=1280, height=720, fps=30.0, duration=4.5, vcodec="h264", acodec=None
+)
+
+
+def write_video(tmp_path, info=INFO):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"video")
+    cache_path = str(tmp_path / "clip.probe.json")
+    store_sidecar(cache_path, 5, info)
+    return str(path), cache_path
+
+
+def test_info_properties():
+    assert INFO.size == (1280, 720)
+    assert not INFO.has_audio
+    assert INFO._replace(acodec="aac").has_audio
+
+
+def test_frame_rate():
+    assert _frame_rate({"avg_frame_rate": "30000/1001"}) == pytest.approx(
+        29.97, abs=0.01
+    )
+    assert _frame_rate({"avg_frame_rate": "0/0", "r_frame_rate": "25/1"}) == 25
+    assert _frame_rate({}) is None
+
+
+def probe_output(width=1280, duration="4.5"):
+    video = {"codec_type": "video", "codec_name": "h264", "height": 720}
+    if width is not None:
+        video["width"] = width
+    if duration is not None:
+        video["duration"] = duration
+    return {"streams": [video], "format": {}}
+
+
+def test_probe(monkeypatch):
+    monkeypatch.setattr(ffmpeg, "probe", lambda path: probe_output())
+    assert probe("clip.mp4") == INFO._replace(fps=None)
+
+
+@pytest.mark.parametrize(
+    "output",
+    [
+        probe_output(width=None),
+        probe_output(duration=None),
+        probe_output(duration="N/A"),
+        {"format": {}},
+    ],
+)
+def test_probe_missing_info(monkeypatch, output):
+    monkeypatch.setattr(ffmpeg, "probe", lambda path: output)
+    with pytest.raises(ProbeException):
+        probe("clip.mp4")
+
+
+def test_probe_cached(tmp_path):
+    path, cache_path = write_video(tmp_path)
+    assert probe_cached(path, cache_path) == INFO
+
+
+def test_probe_cached_stale(tmp_path):
+    path, cache_path = write_video(tmp_path)
+    with open(path, "ab") as f:
+        f.write(b"changed")
+    # The file is not a real video, so probing it again fails.
+    with pytest.raises(ProbeException):
+        probe_cached(path, cache_path)
+
+
+def test_video_ref_probe(tmp_path):
+    path, cache_path = write_video(tmp_path)
+    video = VideoRef()
+    assert video.info is None
+    assert video.probe(path, cache_path) == INFO
+    assert video.info == INFO
+    assert video.duration == 4.5
+
+
+if __name__ == "__main__":
+    pytest.main()
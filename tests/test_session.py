@@ -0,0 +1,19 @@
+import pytest
+
+from rvidmaker.session import configure_session, get_session
+
+
+def test_get_session_shared():
+    assert get_session() is get_session()
+
+
+def test_configure_session():
+    old = get_session()
+    configure_session(pool_size=2)
+    new = get_session()
+    assert new is not old
+    assert new.get_adapter("https://v.redd.it")._pool_maxsize == 2
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,39 @@
+from collections import namedtuple
+import pytest
+
+from rvidmaker.sidecar import load_sidecar, store_sidecar
+
+Record = namedtuple("Record", ("a", "b"))
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "file.json")
+    store_sidecar(path, 10, Record(1, "two"))
+    assert load_sidecar(path, 10, Record) == Record(1, "two")
+
+
+def test_changed_size(tmp_path):
+    path = str(tmp_path / "file.json")
+    store_sidecar(path, 10, Record(1, "two"))
+    assert load_sidecar(path, 11, Record) is None
+
+
+def test_missing(tmp_path):
+    assert load_sidecar(str(tmp_path / "file.json"), 10, Record) is None
+
+
+def test_invalid(tmp_path):
+    path = tmp_path / "file.json"
+    path.write_text("{")
+    assert load_sidecar(str(path), 10, Record) is None
+    Other = namedtuple("Other", ("c",))
+    store_sidecar(str(path), 10, Other(1))
+    assert load_sidecar(str(path), 10, Record) is None
+
+
+def test_store_unwritable(tmp_path):
+    store_sidecar(str(tmp_path / "missing" / "file.json"), 10, Record(1, "two"))
+
+
+if __name__ == "__main__":
+    pytest.main()
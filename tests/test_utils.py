@@ -0,0 +1,23 @@
+import pytest
+
+from rvidmaker.utils import select_within_budget
+
+
+def test_select_within_budget():
+    # The two shorter clips are worth more together than the longest alone.
+    assert select_within_budget([30, 20, 15], [100, 60, 50], 35) == [1, 2]
+    assert select_within_budget([30, 20, 15], [100, 60, 50], 65) == [0, 1, 2]
+
+
+def test_select_rounds_weights_up():
+    assert select_within_budget([10.2, 9.5], [5, 4], 21) == [0, 1]
+    assert select_within_budget([10.2, 9.5], [5, 4], 20.5) == [0]
+
+
+def test_select_nothing_fits():
+    assert select_within_budget([30, 40], [10, 20], 20) == []
+    assert select_within_budget([5], [0], 20) == []
+
+
+if __name__ == "__main__":
+    pytest.main()